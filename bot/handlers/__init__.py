@@ -1,3 +1,3 @@
-from . import billing, inventory, customer
+from . import billing, inventory, customer, reports
 
-__all__ = ['billing', 'inventory', 'customer']
\ No newline at end of file
+__all__ = ['billing', 'inventory', 'customer', 'reports']
\ No newline at end of file
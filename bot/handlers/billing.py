@@ -7,12 +7,21 @@ from telegram.ext import (
     CallbackContext,
     CallbackQueryHandler
 )
-from config.settings import Config
 from config.constants import Messages, Buttons
-from database.operations import DBOperations
+from database.operations import DBOperations, InsufficientStockError, DatabaseUnavailableError
+from database.journal import checkout_journal
+from database.reservations import stock_reservations
 from utils.helpers import generate_bill_number, format_currency
-from ..keyboards import create_reply_markup, get_back_button
-from datetime import datetime
+from utils.invoices import generate_invoice
+from ..keyboards import (
+    create_reply_markup,
+    get_back_button,
+    get_category_keyboard,
+    get_product_page_keyboard
+)
+from ..outbox import answer_query, edit_menu
+from ..receipts import render_bill_summary, render_receipt, send_messages
+from decimal import Decimal
 
 # Billing conversation states
 ENTER_NAME, ENTER_PHONE, ADD_ITEMS, CONFIRM_BILL = range(4)
@@ -26,19 +35,27 @@ class BillingHandler:
                 ENTER_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, BillingHandler.get_customer_name)],
                 ENTER_PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, BillingHandler.get_customer_phone)],
                 ADD_ITEMS: [
-                    MessageHandler(filters.Regex("^➕ Add Item$"), BillingHandler.add_item),
+                    MessageHandler(filters.Regex("^➕ Add Item$"), BillingHandler.show_categories),
                     MessageHandler(filters.Regex("^✅ Finish Bill$"), BillingHandler.finish_bill),
-                    CallbackQueryHandler(BillingHandler.handle_product_selection, pattern="^product_")
+                    MessageHandler(filters.Regex(r"^\d+$"), BillingHandler.add_item),
+                    CallbackQueryHandler(
+                        BillingHandler.handle_product_selection,
+                        pattern="^(category_|catpage_|product_|back_to_categories$)"
+                    )
                 ],
                 CONFIRM_BILL: [MessageHandler(filters.TEXT & ~filters.COMMAND, BillingHandler.confirm_bill)]
             },
             fallbacks=[CommandHandler("cancel", BillingHandler.cancel_billing)],
-            allow_reentry=True
+            allow_reentry=True,
+            name="billing",
+            persistent=True
         )
 
     @staticmethod
     async def start_billing(update: Update, context: CallbackContext):
         """Start the billing process"""
+        # Drop holds left over from a bill that was abandoned mid-way
+        stock_reservations.release(update.effective_user.id)
         context.user_data['bill'] = {
             'items': [],
             'total': 0,
@@ -67,70 +84,82 @@ class BillingHandler:
         if phone != "skip":
             context.user_data['bill']['customer_phone'] = phone
         
-        categories = DBOperations.get_categories()
-        keyboard = [
-            [InlineKeyboardButton(cat['category'], callback_data=f"category_{cat['category']}")]
-            for cat in categories
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
+        return await BillingHandler.show_categories(update, context)
+
+    @staticmethod
+    async def show_categories(update: Update, context: CallbackContext):
+        """Show product categories to pick the next item from"""
         await update.message.reply_text(
             "Select a category:",
-            reply_markup=reply_markup
+            reply_markup=await get_category_keyboard()
         )
         return ADD_ITEMS
 
     @staticmethod
     async def handle_product_selection(update: Update, context: CallbackContext):
-        """Handle product selection from inline keyboard"""
+        """Handle category, page and product taps on the inline keyboards"""
         query = update.callback_query
-        await query.answer()
+        await answer_query(query)
         
         if query.data.startswith("category_"):
-            category = query.data.split("_")[1]
-            products = DBOperations.get_products_by_category(category)
-            
-            keyboard = [
-                [InlineKeyboardButton(
-                    f"{prod['name']} ({format_currency(prod['price'])})", 
-                    callback_data=f"product_{prod['id']}"
-                )]
-                for prod in products
-            ]
-            keyboard.append([InlineKeyboardButton(Buttons.BACK, callback_data="back_to_categories")])
-            
-            await query.edit_message_text(
-                f"Products in {category}:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            category = query.data.split("_", 1)[1]
+            context.user_data['category'] = category
+            await BillingHandler.show_product_page(query, category, 0)
+        
+        elif query.data.startswith("catpage_"):
+            category = context.user_data.get('category')
+            if category is not None:
+                await BillingHandler.show_product_page(query, category, int(query.data.split("_")[1]))
         
         elif query.data.startswith("product_"):
             product_id = int(query.data.split("_")[1])
             context.user_data['current_product'] = product_id
-            await query.edit_message_text(
+            await edit_menu(
+                query,
                 "Enter quantity:",
                 reply_markup=None
             )
         
         elif query.data == "back_to_categories":
-            await BillingHandler.get_customer_phone(update, context)
+            await edit_menu(
+                query,
+                "Select a category:",
+                reply_markup=await get_category_keyboard()
+            )
         
         return ADD_ITEMS
 
+    @staticmethod
+    async def show_product_page(query, category, page):
+        """Replace the inline keyboard with one page of a category's products"""
+        markup = await get_product_page_keyboard(category, page)
+        if markup is None:
+            await edit_menu(query, Messages.DB_ERROR)
+            return
+        await edit_menu(
+            query,
+            f"Products in {category} (page {page + 1}):",
+            reply_markup=markup
+        )
+
     @staticmethod
     async def add_item(update: Update, context: CallbackContext):
         """Add item to the bill"""
         try:
             quantity = int(update.message.text)
-            product_id = context.user_data['current_product']
-            product = DBOperations.get_product_details(product_id)
+            product_id = context.user_data.get('current_product')
+            if product_id is None:
+                return await BillingHandler.show_categories(update, context)
+            product = await DBOperations.get_product_details(product_id)
             
             if quantity <= 0:
                 raise ValueError("Quantity must be positive")
             
-            if quantity > product['stock']:
+            owner = update.effective_user.id
+            if not stock_reservations.reserve(owner, product_id, quantity, product['stock']):
+                available = stock_reservations.available(product_id, product['stock'])
                 await update.message.reply_text(
-                    f"Only {product['stock']} available in stock!",
+                    f"Only {max(available, 0)} available in stock!",
                     reply_markup=get_back_button()
                 )
                 return ADD_ITEMS
@@ -143,6 +172,7 @@ class BillingHandler:
                 'total': quantity * product['price']
             }
             
+            context.user_data.pop('current_product', None)
             context.user_data['bill']['items'].append(item)
             context.user_data['bill']['total'] += item['total']
             
@@ -152,8 +182,6 @@ class BillingHandler:
                 reply_markup=create_reply_markup([["➕ Add Item", "✅ Finish Bill"], [Buttons.BACK]])
             )
             
-            DBOperations.update_stock(product_id, quantity)
-            
         except ValueError:
             await update.message.reply_text(
                 "Invalid quantity! Please enter a positive number.",
@@ -174,33 +202,9 @@ class BillingHandler:
             )
             return ADD_ITEMS
         
-        bill_text = f"<b>{Config.COMPANY_NAME} - Bill Summary</b>\n\n"
-        bill_text += f"Customer: {bill.get('customer_name', 'Walk-in')}\n"
-        
-        if 'customer_phone' in bill:
-            bill_text += f"Phone: {bill['customer_phone']}\n"
-        
-        bill_text += "\n<b>Items:</b>\n"
-        for item in bill['items']:
-            bill_text += (
-                f"- {item['quantity']} x {item['name']} "
-                f"@ {format_currency(item['price'])} = "
-                f"{format_currency(item['total'])}\n"
-            )
-        
-        bill_text += f"\n<b>Subtotal:</b> {format_currency(bill['total'])}\n"
-        
-        if bill['discount'] > 0:
-            bill_text += f"<b>Discount:</b> -{format_currency(bill['discount'])}\n"
-            bill_text += f"<b>Total:</b> {format_currency(bill['total'] - bill['discount'])}\n"
-        else:
-            bill_text += f"<b>Total:</b> {format_currency(bill['total'])}\n"
-        
-        bill_text += "\nEnter discount amount (or 0 for none):"
-        
-        await update.message.reply_text(
-            bill_text,
-            parse_mode='HTML',
+        await send_messages(
+            update.message,
+            render_bill_summary(bill),
             reply_markup=create_reply_markup([["0", "50", "100"], [Buttons.CANCEL]])
         )
         return CONFIRM_BILL
@@ -209,49 +213,69 @@ class BillingHandler:
     async def confirm_bill(update: Update, context: CallbackContext):
         """Apply discount and save bill"""
         try:
-            discount = float(update.message.text)
+            discount = Decimal(str(float(update.message.text)))
             if discount < 0:
                 raise ValueError("Discount cannot be negative")
             
             bill = context.user_data['bill']
             bill['discount'] = min(discount, bill['total'])
-            final_total = bill['total'] - bill['discount']
             
-            # Save to database
-            bill_number = generate_bill_number()
-            bill_id = DBOperations.create_bill(
-                customer_name=bill['customer_name'],
-                customer_phone=bill.get('customer_phone'),
-                items=bill['items']
-            )
-            
-            # Generate receipt
-            receipt = (
-                f"<b>{Config.COMPANY_NAME}</b>\n"
-                f"Bill No: {bill_number}\n"
-                f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-            )
+            # Save bill, items and stock changes together
+            bill_number = await generate_bill_number()
+            offline = False
+            try:
+                bill_id = await DBOperations.create_bill(
+                    bill_number=bill_number,
+                    customer_name=bill['customer_name'],
+                    customer_phone=bill.get('customer_phone'),
+                    items=bill['items'],
+                    discount=bill['discount']
+                )
+            except DatabaseUnavailableError:
+                # Keep selling: the bill is saved once the database is back
+                await checkout_journal.append(checkout_journal.entry(
+                    bill_number,
+                    bill['customer_name'],
+                    bill.get('customer_phone'),
+                    bill['items'],
+                    bill['discount']
+                ))
+                bill_id, offline = None, True
+            except InsufficientStockError:
+                await update.message.reply_text(
+                    "Some items are no longer in stock. Please cancel and start a new bill.",
+                    reply_markup=create_reply_markup([[Buttons.CANCEL]])
+                )
+                return CONFIRM_BILL
             
-            for item in bill['items']:
-                receipt += (
-                    f"{item['quantity']} x {item['name']} "
-                    f"@ {format_currency(item['price'])} = "
-                    f"{format_currency(item['total'])}\n"
+            if bill_id is None and not offline:
+                await update.message.reply_text(
+                    Messages.DB_ERROR,
+                    reply_markup=create_reply_markup([["0", "50", "100"], [Buttons.CANCEL]])
                 )
+                return CONFIRM_BILL
             
-            receipt += (
-                f"\nSubtotal: {format_currency(bill['total'])}\n"
-                f"Discount: -{format_currency(bill['discount'])}\n"
-                f"<b>Total: {format_currency(final_total)}</b>\n\n"
-                f"Thank you for shopping with us!"
-            )
+            # Stock is committed now, so the holds are no longer needed
+            stock_reservations.release(update.effective_user.id)
             
-            await update.message.reply_text(
-                receipt,
-                parse_mode='HTML',
+            await send_messages(
+                update.message,
+                render_receipt(bill, bill_number),
                 reply_markup=create_reply_markup(Buttons.MAIN_MENU)
             )
             
+            if offline:
+                await update.message.reply_text(
+                    "⚠️ Database offline: this bill was recorded locally and will be synced automatically."
+                )
+            else:
+                await update.message.reply_text(
+                    "Need a printable copy?",
+                    reply_markup=InlineKeyboardMarkup([[
+                        InlineKeyboardButton("🧾 PDF Invoice", callback_data=f"invoice_{bill_id}")
+                    ]])
+                )
+            
             # Clear bill data
             context.user_data.pop('bill', None)
             
@@ -264,15 +288,29 @@ class BillingHandler:
             )
             return CONFIRM_BILL
 
+    @staticmethod
+    async def send_invoice(update: Update, context: CallbackContext):
+        """Send a saved bill as a PDF document"""
+        query = update.callback_query
+        await answer_query(query)
+        
+        bill = await DBOperations.get_bill(int(query.data.split("_")[1]))
+        if not bill:
+            await query.message.reply_text("Bill not found.")
+            return
+        
+        pdf = await generate_invoice(bill)
+        await query.message.reply_document(
+            document=pdf,
+            filename=f"{bill['bill_number']}.pdf"
+        )
+
     @staticmethod
     async def cancel_billing(update: Update, context: CallbackContext):
         """Cancel the billing process"""
-        if 'bill' in context.user_data:
-            # Restore stock for items already added
-            for item in context.user_data['bill']['items']:
-                DBOperations.update_stock(item['product_id'], -item['quantity'])
-            
-            context.user_data.pop('bill', None)
+        # Stock is only taken when the bill is confirmed; just drop the holds
+        stock_reservations.release(update.effective_user.id)
+        context.user_data.pop('bill', None)
         
         await update.message.reply_text(
             "Bill cancelled.",
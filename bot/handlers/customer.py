@@ -1,15 +1,18 @@
-from telegram import Update
+from html import escape
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ConversationHandler,
     CommandHandler,
     MessageHandler,
     filters,
-    CallbackContext
+    CallbackContext,
+    CallbackQueryHandler
 )
-from config.settings import Config
 from config.constants import Messages, Buttons
 from database.operations import DBOperations
+from utils.helpers import format_currency
 from ..keyboards import create_reply_markup, get_back_button
+from ..outbox import answer_query, edit_menu
 
 # Customer conversation states
 SEARCH_CUSTOMER, VIEW_CUSTOMER = range(2)
@@ -20,14 +23,23 @@ class CustomerHandler:
         return ConversationHandler(
             entry_points=[MessageHandler(filters.Regex("^👤 Customers$"), CustomerHandler.start_customer_search)],
             states={
-                SEARCH_CUSTOMER: [MessageHandler(filters.TEXT & ~filters.COMMAND, CustomerHandler.search_customer)],
+                SEARCH_CUSTOMER: [MessageHandler(
+                    filters.TEXT & ~filters.COMMAND & ~filters.Regex(f"^{Buttons.BACK}$"),
+                    CustomerHandler.search_customer
+                )],
                 VIEW_CUSTOMER: [
                     MessageHandler(filters.Regex("^📝 Edit$"), CustomerHandler.edit_customer),
-                    MessageHandler(filters.Regex("^📊 History$"), CustomerHandler.view_history)
+                    MessageHandler(filters.Regex("^📊 History$"), CustomerHandler.view_history),
+                    CallbackQueryHandler(CustomerHandler.handle_history_page, pattern="^history_")
                 ]
             },
-            fallbacks=[CommandHandler("cancel", CustomerHandler.cancel_customer_search)],
-            allow_reentry=True
+            fallbacks=[
+                CommandHandler("cancel", CustomerHandler.cancel_customer_search),
+                MessageHandler(filters.Regex(f"^{Buttons.BACK}$"), CustomerHandler.cancel_customer_search)
+            ],
+            allow_reentry=True,
+            name="customers",
+            persistent=True
         )
 
     @staticmethod
@@ -46,9 +58,9 @@ class CustomerHandler:
         
         # Try phone first
         if search_term.isdigit() and len(search_term) == 10:
-            customer = DBOperations.get_customer_by_phone(search_term)
+            customer = await DBOperations.get_customer_by_phone(search_term)
         else:
-            customer = DBOperations.search_customer_by_name(search_term)
+            customer = await DBOperations.search_customer_by_name(search_term)
         
         if not customer:
             await update.message.reply_text(
@@ -58,13 +70,17 @@ class CustomerHandler:
             return SEARCH_CUSTOMER
         
         context.user_data['current_customer'] = customer
+        last_purchase = (
+            customer['last_purchase'].strftime('%Y-%m-%d %H:%M') if customer['last_purchase'] else 'Never'
+        )
         
         message = (
             f"<b>Customer Found:</b>\n\n"
-            f"Name: {customer['name']}\n"
+            f"Name: {escape(customer['name'])}\n"
             f"Phone: {customer['phone'] or 'Not provided'}\n"
-            f"Total Spent: {customer['total_spent']}\n"
-            f"Last Purchase: {customer['last_purchase'] or 'Never'}\n\n"
+            f"Visits: {customer['visit_count']}\n"
+            f"Total Spent: {format_currency(customer['total_spent'])}\n"
+            f"Last Purchase: {last_purchase}\n\n"
             f"Select an action:"
         )
         
@@ -91,33 +107,61 @@ class CustomerHandler:
 
     @staticmethod
     async def view_history(update: Update, context: CallbackContext):
-        """View customer purchase history"""
+        """Show the newest page of the customer's purchase history"""
+        context.user_data['history_pages'] = [None]
+        text, markup = await CustomerHandler._history_page(context)
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=markup)
+        return VIEW_CUSTOMER
+
+    @staticmethod
+    async def handle_history_page(update: Update, context: CallbackContext):
+        """Move to the older or newer history page in place"""
+        query = update.callback_query
+        await answer_query(query)
+
+        # Start positions of the pages viewed so far; the last one is on screen
+        pages = context.user_data.setdefault('history_pages', [None])
+        if query.data == "history_older" and context.user_data.get('history_next'):
+            pages.append(context.user_data['history_next'])
+        elif query.data == "history_newer" and len(pages) > 1:
+            pages.pop()
+
+        text, markup = await CustomerHandler._history_page(context)
+        await edit_menu(query, text, parse_mode='HTML', reply_markup=markup)
+        return VIEW_CUSTOMER
+
+    @staticmethod
+    async def _history_page(context):
+        """Render the history page starting at the last saved position"""
         customer = context.user_data['current_customer']
-        history = DBOperations.get_customer_history(customer['id'])
-        
-        if not history:
-            message = "No purchase history found."
-        else:
-            message = f"<b>Purchase History for {customer['name']}:</b>\n\n"
-            for purchase in history:
-                message += (
-                    f"{purchase['date']} - "
-                    f"Bill #{purchase['bill_number']}\n"
-                    f"Items: {purchase['item_count']} - "
-                    f"Total: {purchase['amount']}\n\n"
-                )
-        
-        await update.message.reply_text(
-            message,
-            parse_mode='HTML',
-            reply_markup=create_reply_markup([["📝 Edit", "📊 History"], [Buttons.BACK]])
+        pages = context.user_data['history_pages']
+        rows, has_more = await DBOperations.get_customer_history(customer['id'], pages[-1])
+        if rows is False:
+            return Messages.DB_ERROR, None
+        if not rows:
+            return "No purchase history found.", None
+
+        context.user_data['history_next'] = (rows[-1]['date'], rows[-1]['id']) if has_more else None
+        message = f"<b>Purchase History for {escape(customer['name'])}</b> (page {len(pages)})\n\n"
+        message += "".join(
+            f"{purchase['date']:%Y-%m-%d %H:%M} - Bill #{escape(purchase['bill_number'])}\n"
+            f"Items: {purchase['item_count']} - Total: {format_currency(purchase['amount'])}\n\n"
+            for purchase in rows
         )
-        return VIEW_CUSTOMER
+
+        navigation = []
+        if len(pages) > 1:
+            navigation.append(InlineKeyboardButton("◀️ Newer", callback_data="history_newer"))
+        if has_more:
+            navigation.append(InlineKeyboardButton("Older ▶️", callback_data="history_older"))
+        return message, InlineKeyboardMarkup([navigation]) if navigation else None
 
     @staticmethod
     async def cancel_customer_search(update: Update, context: CallbackContext):
         """Cancel customer search"""
         context.user_data.pop('current_customer', None)
+        context.user_data.pop('history_pages', None)
+        context.user_data.pop('history_next', None)
         
         await update.message.reply_text(
             "Customer search cancelled.",
@@ -7,10 +7,10 @@ from telegram.ext import (
     CallbackContext,
     CallbackQueryHandler
 )
-from config.settings import Config
 from config.constants import Messages, Buttons
 from database.operations import DBOperations
 from ..keyboards import create_reply_markup, get_back_button
+from ..outbox import answer_query, edit_menu
 
 # Inventory conversation states
 SELECT_ACTION, SELECT_PRODUCT, UPDATE_STOCK = range(3)
@@ -24,7 +24,8 @@ class InventoryHandler:
                 SELECT_ACTION: [
                     MessageHandler(filters.Regex("^📥 Add Stock$"), InventoryHandler.add_stock),
                     MessageHandler(filters.Regex("^📤 Remove Stock$"), InventoryHandler.remove_stock),
-                    MessageHandler(filters.Regex("^🔍 View Stock$"), InventoryHandler.view_stock)
+                    MessageHandler(filters.Regex("^🔍 View Stock$"), InventoryHandler.view_stock),
+                    MessageHandler(filters.Regex("^⚠️ Min Stock$"), InventoryHandler.set_min_stock)
                 ],
                 SELECT_PRODUCT: [
                     CallbackQueryHandler(InventoryHandler.handle_product_selection, pattern="^product_"),
@@ -33,7 +34,9 @@ class InventoryHandler:
                 UPDATE_STOCK: [MessageHandler(filters.TEXT & ~filters.COMMAND, InventoryHandler.process_stock_update)]
             },
             fallbacks=[CommandHandler("cancel", InventoryHandler.cancel_inventory)],
-            allow_reentry=True
+            allow_reentry=True,
+            name="inventory",
+            persistent=True
         )
 
     @staticmethod
@@ -41,7 +44,8 @@ class InventoryHandler:
         """Start inventory management"""
         actions = [
             ["📥 Add Stock", "📤 Remove Stock"],
-            ["🔍 View Stock", Buttons.BACK]
+            ["🔍 View Stock", "⚠️ Min Stock"],
+            [Buttons.BACK]
         ]
         await update.message.reply_text(
             "🛒 Inventory Management",
@@ -69,10 +73,23 @@ class InventoryHandler:
         )
         return SELECT_PRODUCT
 
+    @staticmethod
+    async def set_min_stock(update: Update, context: CallbackContext):
+        """Start changing a product's low stock threshold"""
+        context.user_data['inventory_action'] = 'min'
+        await update.message.reply_text(
+            "Search for product by name or scan barcode:",
+            reply_markup=get_back_button()
+        )
+        return SELECT_PRODUCT
+
     @staticmethod
     async def view_stock(update: Update, context: CallbackContext):
         """View product stock"""
-        products = DBOperations.get_low_stock_products()
+        products = await DBOperations.get_low_stock_products()
+        if products is False:
+            await update.message.reply_text(Messages.DB_ERROR)
+            return SELECT_ACTION
         
         if not products:
             await update.message.reply_text(
@@ -100,7 +117,7 @@ class InventoryHandler:
     async def search_product(update: Update, context: CallbackContext):
         """Search for product by name"""
         search_term = update.message.text
-        products = DBOperations.search_products(search_term)
+        products = await DBOperations.search_products(search_term)
         
         if not products:
             await update.message.reply_text(
@@ -128,20 +145,25 @@ class InventoryHandler:
     async def handle_product_selection(update: Update, context: CallbackContext):
         """Handle product selection from inline keyboard"""
         query = update.callback_query
-        await query.answer()
+        await answer_query(query)
         
         if query.data.startswith("product_"):
             product_id = int(query.data.split("_")[1])
-            product = DBOperations.get_product_details(product_id)
+            product = await DBOperations.get_product_details(product_id)
             context.user_data['current_product'] = product
             
             action = context.user_data['inventory_action']
-            action_text = "add to" if action == 'add' else "remove from"
+            if action == 'min':
+                prompt = f"Current minimum: {product['min_stock']}\n\nEnter new minimum stock level:"
+            else:
+                action_text = "add to" if action == 'add' else "remove from"
+                prompt = f"Enter quantity to {action_text} stock:"
             
-            await query.edit_message_text(
+            await edit_menu(
+                query,
                 f"Product: {product['name']}\n"
                 f"Current stock: {product['stock']}\n\n"
-                f"Enter quantity to {action_text} stock:",
+                f"{prompt}",
                 reply_markup=None
             )
             return UPDATE_STOCK
@@ -155,12 +177,27 @@ class InventoryHandler:
         """Process stock update (add/remove)"""
         try:
             quantity = int(update.message.text)
-            if quantity <= 0:
-                raise ValueError("Quantity must be positive")
-            
             product = context.user_data['current_product']
             action = context.user_data['inventory_action']
             
+            if action == 'min':
+                if quantity < 0:
+                    raise ValueError("Minimum stock cannot be negative")
+                if not await DBOperations.set_min_stock(product['id'], quantity):
+                    await update.message.reply_text(
+                        Messages.DB_ERROR,
+                        reply_markup=create_reply_markup(Buttons.MAIN_MENU)
+                    )
+                    return ConversationHandler.END
+                await update.message.reply_text(
+                    f"{product['name']} will be reported as low stock at {quantity} or below.",
+                    reply_markup=create_reply_markup(Buttons.MAIN_MENU)
+                )
+                return ConversationHandler.END
+            
+            if quantity <= 0:
+                raise ValueError("Quantity must be positive")
+            
             if action == 'remove' and quantity > product['stock']:
                 await update.message.reply_text(
                     f"Cannot remove more than current stock ({product['stock']})!",
@@ -170,10 +207,24 @@ class InventoryHandler:
             
             # Update stock in database
             adjustment = quantity if action == 'add' else -quantity
-            DBOperations.update_stock(product['id'], adjustment)
+            if not await DBOperations.adjust_stock(product['id'], adjustment):
+                current = await DBOperations.get_product_details(product['id'])
+                if current is not None and action == 'remove' and quantity > current['stock']:
+                    # Sales since the product was picked left less than asked for
+                    context.user_data['current_product'] = current
+                    await update.message.reply_text(
+                        f"Cannot remove more than current stock ({current['stock']})!",
+                        reply_markup=get_back_button()
+                    )
+                    return UPDATE_STOCK
+                await update.message.reply_text(
+                    Messages.DB_ERROR,
+                    reply_markup=create_reply_markup(Buttons.MAIN_MENU)
+                )
+                return ConversationHandler.END
             
             # Get updated product info
-            updated_product = DBOperations.get_product_details(product['id'])
+            updated_product = await DBOperations.get_product_details(product['id'])
             
             await update.message.reply_text(
                 f"Stock updated successfully!\n"
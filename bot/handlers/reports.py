@@ -0,0 +1,166 @@
+import os
+from datetime import date, timedelta
+from html import escape
+from telegram import Update
+from telegram.ext import (
+    ConversationHandler,
+    CommandHandler,
+    MessageHandler,
+    filters,
+    CallbackContext
+)
+from config.constants import Messages, Buttons
+from database.operations import DBOperations
+from utils.exports import export_sales_async
+from utils.helpers import format_currency
+from ..keyboards import create_reply_markup
+from ..receipts import split_message, send_messages
+
+# Reports conversation states
+SELECT_PERIOD = 0
+
+PERIODS = {
+    "📅 Today": 'today',
+    "🗓️ Last 7 Days": 'week',
+    "📆 This Month": 'month'
+}
+
+EXPORTS = {
+    "📤 Export Excel": 'xlsx',
+    "📤 Export CSV": 'csv'
+}
+
+# Largest document a bot may upload
+UPLOAD_LIMIT = 50 * 1024 * 1024
+
+class ReportsHandler:
+    @staticmethod
+    def create_reports_conversation():
+        return ConversationHandler(
+            entry_points=[MessageHandler(filters.Regex("^📊 Reports$"), ReportsHandler.start_reports)],
+            states={
+                SELECT_PERIOD: [
+                    MessageHandler(
+                        filters.Regex(f"^({'|'.join(PERIODS)})$"),
+                        ReportsHandler.show_report
+                    ),
+                    MessageHandler(
+                        filters.Regex(f"^({'|'.join(EXPORTS)})$"),
+                        ReportsHandler.export_report
+                    )
+                ]
+            },
+            fallbacks=[
+                CommandHandler("cancel", ReportsHandler.cancel_reports),
+                MessageHandler(filters.Regex(f"^{Buttons.BACK}$"), ReportsHandler.cancel_reports)
+            ],
+            allow_reentry=True,
+            name="reports",
+            persistent=True
+        )
+
+    @staticmethod
+    async def start_reports(update: Update, context: CallbackContext):
+        """Ask which period to report on"""
+        await update.message.reply_text(
+            "📊 Sales Reports\n\nSelect a period:",
+            reply_markup=create_reply_markup([list(PERIODS), list(EXPORTS), [Buttons.BACK]])
+        )
+        return SELECT_PERIOD
+
+    @staticmethod
+    def _period_range(period):
+        """(first day, day after the last day, title) for a period"""
+        today = date.today()
+        if period == 'week':
+            return today - timedelta(days=6), today + timedelta(days=1), "Last 7 Days"
+        if period == 'month':
+            return today.replace(day=1), today + timedelta(days=1), f"{today:%B %Y}"
+        return today, today + timedelta(days=1), f"Today ({today:%Y-%m-%d})"
+
+    @staticmethod
+    async def show_report(update: Update, context: CallbackContext):
+        """Send the sales report for the selected period"""
+        period = PERIODS[update.message.text]
+        context.user_data['report_period'] = period
+        start, end, title = ReportsHandler._period_range(period)
+
+        summary = await DBOperations.get_sales_summary(start, end)
+        products = await DBOperations.get_top_products(start, end)
+        categories = await DBOperations.get_category_sales(start, end)
+        hours = await DBOperations.get_hourly_sales(start) if period == 'today' else []
+        if not summary or products is False or categories is False or hours is False:
+            await update.message.reply_text(Messages.DB_ERROR)
+            return SELECT_PERIOD
+
+        parts = [
+            f"<b>Sales Report - {title}</b>\n\n"
+            f"Bills: {summary['bills']}\n"
+            f"Revenue: {format_currency(summary['revenue'])}\n"
+            f"Discounts: {format_currency(summary['discount'])}\n"
+        ]
+        if summary['bills']:
+            parts.append(f"Average bill: {format_currency(summary['revenue'] / summary['bills'])}\n")
+
+        if hours:
+            parts.append("\n<b>By Hour:</b>\n")
+            parts.extend(
+                f"{row['hour']:02d}:00 - {row['bills']} bills, {format_currency(row['revenue'])}\n"
+                for row in hours
+            )
+        if products:
+            parts.append("\n<b>Top Products:</b>\n")
+            parts.extend(
+                f"{i}. {escape(row['name'])} - {row['quantity']} sold, {format_currency(row['revenue'])}\n"
+                for i, row in enumerate(products, start=1)
+            )
+        if categories:
+            parts.append("\n<b>By Category:</b>\n")
+            parts.extend(
+                f"{escape(row['category'])} - {row['quantity']} sold, {format_currency(row['revenue'])}\n"
+                for row in categories
+            )
+
+        await send_messages(update.message, split_message(parts))
+        return SELECT_PERIOD
+
+    @staticmethod
+    async def export_report(update: Update, context: CallbackContext):
+        """Send the line items of the last viewed period (default: today) as a file"""
+        fmt = EXPORTS[update.message.text]
+        start, end, title = ReportsHandler._period_range(context.user_data.get('report_period', 'today'))
+        await update.message.reply_text(f"Preparing export for {title}...")
+
+        result = await export_sales_async(start, end, fmt)
+        if result is None:
+            await update.message.reply_text(Messages.DB_ERROR)
+            return SELECT_PERIOD
+
+        path, rows, filename = result
+        try:
+            if rows == 0:
+                await update.message.reply_text("No sales in this period.")
+            elif os.path.getsize(path) > UPLOAD_LIMIT:
+                await update.message.reply_text(
+                    f"The export has {rows:,} rows and is too large for Telegram. "
+                    f"Run 'python -m utils.exports {start} {end - timedelta(days=1)} --format {fmt}' on the server."
+                )
+            else:
+                with open(path, 'rb') as f:
+                    await update.message.reply_document(
+                        document=f,
+                        filename=filename,
+                        caption=f"Sales {title}: {rows:,} line items"
+                    )
+        finally:
+            os.remove(path)
+        return SELECT_PERIOD
+
+    @staticmethod
+    async def cancel_reports(update: Update, context: CallbackContext):
+        """Leave the reports menu"""
+        await update.message.reply_text(
+            Messages.MENU_PROMPT,
+            reply_markup=create_reply_markup(Buttons.MAIN_MENU)
+        )
+        return ConversationHandler.END
@@ -1,5 +1,9 @@
-from telegram import ReplyKeyboardMarkup, KeyboardButton
+from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from config.settings import Config
 from config.constants import Buttons
+from database.cache import catalog_cache
+from database.operations import DBOperations
+from utils.helpers import format_currency
 
 def create_reply_markup(button_rows, resize=True, one_time=False):
     """
@@ -35,4 +39,62 @@ def create_inline_keyboard(button_rows):
 
 def get_back_button():
     """Return a back button keyboard"""
-    return create_reply_markup([[Buttons.BACK]])
\ No newline at end of file
+    return create_reply_markup([[Buttons.BACK]])
+
+async def get_category_keyboard():
+    """Inline keyboard listing every product category"""
+    categories = await DBOperations.get_categories() or []
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(cat['category'], callback_data=f"category_{cat['category']}")]
+        for cat in categories
+    ])
+
+async def get_product_page_keyboard(category, page):
+    """
+    Inline keyboard for one page of a category's products
+
+    Pages are fetched with keyset pagination and the rendered keyboards are kept
+    in the catalog cache, so they are dropped whenever the catalog is invalidated.
+    Reaching page N walks any pages before it that are not cached yet.
+    """
+    markup = None
+    after = None
+    for number in range(page + 1):
+        key = ('product_page', category, number)
+        cached = catalog_cache.get(key)
+        if cached is None:
+            rows, has_more = await DBOperations.get_product_page(
+                category, after, Config.PRODUCT_PAGE_SIZE
+            )
+            if rows is False:
+                return None
+            cached = (
+                _build_product_page(rows, number, has_more),
+                (rows[-1]['name'], rows[-1]['id']) if has_more else None
+            )
+            catalog_cache.set(key, cached)
+
+        markup, after = cached
+        if after is None:
+            break
+    return markup
+
+def _build_product_page(rows, page, has_more):
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{prod['name']} ({format_currency(prod['price'])})",
+            callback_data=f"product_{prod['id']}"
+        )]
+        for prod in rows
+    ]
+
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️ Prev", callback_data=f"catpage_{page - 1}"))
+    if has_more:
+        navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f"catpage_{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    keyboard.append([InlineKeyboardButton(Buttons.BACK, callback_data="back_to_categories")])
+    return InlineKeyboardMarkup(keyboard)
@@ -1,23 +1,35 @@
 import asyncio
 import logging
+from html import escape
 from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     filters,
-    ConversationHandler,
     CallbackQueryHandler
 )
 
 from config.settings import Config
 from config.constants import Messages, Buttons
+from database.connection import db
+from database.models import DBInitializer
 from database.operations import DBOperations
+from database.reservations import stock_reservations
+from database.low_stock import low_stock_monitor
+from database.journal import checkout_journal
+from utils import metrics
+from utils.invoices import shutdown_pool
 from .keyboards import create_reply_markup
+from .outbox import Outbox
+from .persistence import SQLitePersistence
+from .receipts import split_message
+from .updates import ChatOrderedApplication
 from .handlers import (
     billing,
     inventory,
-    customer
+    customer,
+    reports
 )
 
 # Configure logging
@@ -28,9 +40,101 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class RetailBot:
-    def __init__(self):
-        self.application = Application.builder().token(Config.BOT_TOKEN).build()
+    def __init__(self, request=None):
+        """`request` replaces the HTTP transport to the Bot API (used by utils.loadtest)"""
+        self.outbox = Outbox()
+        builder = (
+            Application.builder()
+            .token(Config.BOT_TOKEN)
+            .application_class(ChatOrderedApplication)
+            .concurrent_updates(Config.CONCURRENT_UPDATES)
+            .rate_limiter(self.outbox)
+            .persistence(SQLitePersistence(Config.STATE_FILE, update_interval=Config.STATE_FLUSH_INTERVAL))
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+            .post_shutdown(self._post_shutdown)
+        )
+        if request is not None:
+            builder = builder.request(request).get_updates_request(request)
+        self.application = builder.build()
+        self.outbox.application = self.application
         self._setup_handlers()
+        metrics.instrument_handlers(self.application)
+        metrics.registry.gauge(
+            'billo_chats_busy', "Chats with an update being handled or waiting",
+            lambda: len(self.application._chat_locks)
+        )
+        metrics.registry.gauge(
+            'billo_outbox_queued', "Bot API calls waiting in the outbox", lambda: self.outbox.queued
+        )
+        self._metrics_server = None
+        # Background tasks started in _post_init
+        self._background = []
+    
+    async def _post_init(self, application):
+        """Create or migrate the schema and warm in-memory indexes before the first update arrives"""
+        await db.run(DBInitializer.initialize_database)
+        if Config.METRICS_PORT:
+            self._metrics_server = metrics.start_server(Config.METRICS_HOST, Config.METRICS_PORT)
+        await DBOperations.refresh_catalog()
+        await DBOperations.load_search_index()
+        await self._restore_holds(application)
+        self._background = [
+            asyncio.create_task(stock_reservations.run_reaper(Config.RESERVATION_REAP_INTERVAL)),
+            asyncio.create_task(
+                low_stock_monitor.run(self._send_low_stock_alert, Config.LOW_STOCK_ALERT_INTERVAL)
+            ),
+            asyncio.create_task(checkout_journal.run_replayer(Config.JOURNAL_REPLAY_INTERVAL)),
+            asyncio.create_task(DBOperations.run_catalog_refresh(Config.CATALOG_REFRESH_INTERVAL))
+        ]
+    
+    async def _restore_holds(self, application):
+        """Hold stock again for open bills restored from the state file"""
+        for user_id, data in application.user_data.items():
+            bill = data.get('bill')
+            if not bill:
+                continue
+            for item in bill['items']:
+                product = await DBOperations.get_product_details(item['product_id'])
+                if product:
+                    # Best effort: the bill is still checked against live stock when saved
+                    stock_reservations.reserve(user_id, item['product_id'], item['quantity'], product['stock'])
+    
+    async def _post_stop(self, application):
+        """
+        Cancel the background tasks started in _post_init and wait until they have unwound
+
+        Runs after the updates stop but before the bot, outbox and persistence shut
+        down, so a task finishing a replay or an alert still has them available.
+        """
+        tasks, self._background = self._background, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _post_shutdown(self, application):
+        """Close what _post_init opened, once nothing uses the database any more"""
+        # Normally done in _post_stop; covers a start that failed before stopping
+        await self._post_stop(application)
+        if self._metrics_server is not None:
+            self._metrics_server.shutdown()
+        shutdown_pool()
+    
+    async def _send_low_stock_alert(self, products):
+        """Send one message listing products that just fell to their minimum stock"""
+        # Bots cannot message a username directly; the admin's chat is recorded on /start
+        chat_id = self.application.bot_data.get('admin_chat_id')
+        if chat_id is None:
+            logger.warning("Low stock alert skipped: %s has not sent /start yet", Config.ADMIN_USERNAME)
+            return
+        
+        parts = ["⚠️ <b>Low Stock Alert</b>\n\n"]
+        parts.extend(
+            f"{escape(product['name'])} - Stock: {product['stock']} (Min: {product['min_stock']})\n"
+            for product in products
+        )
+        for chunk in split_message(parts):
+            await self.application.bot.send_message(chat_id, chunk, parse_mode='HTML')
     
     def _setup_handlers(self):
         # Command handlers
@@ -38,8 +142,15 @@ class RetailBot:
         self.application.add_handler(CommandHandler("help", self.help))
         
         # Conversation handlers
-        self.application.add_handler(billing.create_billing_conversation())
-        self.application.add_handler(inventory.create_inventory_conversation())
+        self.application.add_handler(billing.BillingHandler.create_billing_conversation())
+        self.application.add_handler(inventory.InventoryHandler.create_inventory_conversation())
+        self.application.add_handler(reports.ReportsHandler.create_reports_conversation())
+        self.application.add_handler(customer.CustomerHandler.create_customer_conversation())
+        
+        # Invoice downloads offered after a bill is saved
+        self.application.add_handler(CallbackQueryHandler(
+            billing.BillingHandler.send_invoice, pattern="^invoice_"
+        ))
         
         # Message handlers
         self.application.add_handler(MessageHandler(
@@ -49,6 +160,8 @@ class RetailBot:
     async def start(self, update: Update, context):
         """Send welcome message and main menu"""
         user = update.effective_user
+        if Config.ADMIN_USERNAME and user.username == Config.ADMIN_USERNAME.lstrip('@'):
+            context.bot_data['admin_chat_id'] = update.effective_chat.id
         await update.message.reply_text(
             f"Hi {user.first_name}! {Messages.WELCOME}",
             reply_markup=create_reply_markup(Buttons.MAIN_MENU)
@@ -62,6 +175,7 @@ class RetailBot:
             "• <b>Generate Bill</b> - Create a new customer bill\n"
             "• <b>Inventory</b> - Manage product stock\n"
             "• <b>Reports</b> - View sales reports\n"
+            "• <b>Customers</b> - Look up customers and their purchases\n"
         )
         await update.message.reply_text(help_text, parse_mode='HTML')
     
@@ -70,9 +184,9 @@ class RetailBot:
         text = update.message.text
         
         if text == "💰 Generate Bill":
-            await billing.start_billing(update, context)
+            await billing.BillingHandler.start_billing(update, context)
         elif text == "📦 Inventory":
-            await inventory.start_inventory(update, context)
+            await inventory.InventoryHandler.start_inventory(update, context)
         elif text == Buttons.BACK:
             await self.start(update, context)
         else:
@@ -80,10 +194,24 @@ class RetailBot:
 
 def main():
     """Run the bot"""
+    if Config.BOT_MODE == 'webhook' and not Config.WEBHOOK_URL:
+        raise ValueError("BOT_MODE=webhook needs WEBHOOK_URL, the public https:// address Telegram posts updates to")
     bot = RetailBot()
     
     # Start the Bot
-    bot.application.run_polling()
+    if Config.BOT_MODE == 'webhook':
+        bot.application.run_webhook(
+            listen=Config.WEBHOOK_LISTEN,
+            port=Config.WEBHOOK_PORT,
+            url_path=Config.WEBHOOK_PATH,
+            webhook_url=f"{Config.WEBHOOK_URL.rstrip('/')}/{Config.WEBHOOK_PATH}",
+            secret_token=Config.WEBHOOK_SECRET
+        )
+    else:
+        bot.application.run_polling()
+    
+    # Release pooled database connections
+    db.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
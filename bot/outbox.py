@@ -0,0 +1,408 @@
+"""
+Outbound queue for Bot API calls
+
+Plugged in as the Application's rate limiter, so every call a handler makes
+(reply_text, edit_message_text, answer, ...) passes through Outbox.process_request.
+Calls that carry a chat_id go to that chat's lane and are sent strictly in
+order, one at a time, within a global and a per-chat token bucket (Telegram
+allows about 30 messages/s overall, 1/s per chat and 20/min per group).
+
+By default the caller waits for its turn and gets the real result back, so
+reply_text still returns the Message and BadRequest/Forbidden reach the handler
+(and from there the application's error handlers) as usual. Messages, edits,
+deletes and callback answers can instead be queued without waiting by passing
+rate_limit_args={'queue': True} to the bot method: the caller gets True back at
+once, and a delivery failure is passed to Application.process_error since there
+is no caller left to raise it in. The Message/CallbackQuery shortcuts do not take
+rate_limit_args, so the menu handlers use answer_query and edit_menu below.
+Calls outside the lanes (getMe, setWebhook, ...) pass straight through.
+
+A queued edit behind another unsent queued edit of the same message replaces
+it, so a cashier paging quickly through a menu costs one API call rather than
+one per tap. Calls somebody is waiting for are never replaced.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from config.settings import Config
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# May be queued without waiting (rate_limit_args={'queue': True}); True is returned before they are sent
+FIRE_AND_FORGET = frozenset({
+    'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption',
+    'deleteMessage', 'sendChatAction', 'answerCallbackQuery'
+})
+# Other calls that go through their chat's lane when they have a chat_id; always awaited
+QUEUED = frozenset({
+    'sendDocument', 'sendPhoto', 'sendMediaGroup', 'forwardMessage', 'copyMessage',
+    'editMessageMedia', 'pinChatMessage', 'unpinChatMessage'
+})
+# A queued edit of these methods is replaced by a later edit (the key) of the same message;
+# editMessageText without reply_markup drops the keyboard, so it also supersedes markup edits
+SUPERSEDES = {
+    'editMessageText': frozenset({'editMessageText', 'editMessageReplyMarkup'}),
+    'editMessageCaption': frozenset({'editMessageCaption', 'editMessageReplyMarkup'}),
+    'editMessageReplyMarkup': frozenset({'editMessageReplyMarkup'})
+}
+# A timed-out send may still have been delivered; only these are safe to repeat
+IDEMPOTENT = frozenset({
+    'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption', 'deleteMessage', 'sendChatAction'
+})
+MAX_BACKOFF = 30
+# rate_limit_args for a call the caller does not wait for
+QUEUE = {'queue': True}
+
+sent_total = metrics.registry.counter(
+    'billo_outbox_sent_total', "Bot API calls delivered by the outbox", ('method',)
+)
+failed_total = metrics.registry.counter(
+    'billo_outbox_failed_total', "Bot API calls dropped after an error", ('method',)
+)
+coalesced_total = metrics.registry.counter(
+    'billo_outbox_coalesced_total', "Queued edits replaced by a newer edit of the same message"
+)
+retries_total = metrics.registry.counter(
+    'billo_outbox_retries_total', "Bot API calls sent again after flood control or a network error", ('reason',)
+)
+delay_seconds = metrics.registry.histogram(
+    'billo_outbox_delay_seconds', "Time a call waited in the outbox before being sent", ('method',)
+)
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`; a rate of 0 means unlimited"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available"""
+        if not self.rate:
+            return 0
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def full_in(self, now):
+        """Seconds until the bucket is back to `burst`"""
+        if not self.rate:
+            return 0
+        self._refill(now)
+        return (self.burst - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        if self.rate:
+            self.tokens -= 1
+
+class _Call:
+    __slots__ = ('endpoint', 'callback', 'args', 'kwargs', 'message_id', 'future', 'queued', 'attempts')
+
+    def __init__(self, endpoint, callback, args, kwargs, message_id, future):
+        self.endpoint = endpoint
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.message_id = message_id
+        self.future = future
+        self.queued = time.monotonic()
+        self.attempts = 0
+
+class _Lane:
+    """Pending calls for one chat"""
+    __slots__ = ('chat_id', 'calls', 'bucket', 'paused_until', 'busy', 'scheduled', 'idle')
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.calls = deque()
+        self.bucket = bucket
+        self.paused_until = 0
+        # A call of this lane is being sent
+        self.busy = False
+        # The lane is in the ready queue or waiting on a timer
+        self.scheduled = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+class Outbox(BaseRateLimiter):
+    def __init__(self, global_rate=None, chat_rate=None, chat_burst=None, group_per_minute=None, max_retries=None):
+        global_rate = Config.OUTBOX_GLOBAL_RATE if global_rate is None else global_rate
+        self.chat_rate = Config.OUTBOX_CHAT_RATE if chat_rate is None else chat_rate
+        self.chat_burst = Config.OUTBOX_CHAT_BURST if chat_burst is None else chat_burst
+        group_per_minute = Config.OUTBOX_GROUP_PER_MINUTE if group_per_minute is None else group_per_minute
+        self.group_rate = group_per_minute / 60
+        self.max_retries = Config.OUTBOX_MAX_RETRIES if max_retries is None else max_retries
+
+        # Set by RetailBot so failures of queued calls reach the error handlers
+        self.application = None
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_lock = None
+        self._lanes = {}
+        self._ready = deque()
+        self._wakeup = None
+        self._dispatcher = None
+        # Sends in flight and calls without a chat, kept so they are not garbage collected
+        self._tasks = set()
+
+    @property
+    def queued(self):
+        """Calls accepted but not yet delivered"""
+        return sum(len(lane.calls) for lane in self._lanes.values()) + len(self._tasks)
+
+    async def initialize(self):
+        # Called by both the Application and its Updater
+        if self._dispatcher is not None:
+            return
+        self._global_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        """
+        Give queued calls OUTBOX_DRAIN_SECONDS to go out before the HTTP client closes
+
+        The dispatcher and every send in flight are cancelled and awaited however
+        the drain ends (done, timed out, failed or shutdown itself cancelled), so
+        no task outlives the event loop.
+        """
+        if self._dispatcher is None:
+            return
+        try:
+            await asyncio.wait_for(self.drain(), Config.OUTBOX_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox shut down with %d calls unsent", self.queued)
+        finally:
+            tasks = [self._dispatcher, *self._tasks]
+            self._dispatcher = None
+            for task in tasks:
+                task.cancel()
+            # Callers still waiting on unsent calls are released rather than left hanging
+            for lane in self._lanes.values():
+                for call in lane.calls:
+                    self._abandon(call)
+            self._lanes.clear()
+            self._ready.clear()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain(self):
+        """Wait until every accepted call has been delivered or dropped"""
+        while self._lanes or self._tasks:
+            for lane in list(self._lanes.values()):
+                await lane.idle.wait()
+            if self._tasks:
+                await asyncio.wait(list(self._tasks))
+            # Idle lanes linger until their bucket refills
+            if all(lane.idle.is_set() for lane in self._lanes.values()) and not self._tasks:
+                return
+
+    async def flush(self, chat_id):
+        """Wait until calls queued for `chat_id` so far have been delivered or dropped"""
+        lane = self._lanes.get(chat_id)
+        if lane is not None:
+            await lane.idle.wait()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if endpoint not in FIRE_AND_FORGET and (endpoint not in QUEUED or chat_id is None):
+            return await callback(*args, **kwargs)
+
+        queue = endpoint in FIRE_AND_FORGET and bool(rate_limit_args and rate_limit_args.get('queue'))
+        future = None if queue else asyncio.get_running_loop().create_future()
+        call = _Call(endpoint, callback, args, kwargs, data.get('message_id'), future)
+
+        if chat_id is None:
+            # Inline and callback query answers belong to no chat; only the global limit applies
+            self._spawn(self._send_unlaned(call))
+        else:
+            self._enqueue(self._lane(chat_id), call)
+        return True if future is None else await future
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _lane(self, chat_id):
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            # Negative ids are groups and channels, @names are channels
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate, 1) if group else TokenBucket(self.chat_rate, self.chat_burst)
+            lane = self._lanes[chat_id] = _Lane(chat_id, bucket)
+        return lane
+
+    def _enqueue(self, lane, call):
+        tail = lane.calls[-1] if lane.calls else None
+        if (
+            tail is not None and tail.future is None and call.message_id is not None
+            and tail.message_id == call.message_id and tail.endpoint in SUPERSEDES.get(call.endpoint, ())
+        ):
+            lane.calls[-1] = call
+            coalesced_total.inc()
+        else:
+            lane.calls.append(call)
+        lane.idle.clear()
+        self._schedule(lane)
+
+    def _schedule(self, lane):
+        """Put `lane` in the ready queue once its bucket and any flood pause allow"""
+        if lane.busy or lane.scheduled:
+            return
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        if not lane.calls:
+            lane.idle.set()
+            # Keep the bucket until it refills, or a chat could burst again right away
+            loop.call_later(lane.bucket.full_in(now), self._forget, lane)
+            return
+        delay = max(lane.bucket.delay(now), lane.paused_until - now)
+        lane.scheduled = True
+        if delay > 0:
+            loop.call_later(delay, self._resume, lane)
+        else:
+            self._ready.append(lane)
+            self._wakeup.set()
+
+    def _resume(self, lane):
+        lane.scheduled = False
+        self._schedule(lane)
+
+    def _forget(self, lane):
+        if lane.idle.is_set() and self._lanes.get(lane.chat_id) is lane:
+            del self._lanes[lane.chat_id]
+
+    async def _take_global(self):
+        async with self._global_lock:
+            while True:
+                now = time.monotonic()
+                delay = self._global.delay(now)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._global.take(now)
+
+    async def _dispatch(self):
+        """Start the next call of each ready lane in turn, within the global rate"""
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            lane = self._ready.popleft()
+            await self._take_global()
+            lane.scheduled = False
+            lane.bucket.take(time.monotonic())
+            lane.busy = True
+            self._spawn(self._send(lane, lane.calls.popleft()))
+
+    async def _send(self, lane, call):
+        try:
+            retry_in = await self._deliver(call, lane.chat_id)
+        except asyncio.CancelledError:
+            self._abandon(call)
+            raise
+        lane.busy = False
+        if retry_in is not None:
+            lane.paused_until = time.monotonic() + retry_in
+            lane.calls.appendleft(call)
+        self._schedule(lane)
+
+    async def _send_unlaned(self, call):
+        try:
+            while True:
+                await self._take_global()
+                retry_in = await self._deliver(call, None)
+                if retry_in is None:
+                    return
+                await asyncio.sleep(retry_in)
+        except asyncio.CancelledError:
+            self._abandon(call)
+            raise
+
+    @staticmethod
+    def _abandon(call):
+        """Release the caller of a call that shutdown cancelled mid-send"""
+        if call.future is not None and not call.future.done():
+            call.future.cancel()
+
+    async def _deliver(self, call, chat_id):
+        """Make the API call; returns seconds to wait before trying it again, or None when done"""
+        if call.attempts == 0:
+            delay_seconds.observe(time.monotonic() - call.queued, call.endpoint)
+        try:
+            result = await call.callback(*call.args, **call.kwargs)
+        except RetryAfter as e:
+            reason, retry_in, error = 'flood', e.retry_after, e
+        except (BadRequest, Forbidden) as e:
+            self._fail(call, chat_id, e)
+            return None
+        except TimedOut as e:
+            if call.endpoint not in IDEMPOTENT:
+                self._fail(call, chat_id, e)
+                return None
+            reason, retry_in, error = 'network', min(2 ** call.attempts, MAX_BACKOFF), e
+        except NetworkError as e:
+            reason, retry_in, error = 'network', min(2 ** call.attempts, MAX_BACKOFF), e
+        except Exception as e:
+            self._fail(call, chat_id, e)
+            return None
+        else:
+            sent_total.inc(1, call.endpoint)
+            if call.future is not None and not call.future.done():
+                call.future.set_result(result)
+            return None
+
+        call.attempts += 1
+        if call.attempts > self.max_retries:
+            self._fail(call, chat_id, error)
+            return None
+        retries_total.inc(1, reason)
+        return retry_in
+
+    def _fail(self, call, chat_id, error):
+        if call.future is not None:
+            failed_total.inc(1, call.endpoint)
+            if not call.future.done():
+                call.future.set_exception(error)
+            return
+        # Editing a message to the text it already shows is harmless
+        if isinstance(error, BadRequest) and 'not modified' in str(error).lower():
+            return
+        failed_total.inc(1, call.endpoint)
+        logger.warning("%s to chat %s failed after %d attempts: %s", call.endpoint, chat_id, call.attempts + 1, error)
+        if self.application is not None:
+            self._spawn(self.application.process_error(update=None, error=error))
+
+async def answer_query(query):
+    """Acknowledge a callback query without waiting for the Bot API"""
+    await query.get_bot().answer_callback_query(query.id, rate_limit_args=QUEUE)
+
+async def edit_menu(query, text, **kwargs):
+    """
+    Edit the message a callback query came from without waiting for the Bot API
+
+    Taps that arrive before the edit is sent replace it with their own, so
+    paging quickly through a menu only sends the page the cashier stopped on.
+    """
+    message = query.message
+    if message is None:
+        # Inline-mode messages belong to no chat lane
+        await query.edit_message_text(text, **kwargs)
+        return
+    await query.get_bot().edit_message_text(
+        text, chat_id=message.chat_id, message_id=message.message_id, rate_limit_args=QUEUE, **kwargs
+    )
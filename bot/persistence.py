@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+class SQLitePersistence(BasePersistence):
+    """
+    Keeps user, chat and bot data plus conversation states in a local SQLite file
+
+    The Application already hands over changed data in batches every
+    `update_interval` seconds. Each change is pickled straight away, so later
+    edits to the live dict are not picked up by accident, and staged in memory.
+    Everything staged within `write_delay` seconds is then written in a single
+    transaction on a background thread, so no handler ever waits on a disk write.
+    A batch that fails to write is staged again (under anything staged since) and
+    retried after `update_interval` seconds or by flush(), whichever comes first.
+    """
+
+    def __init__(self, filepath, update_interval=60, write_delay=0.5):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval
+        )
+        self.filepath = filepath
+        self.write_delay = write_delay
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._write_task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='billo-state')
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+            conn = sqlite3.connect(self.filepath, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "kind TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "value BLOB NOT NULL, "
+                "PRIMARY KEY (kind, key)"
+                ") WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _load(self, kind):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT key, value FROM state WHERE kind = ?", (kind,)
+            ).fetchall()
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def _write(self, batch):
+        upserts = [(kind, key, value) for (kind, key), value in batch.items() if value is not None]
+        deletes = [(kind, key) for (kind, key), value in batch.items() if value is None]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if upserts:
+                    conn.executemany("INSERT OR REPLACE INTO state (kind, key, value) VALUES (?, ?, ?)", upserts)
+                if deletes:
+                    conn.executemany("DELETE FROM state WHERE kind = ? AND key = ?", deletes)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _stage(self, kind, key, data):
+        self._pending[(kind, key)] = (
+            None if data is None else pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_later(self.write_delay))
+
+    def _restage(self, batch):
+        # Values staged while the batch was being written are newer and win
+        self._pending = {**batch, **self._pending}
+
+    async def _write_later(self, delay):
+        await asyncio.sleep(delay)
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            await self._run(self._write, batch)
+        except asyncio.CancelledError:
+            # flush() writes it again; the executor runs that after the interrupted write
+            self._restage(batch)
+            raise
+        except Exception:
+            self._restage(batch)
+            logger.exception("Saving %d state entries to %s failed; will retry", len(batch), self.filepath)
+            self._write_task = asyncio.create_task(self._write_later(self.update_interval))
+
+    async def get_user_data(self):
+        return {int(key): data for key, data in (await self._run(self._load, 'user')).items()}
+
+    async def get_chat_data(self):
+        return {int(key): data for key, data in (await self._run(self._load, 'chat')).items()}
+
+    async def get_bot_data(self):
+        return (await self._run(self._load, 'bot')).get('bot', {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        states = await self._run(self._load, f"conversation:{name}")
+        return {tuple(json.loads(key)): state for key, state in states.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        self._stage(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._stage('user', str(user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._stage('chat', str(chat_id), data)
+
+    async def update_bot_data(self, data):
+        self._stage('bot', 'bot', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        self._stage('chat', str(chat_id), None)
+
+    async def drop_user_data(self, user_id):
+        self._stage('user', str(user_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Write everything still staged and close the database"""
+        task = self._write_task
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        batch, self._pending = self._pending, {}
+        if batch:
+            await self._run(self._write, batch)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.shutdown(wait=True)
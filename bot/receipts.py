@@ -0,0 +1,145 @@
+from datetime import datetime
+from html import escape
+from config.settings import Config
+
+# Telegram rejects messages longer than this many characters
+MESSAGE_LIMIT = 4096
+
+def _literal(text):
+    """Escape fixed text for use inside an HTML format template"""
+    return escape(text or '').replace('{', '{{').replace('}', '}}')
+
+def _money(field):
+    """Format placeholder rendering `field` as currency"""
+    return f"{_literal(Config.CURRENCY)}{{{field}:,.2f}}"
+
+class ReceiptTemplate:
+    """
+    Header, line-item and footer templates compiled once into str.format calls
+
+    Currency formatting is part of the compiled format strings, so rendering a
+    bill is a single pass with one format call per line.
+    """
+
+    def __init__(self, header, line, footer):
+        self._header = header.format
+        self._line = line.format
+        self._footer = footer.format
+
+    def render(self, items, **fields):
+        """Render the template and return it split into sendable messages"""
+        line = self._line
+        parts = [self._header(**fields)]
+        parts.extend(
+            line(
+                quantity=item['quantity'],
+                name=escape(item['name']),
+                price=item['price'],
+                total=item['total']
+            )
+            for item in items
+        )
+        parts.append(self._footer(**fields))
+        return split_message(parts)
+
+def split_message(parts, limit=MESSAGE_LIMIT):
+    """
+    Join text parts into as few messages as possible, each at most `limit` long
+
+    Messages are only broken between parts or lines, so HTML tags that open and
+    close on the same line are never split.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for part in parts:
+        pieces = [part] if len(part) <= limit else _split_long(part, limit)
+        for piece in pieces:
+            if size + len(piece) > limit and current:
+                chunks.append(''.join(current))
+                current = []
+                size = 0
+            current.append(piece)
+            size += len(piece)
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+def _split_long(text, limit):
+    pieces = []
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            pieces.append(line[:limit])
+            line = line[limit:]
+        pieces.append(line)
+    return pieces
+
+COMPANY = _literal(Config.COMPANY_NAME)
+SUMMARY_HEADER = (
+    f"<b>{COMPANY} - Bill Summary</b>\n\n"
+    "Customer: {customer}\n"
+    "{phone_line}"
+    "\n<b>Items:</b>\n"
+)
+SUMMARY_LINE = f"- {{quantity}} x {{name}} @ {_money('price')} = {_money('total')}\n"
+
+BILL_SUMMARY = ReceiptTemplate(
+    SUMMARY_HEADER,
+    SUMMARY_LINE,
+    f"\n<b>Subtotal:</b> {_money('subtotal')}\n"
+    f"<b>Total:</b> {_money('total')}\n"
+    "\nEnter discount amount (or 0 for none):"
+)
+
+BILL_SUMMARY_DISCOUNTED = ReceiptTemplate(
+    SUMMARY_HEADER,
+    SUMMARY_LINE,
+    f"\n<b>Subtotal:</b> {_money('subtotal')}\n"
+    f"<b>Discount:</b> -{_money('discount')}\n"
+    f"<b>Total:</b> {_money('total')}\n"
+    "\nEnter discount amount (or 0 for none):"
+)
+
+RECEIPT = ReceiptTemplate(
+    f"<b>{COMPANY}</b>\n"
+    "Bill No: {bill_number}\n"
+    "Date: {date}\n\n",
+    f"{{quantity}} x {{name}} @ {_money('price')} = {_money('total')}\n",
+    f"\nSubtotal: {_money('subtotal')}\n"
+    f"Discount: -{_money('discount')}\n"
+    f"<b>Total: {_money('total')}</b>\n\n"
+    "Thank you for shopping with us!"
+)
+
+def render_bill_summary(bill):
+    """Bill summary shown before the discount is entered, as a list of messages"""
+    template = BILL_SUMMARY_DISCOUNTED if bill['discount'] > 0 else BILL_SUMMARY
+    phone = bill.get('customer_phone')
+    return template.render(
+        bill['items'],
+        customer=escape(bill.get('customer_name', 'Walk-in')),
+        phone_line=f"Phone: {escape(phone)}\n" if phone else '',
+        subtotal=bill['total'],
+        discount=bill['discount'],
+        total=bill['total'] - bill['discount']
+    )
+
+def render_receipt(bill, bill_number, date=None):
+    """Final receipt for a saved bill, as a list of messages"""
+    return RECEIPT.render(
+        bill['items'],
+        bill_number=escape(bill_number),
+        date=(date or datetime.now()).strftime('%Y-%m-%d %H:%M'),
+        subtotal=bill['total'],
+        discount=bill['discount'],
+        total=bill['total'] - bill['discount']
+    )
+
+async def send_messages(message, chunks, reply_markup=None, parse_mode='HTML'):
+    """Reply with each chunk in order; the keyboard is attached to the last one"""
+    for i, chunk in enumerate(chunks):
+        await message.reply_text(
+            chunk,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup if i == len(chunks) - 1 else None
+        )
@@ -0,0 +1,66 @@
+import asyncio
+import sys
+import time
+from telegram import Update
+from telegram.ext import Application
+from utils import metrics
+
+chat_wait_seconds = metrics.registry.histogram(
+    'billo_chat_queue_seconds', "Time an update waited behind earlier updates from the same chat"
+)
+
+class ChatOrderedApplication(Application):
+    """
+    Application that handles updates from different chats concurrently while
+    keeping each chat's updates strictly in arrival order
+
+    Build it with ``Application.builder().application_class(ChatOrderedApplication)``
+    and ``concurrent_updates(n)``; `n` bounds how many updates run at once. Updates
+    for the same chat wait on a per-chat lock (asyncio locks wake waiters in FIFO
+    order), so ConversationHandler state transitions never race, and only take
+    one of the `n` slots once it is their turn.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # chat key -> [lock, number of updates holding or waiting for it]
+        self._chat_locks = {}
+        # Application takes a slot of _concurrent_updates_sem before it calls
+        # process_update, so an update queued behind its chat would hold a slot while
+        # idle and one busy chat could stall all others. Slots are taken below instead,
+        # after the chat lock, and the Application's own semaphore never blocks.
+        self._update_slots = asyncio.BoundedSemaphore(self.concurrent_updates or 1)
+        if not hasattr(self, '_concurrent_updates_sem'):
+            raise RuntimeError("Unsupported python-telegram-bot version: no _concurrent_updates_sem")
+        self._concurrent_updates_sem = asyncio.Semaphore(sys.maxsize)
+
+    @staticmethod
+    def _ordering_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def process_update(self, update):
+        key = self._ordering_key(update)
+        if key is None:
+            async with self._update_slots:
+                return await super().process_update(update)
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        queued = time.perf_counter()
+        try:
+            async with entry[0]:
+                chat_wait_seconds.observe(time.perf_counter() - queued)
+                async with self._update_slots:
+                    await super().process_update(update)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
@@ -21,7 +21,8 @@ class Messages:
 class Buttons:
     MAIN_MENU = [
         ["💰 Generate Bill", "📦 Inventory"],
-        ["📊 Reports", "⚙️ Settings"]
+        ["📊 Reports", "👤 Customers"],
+        ["⚙️ Settings"]
     ]
     
     BACK = "🔙 Back"
@@ -4,20 +4,88 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    # Database Configuration
+    # Database Configuration (DB_BACKEND is 'mysql' or 'sqlite')
+    DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
     DB_CONFIG = {
         'host': os.getenv('DB_HOST'),
         'user': os.getenv('DB_USER'),
         'password': os.getenv('DB_PASSWORD'),
         'database': os.getenv('DB_NAME')
     }
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_HEALTHCHECK_INTERVAL = float(os.getenv('DB_HEALTHCHECK_INTERVAL', 30))
+    
+    # Embedded SQLite Configuration (DB_BACKEND=sqlite)
+    SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'billo.sqlite3'))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', 64))
+    SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', 256))
+    
+    # Catalog Cache Configuration
+    CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 300))
+    CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 2048))
+    CATALOG_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', 30))
+    PRODUCT_PAGE_SIZE = int(os.getenv('PRODUCT_PAGE_SIZE', 10))
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 10))
+    
+    # Stock Reservation Configuration (seconds)
+    RESERVATION_TTL = float(os.getenv('RESERVATION_TTL', 900))
+    RESERVATION_REAP_INTERVAL = float(os.getenv('RESERVATION_REAP_INTERVAL', 60))
+    
+    # Offline Checkout Journal Configuration
+    JOURNAL_FILE = os.getenv('JOURNAL_FILE', os.path.join(os.path.dirname(__file__), '..', 'data', 'journal', 'checkouts.jsonl'))
+    JOURNAL_REPLAY_INTERVAL = float(os.getenv('JOURNAL_REPLAY_INTERVAL', 30))
+    
+    # Low Stock Configuration
+    LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', 5))
+    LOW_STOCK_ALERT_INTERVAL = float(os.getenv('LOW_STOCK_ALERT_INTERVAL', 60))
     
     # Telegram Configuration
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')
     
+    # Update Delivery Configuration
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 8))
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    
+    # Outbound Message Configuration (Bot API limits: ~30 messages/s, 1/s per chat, 20/min per group)
+    OUTBOX_GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', 25))
+    OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', 1))
+    OUTBOX_CHAT_BURST = int(os.getenv('OUTBOX_CHAT_BURST', 3))
+    OUTBOX_GROUP_PER_MINUTE = float(os.getenv('OUTBOX_GROUP_PER_MINUTE', 20))
+    OUTBOX_MAX_RETRIES = int(os.getenv('OUTBOX_MAX_RETRIES', 5))
+    OUTBOX_DRAIN_SECONDS = float(os.getenv('OUTBOX_DRAIN_SECONDS', 10))
+    
+    # Conversation State Configuration (seconds)
+    STATE_FILE = os.getenv('STATE_FILE', os.path.join(os.path.dirname(__file__), '..', 'data', 'bot_state.sqlite3'))
+    STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', 5))
+    
+    # Metrics Configuration (METRICS_PORT=0 disables the endpoint)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+    SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', 0.25))
+    
     # Business Configuration
     COMPANY_NAME = os.getenv('COMPANY_NAME')
     BILL_PREFIX = os.getenv('BILL_PREFIX')
+    BILL_SEQUENCE_BLOCK = int(os.getenv('BILL_SEQUENCE_BLOCK', 20))
     CURRENCY = os.getenv('CURRENCY')
-    DEFAULT_DISCOUNT = float(os.getenv('DEFAULT_DISCOUNT'))
\ No newline at end of file
+    DEFAULT_DISCOUNT = float(os.getenv('DEFAULT_DISCOUNT'))
+    
+    # Invoice Configuration
+    INVOICE_WORKERS = int(os.getenv('INVOICE_WORKERS', os.cpu_count() or 1))
+    INVOICE_FONT = os.getenv('INVOICE_FONT')
+    
+    # Backup Configuration
+    BACKUP_COMPRESSION = os.getenv('BACKUP_COMPRESSION', 'gzip')
+    BACKUP_CHUNK_ROWS = int(os.getenv('BACKUP_CHUNK_ROWS', 500))
+    
+    # Export Configuration
+    EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 5000))
+    EXPORT_COMPRESS_BYTES = int(os.getenv('EXPORT_COMPRESS_BYTES', 5 * 1024 * 1024))
@@ -1,7 +1,8 @@
 # Package initialization
 from .connection import db
+from .cache import catalog_cache
 from .operations import DBOperations
 from .backup import BackupManager
 from .models import DBInitializer
 
-__all__ = ['db', 'DBOperations', 'BackupManager', 'DBInitializer']
\ No newline at end of file
+__all__ = ['db', 'catalog_cache', 'DBOperations', 'BackupManager', 'DBInitializer']
\ No newline at end of file
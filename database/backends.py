@@ -0,0 +1,195 @@
+"""
+Storage backends behind database.connection
+
+DB_BACKEND selects one:
+    mysql   MySQL server through mysql-connector (DB_HOST, DB_USER, ...)
+    sqlite  Embedded SQLite file at SQLITE_PATH, in WAL mode
+
+Both hand out connections with the part of the mysql-connector API this
+package uses (cursor(dictionary=, buffered=), start_transaction, commit,
+rollback, %s placeholders), so a query runs on either as long as it sticks
+to SQL both understand. Statements that cannot (upserts, UPDATE ... JOIN)
+are kept per dialect next to their callers and picked with db.dialect.
+"""
+import functools
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+from config.settings import Config
+
+# MySQL client error codes meaning the server could not be reached or the link dropped
+UNREACHABLE_ERRNOS = {2002, 2003, 2005, 2006, 2013, 2055}
+
+class MySQLBackend:
+    dialect = 'mysql'
+
+    def __init__(self):
+        import mysql.connector
+        from mysql.connector import errors
+
+        self._connector = mysql.connector
+        self.Error = errors.Error
+        self.PoolError = errors.PoolError
+        # Errors after which a connection is closed rather than reused
+        self.disconnect_errors = (errors.InterfaceError, errors.OperationalError)
+
+    def connect(self):
+        return self._connector.connect(**Config.DB_CONFIG, autocommit=True)
+
+    def ping(self, conn):
+        conn.ping(reconnect=True, attempts=2, delay=1)
+
+    def is_unreachable(self, error):
+        if isinstance(error, self.PoolError):
+            return True
+        return isinstance(error, self.disconnect_errors) and error.errno in UNREACHABLE_ERRNOS
+
+class SQLitePoolError(sqlite3.OperationalError):
+    """No pooled connection became free in time"""
+
+# Values are stored as ISO text / numbers and read back by declared column type
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+
+@functools.lru_cache(maxsize=1024)
+def _placeholders(query):
+    """Rewrite mysql-connector's %s / %% placeholders to sqlite3's ?"""
+    return re.sub(r'%([s%])', lambda match: '?' if match.group(1) == 's' else '%', query)
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def _hour(value):
+    return None if value is None else int(str(value)[11:13])
+
+class SQLiteCursor:
+    """sqlite3 cursor with the mysql-connector cursor interface used in this package"""
+
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        self._cursor.execute(_placeholders(query), params or ())
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(_placeholders(query), seq_params)
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _rows(self, rows):
+        if not self._dictionary:
+            return rows
+        names = self.column_names
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return row if row is None else self._rows([row])[0]
+
+    def fetchall(self):
+        return self._rows(self._cursor.fetchall())
+
+    def fetchmany(self, size=1):
+        return self._rows(self._cursor.fetchmany(size))
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """sqlite3 connection with the mysql-connector connection interface used in this package"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self, dictionary=False, buffered=True):
+        # sqlite3 steps through results lazily, so every cursor is "unbuffered"
+        return SQLiteCursor(self.raw.cursor(), dictionary)
+
+    def start_transaction(self, readonly=False, **options):
+        # IMMEDIATE takes the write lock up front: two writers never deadlock upgrading
+        # from a read lock, the second just waits busy_timeout for the first to commit
+        self.raw.execute("BEGIN" if readonly else "BEGIN IMMEDIATE")
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+class SQLiteBackend:
+    dialect = 'sqlite'
+    Error = sqlite3.Error
+    PoolError = SQLitePoolError
+    disconnect_errors = (sqlite3.InterfaceError, sqlite3.ProgrammingError)
+
+    def __init__(self, path):
+        self.path = path
+
+    def pragmas(self):
+        return (
+            "PRAGMA journal_mode = WAL",
+            # NORMAL only syncs at checkpoints in WAL mode; a crash cannot corrupt the
+            # file, but an OS crash or power loss may drop the last commits (use FULL)
+            f"PRAGMA synchronous = {Config.SQLITE_SYNCHRONOUS}",
+            "PRAGMA foreign_keys = ON",
+            "PRAGMA temp_store = MEMORY",
+            f"PRAGMA cache_size = -{Config.SQLITE_CACHE_MB * 1024}",
+            f"PRAGMA mmap_size = {Config.SQLITE_MMAP_MB * 1024 * 1024}"
+        )
+
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=Config.DB_POOL_TIMEOUT,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False
+        )
+        for pragma in self.pragmas():
+            conn.execute(pragma)
+        # MySQL functions used by the shared queries
+        conn.create_function('NOW', 0, _now)
+        conn.create_function('HOUR', 1, _hour, deterministic=True)
+        conn.create_function('GREATEST', -1, lambda *values: max(values), deterministic=True)
+        return SQLiteConnection(conn)
+
+    def ping(self, conn):
+        pass
+
+    def is_unreachable(self, error):
+        # A local file is always there; only an exhausted pool counts
+        return isinstance(error, SQLitePoolError)
+
+def create_backend(name):
+    if name == 'mysql':
+        return MySQLBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(Config.SQLITE_PATH)
+    raise ValueError(f"Unknown DB_BACKEND {name!r} (expected 'mysql' or 'sqlite')")
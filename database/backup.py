@@ -1,50 +1,385 @@
 import os
+import io
+import sys
+import json
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import time
 import datetime
-from .connection import db
+from decimal import Decimal
+from .connection import db, Error
 from config.settings import Config
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# MySQL string literal escapes
+_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    "'": "\\'",
+    '\0': '\\0',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\x1a': '\\Z'
+})
+
 class BackupManager:
     BACKUP_DIR = os.path.join(os.path.dirname(__file__), '../../data/backups')
-    
+    MANIFEST = os.path.join(BACKUP_DIR, 'manifest.json')
+    EXTENSIONS = {'gzip': '.sql.gz', 'zstd': '.sql.zst', 'none': '.sql'}
+    SQLITE_EXTENSIONS = {'gzip': '.sqlite3.gz', 'zstd': '.sqlite3.zst', 'none': '.sqlite3'}
+
+    # Column each table's incremental delta is taken from. `id` suits append-only
+    # tables; `updated_at` catches edits. Tables not listed are copied whole.
+    # An AUTO_INCREMENT id is handed out before its row commits, so a checkout still
+    # in flight at the snapshot can leave a hole below MAX(id): each backup records
+    # those holes ('gaps') and the next incremental reads them again.
+    WATERMARKS = {
+        'bills': 'id',
+        'bill_items': 'id',
+        'products': 'updated_at'
+    }
+
     @staticmethod
-    def create_backup():
+    def create_backup(incremental=False, compression=None, chunk_rows=None, progress=None):
+        """
+        Stream a consistent snapshot of the database into a compressed SQL dump
+
+        Args:
+            incremental: Only dump rows past the last backup's watermarks
+                (falls back to a full backup when there is no previous one)
+            compression: 'gzip', 'zstd' or 'none' (defaults to Config.BACKUP_COMPRESSION)
+            chunk_rows: Rows fetched and written per multi-row INSERT
+            progress: Callable(table, count, elapsed_seconds, done, unit) called after each
+                chunk; `unit` is 'rows' for MySQL dumps and 'pages' for SQLite copies
+
+        Returns the backup file path, or False if the backup failed.
+        """
+        compression = compression or Config.BACKUP_COMPRESSION
+        chunk_rows = chunk_rows or Config.BACKUP_CHUNK_ROWS
+        progress = progress or BackupManager._print_progress
+
         if not os.path.exists(BackupManager.BACKUP_DIR):
             os.makedirs(BackupManager.BACKUP_DIR)
-        
+
+        manifest = BackupManager.load_manifest()
+        if db.dialect == 'sqlite':
+            return BackupManager._create_sqlite_backup(manifest, compression, progress)
+        parent = manifest['backups'][-1] if incremental and manifest['backups'] else None
+        kind = 'incremental' if parent else 'full'
+
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(BackupManager.BACKUP_DIR, f"backup_{timestamp}.sql")
-        
+        backup_file = os.path.join(
+            BackupManager.BACKUP_DIR,
+            f"backup_{timestamp}_{kind}{BackupManager.EXTENSIONS[compression]}"
+        )
+        watermarks = {}
+        gaps = {}
+
+        started = time.monotonic()
+        total_rows = 0
         try:
-            # Get all tables
-            tables = db.execute_query("SHOW TABLES")
-            
-            with open(backup_file, 'w') as f:
-                for table in tables:
-                    table_name = table[f"Tables_in_{Config.DB_CONFIG['database']}"]
-                    
-                    # Get create table statement
-                    create_table = db.execute_query(f"SHOW CREATE TABLE {table_name}")[0]['Create Table']
-                    f.write(f"{create_table};\n\n")
-                    
-                    # Get table data
-                    rows = db.execute_query(f"SELECT * FROM {table_name}")
-                    if rows:
-                        columns = list(rows[0].keys())
-                        for row in rows:
-                            values = []
-                            for col in columns:
-                                val = row[col]
-                                if val is None:
-                                    values.append("NULL")
-                                elif isinstance(val, (int, float)):
-                                    values.append(str(val))
-                                else:
-                                    values.append(f"'{str(val).replace("'", "''")}'")
-                            
-                            f.write(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(values)});\n")
-                        f.write("\n")
-            
-            return True
+            conn = db.pool.acquire()
+            # A dump that stops midway leaves unread rows on its streaming cursor, which
+            # poison the connection; it only goes back to the pool after a clean run
+            discard = True
+            try:
+                with BackupManager._open_output(backup_file, compression) as f:
+                    # Every table is read from the same point in time without locking writers
+                    conn.start_transaction(
+                        consistent_snapshot=True,
+                        isolation_level='REPEATABLE READ',
+                        readonly=True
+                    )
+                    try:
+                        f.write("SET FOREIGN_KEY_CHECKS=0;\n\n")
+                        cursor = conn.cursor(buffered=True)
+                        cursor.execute("SHOW TABLES")
+                        tables = [row[0] for row in cursor.fetchall()]
+
+                        for table_name in tables:
+                            column = BackupManager.WATERMARKS.get(table_name)
+                            if column:
+                                cursor.execute(f"SELECT MAX(`{column}`) FROM `{table_name}`")
+                                high = cursor.fetchone()[0]
+                                watermarks[table_name] = high if high is None or isinstance(high, int) else str(high)
+                            if column == 'id':
+                                low = parent['watermarks'].get(table_name) if parent else None
+                                gaps[table_name] = BackupManager._id_gaps(conn, table_name, low, high)
+
+                            cursor.execute(f"SHOW CREATE TABLE `{table_name}`")
+                            create_table = cursor.fetchone()[1]
+                            if parent is None:
+                                f.write(f"{create_table};\n\n")
+                                query, params, verb = f"SELECT * FROM `{table_name}`", (), "INSERT INTO"
+                            else:
+                                # Tables created since the parent backup still restore cleanly
+                                f.write(f"{create_table.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1)};\n\n")
+                                query, params = BackupManager._delta_query(
+                                    table_name, column, parent['watermarks'].get(table_name),
+                                    parent.get('gaps', {}).get(table_name, ())
+                                )
+                                verb = "REPLACE INTO"
+
+                            # Generated columns (e.g. products.low_stock) are recomputed on restore
+                            columns = BackupManager._stored_columns(cursor, table_name)
+                            query = query.replace("SELECT *", f"SELECT {columns}", 1)
+                            total_rows += BackupManager._dump_rows(
+                                conn, f, table_name, query, params, verb, chunk_rows, progress
+                            )
+
+                        f.write("SET FOREIGN_KEY_CHECKS=1;\n")
+                        cursor.close()
+                    except BaseException:
+                        try:
+                            conn.rollback()
+                        except Error:
+                            pass
+                        raise
+                    conn.rollback()
+                discard = False
+            finally:
+                db.pool.release(conn, discard)
+
+            manifest['backups'].append({
+                'file': os.path.basename(backup_file),
+                'type': kind,
+                'parent': parent['file'] if parent else None,
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'watermarks': watermarks,
+                'gaps': gaps
+            })
+            BackupManager._save_manifest(manifest)
+
+            elapsed = time.monotonic() - started
+            size_mb = os.path.getsize(backup_file) / (1024 * 1024)
+            print(
+                f"{kind.capitalize()} backup complete: {total_rows} rows, {size_mb:.1f} MB in {elapsed:.1f}s "
+                f"({total_rows / max(elapsed, 1e-6):,.0f} rows/s) -> {backup_file}"
+            )
+            return backup_file
+        except Exception as e:
+            print(f"Backup failed: {e}")
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+            return False
+
+    @staticmethod
+    def _create_sqlite_backup(manifest, compression, progress):
+        """
+        Copy the SQLite database with its online backup API, then compress the copy
+
+        The copy is a consistent snapshot even while the bot keeps writing, and
+        `progress` counts database pages (unit 'pages'). Backups are always full;
+        restore one by decompressing it to SQLITE_PATH while the bot is stopped.
+        """
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_file = os.path.join(
+            BackupManager.BACKUP_DIR,
+            f"backup_{timestamp}_full{BackupManager.SQLITE_EXTENSIONS[compression]}"
+        )
+        fd, snapshot = tempfile.mkstemp(suffix='.sqlite3', dir=BackupManager.BACKUP_DIR)
+        os.close(fd)
+
+        started = time.monotonic()
+        pages = [0]
+
+        def copied(status, remaining, total):
+            pages[0] = total - remaining
+            progress('database', pages[0], time.monotonic() - started, False, 'pages')
+
+        try:
+            with db.connection() as conn:
+                target = sqlite3.connect(snapshot)
+                try:
+                    conn.raw.backup(target, pages=1024, progress=copied)
+                finally:
+                    target.close()
+            progress('database', pages[0], time.monotonic() - started, True, 'pages')
+
+            with open(snapshot, 'rb') as src, BackupManager._open_output(backup_file, compression, binary=True) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            manifest['backups'].append({
+                'file': os.path.basename(backup_file),
+                'type': 'full',
+                'parent': None,
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'watermarks': {}
+            })
+            BackupManager._save_manifest(manifest)
+
+            elapsed = time.monotonic() - started
+            size_mb = os.path.getsize(backup_file) / (1024 * 1024)
+            print(f"SQLite backup complete: {size_mb:.1f} MB in {elapsed:.1f}s -> {backup_file}")
+            return backup_file
         except Exception as e:
             print(f"Backup failed: {e}")
-            return False
\ No newline at end of file
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+            return False
+        finally:
+            os.remove(snapshot)
+
+    @staticmethod
+    def load_manifest():
+        """Read the backup manifest, which lists backups oldest first"""
+        if not os.path.exists(BackupManager.MANIFEST):
+            return {'backups': []}
+        with open(BackupManager.MANIFEST) as f:
+            return json.load(f)
+
+    @staticmethod
+    def get_restore_chain(backup_file=None):
+        """
+        Files to replay, in order, to restore a backup
+
+        Walks parent links from `backup_file` (default: the latest backup) back
+        to its full backup and returns the chain starting with the full one.
+        """
+        backups = {entry['file']: entry for entry in BackupManager.load_manifest()['backups']}
+        if not backups:
+            return []
+
+        name = os.path.basename(backup_file) if backup_file else list(backups)[-1]
+        chain = []
+        while name:
+            chain.append(os.path.join(BackupManager.BACKUP_DIR, name))
+            name = backups[name]['parent']
+        return chain[::-1]
+
+    @staticmethod
+    def _save_manifest(manifest):
+        tmp_file = f"{BackupManager.MANIFEST}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, BackupManager.MANIFEST)
+
+    @staticmethod
+    def _stored_columns(cursor, table_name):
+        """Column list of `table_name` without generated columns, which cannot be inserted"""
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND extra NOT LIKE '%%GENERATED%%' "
+            "ORDER BY ordinal_position",
+            (table_name,)
+        )
+        return ", ".join(f"`{row[0]}`" for row in cursor.fetchall())
+
+    @staticmethod
+    def _delta_query(table_name, column, watermark, gaps=()):
+        """Rows changed since the previous backup's watermark, plus rows missing from its snapshot"""
+        if column is None or watermark is None:
+            return f"SELECT * FROM `{table_name}`", ()
+        # Rows updated within the same second as the old watermark are repeated;
+        # REPLACE INTO makes that harmless
+        operator = '>' if column == 'id' else '>='
+        query = f"SELECT * FROM `{table_name}` WHERE `{column}` {operator} %s"
+        if gaps:
+            query += f" OR `{column}` IN ({', '.join(['%s'] * len(gaps))})"
+        return query, (watermark, *gaps)
+
+    @staticmethod
+    def _id_gaps(conn, table_name, low, high):
+        """
+        Ids in (low, high] that the snapshot does not see
+
+        Each is either a rolled-back insert or a row committed after the snapshot.
+        Only the next incremental looks for them again: transactions are far
+        shorter than the time between backups, so a gap still empty by then was
+        rolled back.
+        """
+        gaps = []
+        if high is None:
+            return gaps
+        expected = (low or 0) + 1
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(
+                f"SELECT `id` FROM `{table_name}` WHERE `id` > %s AND `id` <= %s ORDER BY `id`",
+                (low or 0, high)
+            )
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                for (row_id,) in rows:
+                    gaps.extend(range(expected, row_id))
+                    expected = row_id + 1
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                pass
+        return gaps
+
+    @staticmethod
+    def _dump_rows(conn, f, table_name, query, params, verb, chunk_rows, progress):
+        """Stream query results from an unbuffered cursor as chunked multi-row statements"""
+        started = time.monotonic()
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(query, params)
+            columns = ", ".join(f"`{col}`" for col in cursor.column_names)
+            prefix = f"{verb} `{table_name}` ({columns}) VALUES\n"
+            literal = BackupManager._literal
+
+            rows_written = 0
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                f.write(prefix)
+                f.write(",\n".join(
+                    "(" + ", ".join(map(literal, row)) + ")"
+                    for row in rows
+                ))
+                f.write(";\n")
+                rows_written += len(rows)
+                progress(table_name, rows_written, time.monotonic() - started, False, 'rows')
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                # Unread rows after a failure; create_backup discards the connection
+                pass
+
+        if rows_written:
+            f.write("\n")
+        progress(table_name, rows_written, time.monotonic() - started, True, 'rows')
+        return rows_written
+
+    @staticmethod
+    def _literal(value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, (int, float, Decimal)):
+            return str(value)
+        if isinstance(value, (bytes, bytearray)):
+            return f"0x{value.hex()}" if value else "''"
+        return f"'{str(value).translate(_ESCAPES)}'"
+
+    @staticmethod
+    def _open_output(path, compression, binary=False):
+        if compression == 'gzip':
+            return gzip.open(path, 'wb' if binary else 'wt', encoding=None if binary else 'utf-8', compresslevel=6)
+        if compression == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("zstd backups require the 'zstandard' package")
+            writer = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+            return writer if binary else io.TextIOWrapper(writer, encoding='utf-8')
+        return open(path, 'wb') if binary else open(path, 'w', encoding='utf-8')
+
+    @staticmethod
+    def _print_progress(table_name, count, elapsed, done, unit):
+        print(
+            f"  {table_name}: {count} {unit} ({count / max(elapsed, 1e-6):,.0f} {unit}/s)",
+            end="\n" if done else "\r"
+        )
+
+if __name__ == '__main__':
+    BackupManager.create_backup(incremental='--incremental' in sys.argv[1:])
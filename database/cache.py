@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from config.settings import Config
+from utils import metrics
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every invalidation so derived caches can tell they are stale
+        self.generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_load(self, key, loader):
+        """
+        Return the cached value for `key`, awaiting `loader()` on a miss
+
+        Failed loads (False or None) are returned but not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            value = await loader()
+            if value is not None and value is not False:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, *keys, prefixes=()):
+        """
+        Drop the given keys, or everything when called without keys or prefixes
+
+        `prefixes` are tuples; every tuple key that starts with one of them is
+        dropped too (e.g. ('product_page', 'Fruit') for all pages of a category).
+        """
+        with self._lock:
+            if keys or prefixes:
+                for key in keys:
+                    self._data.pop(key, None)
+                for prefix in prefixes:
+                    size = len(prefix)
+                    for key in [k for k in self._data if isinstance(k, tuple) and k[:size] == prefix]:
+                        del self._data[key]
+            else:
+                self._data.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Catalog cache shared by DBOperations (categories, category listings, product details)
+catalog_cache = TTLCache(Config.CATALOG_CACHE_SIZE, Config.CATALOG_CACHE_TTL)
+
+metrics.registry.gauge('billo_catalog_cache_entries', "Entries in the catalog cache", lambda: len(catalog_cache._data))
+metrics.registry.counter_function(
+    'billo_catalog_cache_hits_total', "Catalog lookups answered from the cache", lambda: catalog_cache.hits
+)
+metrics.registry.counter_function(
+    'billo_catalog_cache_misses_total', "Catalog lookups that went to the database", lambda: catalog_cache.misses
+)
+metrics.registry.counter_function(
+    'billo_catalog_cache_evictions_total', "Catalog entries dropped to stay within CATALOG_CACHE_SIZE",
+    lambda: catalog_cache.evictions
+)
+metrics.registry.gauge(
+    'billo_catalog_cache_hit_ratio', "Share of catalog lookups answered from the cache",
+    lambda: catalog_cache.stats()['hit_rate']
+)
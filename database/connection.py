@@ -1,47 +1,211 @@
-import mysql.connector
-from mysql.connector import Error
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 from config.settings import Config
+from utils import metrics
+from .backends import create_backend
+
+logger = logging.getLogger(__name__)
+
+# Storage engine selected by Config.DB_BACKEND
+backend = create_backend(Config.DB_BACKEND)
+
+# Base class of every error the selected backend raises
+Error = backend.Error
+
+def is_unreachable(error):
+    """True if `error` means the database was unavailable rather than that a statement failed"""
+    return backend.is_unreachable(error)
+
+class ConnectionPool:
+    """Bounded pool of database connections with idle-time health checks"""
+
+    def __init__(self, size, timeout, healthcheck_interval):
+        self.size = size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        # Gauges only; updated under the lock, read without it
+        self._counts_lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+
+    def _connect(self):
+        return backend.connect()
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for a free slot"""
+        self._count(waiting=1)
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            self._count(waiting=-1)
+        if not acquired:
+            raise backend.PoolError("Failed getting connection; pool exhausted")
+        try:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            else:
+                # Only ping connections that sat idle long enough to have been dropped
+                if time.monotonic() - last_used > self.healthcheck_interval:
+                    backend.ping(conn)
+        except Exception:
+            self._slots.release()
+            raise
+        self._count(in_use=1)
+        return conn
+
+    def _count(self, in_use=0, waiting=0):
+        with self._counts_lock:
+            self.in_use += in_use
+            self.waiting += waiting
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or drop it if it is broken"""
+        if discard:
+            try:
+                conn.close()
+            except Error:
+                pass
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._count(in_use=-1)
+        self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Error:
+                pass
 
 class DatabaseConnection:
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance._create_connection()
+            # 'mysql' or 'sqlite'; picks between per-dialect statements
+            cls._instance.dialect = backend.dialect
+            cls._instance.pool = ConnectionPool(
+                Config.DB_POOL_SIZE,
+                Config.DB_POOL_TIMEOUT,
+                Config.DB_HEALTHCHECK_INTERVAL
+            )
+            # One worker per pooled connection so queued calls wait for a free worker,
+            # not for a connection while holding a thread
+            cls._instance._executor = ThreadPoolExecutor(
+                max_workers=Config.DB_POOL_SIZE,
+                thread_name_prefix='billo-db'
+            )
         return cls._instance
-    
-    def _create_connection(self):
+
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection for the duration of the block"""
+        conn = self.pool.acquire()
+        discard = False
         try:
-            self.connection = mysql.connector.connect(
-                **Config.DB_CONFIG,
-                autocommit=True
-            )
-            self.cursor = self.connection.cursor(dictionary=True)
-        except Error as e:
-            print(f"Error connecting to MySQL: {e}")
+            yield conn
+        except backend.disconnect_errors:
+            discard = True
             raise
-    
-    def get_cursor(self):
-        if not self.connection.is_connected():
-            self._create_connection()
-        return self.cursor
-    
+        finally:
+            self.pool.release(conn, discard)
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        """Per-call dictionary cursor on a pooled connection"""
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True, **kwargs)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """Cursor whose statements are committed together, or rolled back on error"""
+        with self.connection() as conn:
+            conn.start_transaction()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
     def execute_query(self, query, params=None):
         try:
-            cursor = self.get_cursor()
-            cursor.execute(query, params or ())
-            if query.strip().lower().startswith('select'):
-                return cursor.fetchall()
-            return True
+            with self.cursor() as cursor:
+                started = time.perf_counter()
+                cursor.execute(query, params or ())
+                if cursor.with_rows:
+                    result = cursor.fetchall()
+                    rows = len(result)
+                else:
+                    result = True
+                    rows = max(cursor.rowcount, 0)
+                metrics.record_query(query, time.perf_counter() - started, rows)
+                return result
         except Error as e:
-            print(f"Database error: {e}")
+            metrics.db_query_errors.inc(1, metrics.statement_label(query))
+            logger.error("Database error in %s: %s", metrics.statement_label(query), e)
             return False
-    
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking database function on the pool's worker threads"""
+        loop = asyncio.get_running_loop()
+        name = getattr(func, '__qualname__', repr(func))
+        queued = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.record_call(name, started - queued, time.perf_counter() - started)
+
+        return await loop.run_in_executor(self._executor, timed)
+
+    async def execute(self, query, params=None):
+        """Awaitable version of execute_query"""
+        return await self.run(self.execute_query, query, params)
+
     def close(self):
-        if self.connection.is_connected():
-            self.cursor.close()
-            self.connection.close()
+        self._executor.shutdown(wait=True)
+        self.pool.close_all()
 
 # Singleton instance
-db = DatabaseConnection()
\ No newline at end of file
+db = DatabaseConnection()
+
+metrics.registry.gauge('billo_db_pool_size', "Connections the pool may open", lambda: db.pool.size)
+metrics.registry.gauge('billo_db_pool_in_use', "Connections checked out", lambda: db.pool.in_use)
+metrics.registry.gauge('billo_db_pool_idle', "Open connections waiting in the pool", lambda: db.pool.idle)
+metrics.registry.gauge('billo_db_pool_waiting', "Threads waiting for a free connection", lambda: db.pool.waiting)
+metrics.registry.gauge(
+    'billo_db_queue_depth', "Database calls waiting for a worker thread",
+    lambda: db._executor._work_queue.qsize()
+)
@@ -0,0 +1,115 @@
+"""
+Customers and their running purchase totals
+
+Usage (recompute every customer from the bills table):
+    python -m database.customers
+
+Customers are keyed by phone number; bills saved without a phone stay
+anonymous. total_spent, visit_count and last_purchase are kept on the
+customer row and bumped by Customers.record_purchase inside the bill's own
+transaction, so looking a customer up never aggregates bills. The backfill
+recomputes them from scratch and links old bills to their customers.
+"""
+import time
+
+from .connection import db
+
+# Adds one purchase and yields the customer id: MySQL through LAST_INSERT_ID(id) and
+# lastrowid, SQLite through RETURNING (its lastrowid is not set when a row is updated)
+RECORD_PURCHASE = {
+    'mysql': (
+        "INSERT INTO customers (phone, name, total_spent, visit_count, last_purchase) "
+        "VALUES (%s, %s, %s, 1, COALESCE(%s, NOW())) "
+        "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), name = VALUES(name), "
+        "total_spent = customers.total_spent + VALUES(total_spent), "
+        "visit_count = customers.visit_count + 1, "
+        "last_purchase = GREATEST(COALESCE(customers.last_purchase, VALUES(last_purchase)), VALUES(last_purchase))"
+    ),
+    'sqlite': (
+        "INSERT INTO customers (phone, name, total_spent, visit_count, last_purchase) "
+        "VALUES (%s, %s, %s, 1, COALESCE(%s, NOW())) "
+        "ON CONFLICT (phone) DO UPDATE SET name = excluded.name, "
+        "total_spent = customers.total_spent + excluded.total_spent, "
+        "visit_count = customers.visit_count + 1, "
+        "last_purchase = GREATEST(COALESCE(customers.last_purchase, excluded.last_purchase), excluded.last_purchase) "
+        "RETURNING id"
+    )
+}
+
+BACKFILL = {
+    'mysql': (
+        """
+        INSERT INTO customers (phone, name, total_spent, visit_count, last_purchase)
+        SELECT agg.phone, latest.customer_name, agg.total_spent, agg.visit_count, agg.last_purchase
+        FROM (
+            SELECT customer_phone AS phone, SUM(total_amount) AS total_spent, COUNT(*) AS visit_count,
+                   MAX(created_at) AS last_purchase, MAX(id) AS last_bill
+            FROM bills WHERE customer_phone IS NOT NULL AND customer_phone <> ''
+            GROUP BY customer_phone
+        ) agg
+        JOIN bills latest ON latest.id = agg.last_bill
+        ON DUPLICATE KEY UPDATE name = VALUES(name), total_spent = VALUES(total_spent),
+            visit_count = VALUES(visit_count), last_purchase = VALUES(last_purchase)
+        """,
+        """
+        UPDATE bills b JOIN customers c ON c.phone = b.customer_phone
+        SET b.customer_id = c.id
+        WHERE b.customer_id IS NULL OR b.customer_id <> c.id
+        """
+    ),
+    'sqlite': (
+        # The WHERE keeps SQLite from reading ON CONFLICT as the join's ON clause
+        """
+        INSERT INTO customers (phone, name, total_spent, visit_count, last_purchase)
+        SELECT agg.phone, latest.customer_name, agg.total_spent, agg.visit_count, agg.last_purchase
+        FROM (
+            SELECT customer_phone AS phone, SUM(total_amount) AS total_spent, COUNT(*) AS visit_count,
+                   MAX(created_at) AS last_purchase, MAX(id) AS last_bill
+            FROM bills WHERE customer_phone IS NOT NULL AND customer_phone <> ''
+            GROUP BY customer_phone
+        ) agg
+        JOIN bills latest ON latest.id = agg.last_bill
+        WHERE 1
+        ON CONFLICT (phone) DO UPDATE SET name = excluded.name, total_spent = excluded.total_spent,
+            visit_count = excluded.visit_count, last_purchase = excluded.last_purchase
+        """,
+        """
+        UPDATE bills SET customer_id = c.id
+        FROM customers c
+        WHERE c.phone = bills.customer_phone AND (bills.customer_id IS NULL OR bills.customer_id <> c.id)
+        """
+    )
+}
+
+class Customers:
+    @staticmethod
+    def record_purchase(cursor, phone, name, amount, purchased_at=None):
+        """Add a bill's amount to its customer (created on first visit); returns the customer id"""
+        cursor.execute(RECORD_PURCHASE[db.dialect], (phone, name, amount, purchased_at))
+        if cursor.with_rows:
+            return cursor.fetchall()[0]['id']
+        return cursor.lastrowid
+
+    @staticmethod
+    def backfill():
+        """Recompute every customer's totals from bills and link bills to customers, atomically"""
+        with db.transaction() as cursor:
+            for query in BACKFILL[db.dialect]:
+                cursor.execute(query)
+
+    @staticmethod
+    def is_stale():
+        """True when bills have phone numbers but no customers exist yet (e.g. right after an upgrade)"""
+        rows = db.execute_query(
+            "SELECT EXISTS(SELECT 1 FROM bills WHERE customer_phone IS NOT NULL) AS has_bills, "
+            "EXISTS(SELECT 1 FROM customers) AS has_customers"
+        )
+        return bool(rows) and bool(rows[0]['has_bills']) and not rows[0]['has_customers']
+
+def main():
+    started = time.monotonic()
+    Customers.backfill()
+    print(f"Backfilled customers in {time.monotonic() - started:.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Local journal of checkouts taken while MySQL was unreachable
+
+Each checkout is one JSON line appended to JOURNAL_FILE. Appends from
+concurrent cashiers are grouped: whatever arrives while a write is in
+progress goes out with the next write, and every write ends with one
+fsync, so a checkout is only confirmed once it is on disk.
+
+The replayer saves journaled bills through DBOperations.create_bill in
+replay mode once the database answers again. Bill numbers are unique, so a
+bill that was already saved (e.g. the connection dropped after COMMIT) is
+skipped, and replaying the same journal twice is harmless.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+from .operations import DBOperations, DatabaseUnavailableError
+from config.settings import Config
+
+logger = logging.getLogger(__name__)
+
+class CheckoutJournal:
+    def __init__(self, path):
+        self.path = path
+        self.rejected_path = f"{path}.rejected"
+        self.sequence_path = f"{path}.seq"
+        self._pending = []
+        self._writer = None
+        # Guards the journal file between appends and the replayer's rewrite
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='billo-journal')
+
+    @staticmethod
+    def entry(bill_number, customer_name, customer_phone, items, discount):
+        """Journal record for a checkout, in the shape create_bill expects"""
+        return {
+            'bill_number': bill_number,
+            'customer_name': customer_name,
+            'customer_phone': customer_phone,
+            'items': [
+                {'product_id': item['product_id'], 'quantity': item['quantity'], 'price': str(item['price'])}
+                for item in items
+            ],
+            'discount': str(discount),
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    async def append(self, entry):
+        """Record a checkout; returns once it has been fsynced"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((json.dumps(entry, separators=(',', ':')) + "\n", future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+        await future
+
+    async def _write_pending(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await loop.run_in_executor(self._executor, self._write, [line for line, _ in batch])
+            except OSError as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+    def _write(self, lines):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def next_offline_number(self):
+        """
+        Next (day, number) for bills numbered while offline
+
+        The counter lives in its own file and only resets when the day changes,
+        so numbers stay unique after the journal itself has been replayed.
+        """
+        day = date.today().strftime("%Y%m%d")
+        with self._lock:
+            last = 0
+            if os.path.exists(self.sequence_path):
+                with open(self.sequence_path) as f:
+                    saved_day, _, value = f.read().partition(' ')
+                if saved_day == day:
+                    last = int(value)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_file = f"{self.sequence_path}.tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(f"{day} {last + 1}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.sequence_path)
+        return day, last + 1
+
+    def _read(self):
+        """Complete journal lines and the byte offset just past them"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return [], 0
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        # A torn last line (crash mid-write) was never confirmed to a cashier
+        end = data.rfind(b"\n") + 1
+        return data[:end].decode('utf-8').splitlines(), end
+
+    def _finish(self, offset, remaining, rejected):
+        """Drop replayed lines, keeping failures and anything appended since the read"""
+        with self._lock:
+            if rejected:
+                with open(self.rejected_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(line + "\n" for line in rejected))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                appended = f.read()
+            tmp_file = f"{self.path}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(''.join(line + "\n" for line in remaining).encode('utf-8'))
+                f.write(appended)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.path)
+
+    async def replay(self):
+        """Save journaled bills in order; returns how many were applied"""
+        loop = asyncio.get_running_loop()
+        lines, offset = await loop.run_in_executor(self._executor, self._read)
+        if not lines:
+            return 0
+
+        applied = 0
+        rejected = []
+        for index, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.error("Unreadable journal line moved to %s", self.rejected_path)
+                rejected.append(line)
+                continue
+            try:
+                bill_id = await DBOperations.create_bill(
+                    bill_number=entry['bill_number'],
+                    customer_name=entry['customer_name'],
+                    customer_phone=entry['customer_phone'],
+                    items=[
+                        dict(item, price=Decimal(item['price'])) for item in entry['items']
+                    ],
+                    discount=Decimal(entry['discount']),
+                    created_at=entry['created_at'],
+                    replay=True
+                )
+            except DatabaseUnavailableError:
+                # Still offline; keep this bill and everything after it
+                remaining = lines[index:]
+                break
+            if bill_id is None:
+                logger.error("Journaled bill %s could not be saved; moved to %s",
+                             entry['bill_number'], self.rejected_path)
+                rejected.append(line)
+            else:
+                applied += 1
+        else:
+            remaining = []
+
+        await loop.run_in_executor(self._executor, self._finish, offset, remaining, rejected)
+        if applied:
+            logger.info("Replayed %d journaled bills", applied)
+        return applied
+
+    async def run_replayer(self, interval):
+        """Replay the journal every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.replay()
+            except Exception as e:
+                logger.error("Journal replay failed: %s", e)
+
+# Checkouts taken while the database was down, shared by the billing handlers
+checkout_journal = CheckoutJournal(Config.JOURNAL_FILE)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import threading
+from .connection import db
+
+logger = logging.getLogger(__name__)
+
+class LowStockMonitor:
+    """
+    Collects products whose stock changed and reports the ones that fell low
+
+    Stock writers call touch() with the product ids they changed; nothing is
+    queried at that point. Every `interval` seconds the monitor reads only
+    the touched products and hands those that are newly at or below their
+    min_stock to `send` as one batch. A product is reported again only after
+    its stock has recovered above the threshold in between.
+    """
+
+    def __init__(self):
+        self._touched = set()
+        self._alerted = set()
+        self._lock = threading.Lock()
+
+    def touch(self, product_ids):
+        """Mark products whose stock just changed"""
+        with self._lock:
+            self._touched.update(product_ids)
+
+    def _check(self, product_ids):
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        return db.execute_query(
+            "SELECT id, name, stock, min_stock FROM products "
+            f"WHERE id IN ({placeholders}) AND low_stock = 1 ORDER BY name",
+            tuple(product_ids)
+        )
+
+    async def check(self):
+        """Return products that became low since the last check"""
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        if not touched:
+            return []
+
+        low = await db.run(self._check, sorted(touched))
+        if low is False:
+            # Try again next round
+            self.touch(touched)
+            return []
+
+        low_ids = {product['id'] for product in low}
+        fresh = [product for product in low if product['id'] not in self._alerted]
+        self._alerted -= touched - low_ids
+        self._alerted |= low_ids
+        return fresh
+
+    async def run(self, send, interval):
+        """Every `interval` seconds, pass newly low products to `send` until cancelled"""
+        # Products already low at startup were reported before the restart
+        current = await db.execute("SELECT id FROM products WHERE low_stock = 1")
+        if current:
+            self._alerted.update(row['id'] for row in current)
+
+        while True:
+            await asyncio.sleep(interval)
+            products = await self.check()
+            if products:
+                try:
+                    await send(products)
+                except Exception as e:
+                    logger.warning("Low stock alert not delivered: %s", e)
+
+# Shared by every stock writer in this process
+low_stock_monitor = LowStockMonitor()
@@ -1,10 +1,131 @@
 from .connection import db
+from .rollups import SalesRollups
+from .customers import Customers
 from config.settings import Config
 
+# Complete schema for SQLite databases, which start out with every migration below applied
+SQLITE_SCHEMA = (
+    f"""
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        code VARCHAR(20) UNIQUE NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        category VARCHAR(50) NOT NULL,
+        description TEXT,
+        price DECIMAL(10, 2) NOT NULL,
+        cost DECIMAL(10, 2) NOT NULL,
+        stock INT NOT NULL DEFAULT 0,
+        min_stock INT NOT NULL DEFAULT {Config.LOW_STOCK_THRESHOLD},
+        low_stock INT GENERATED ALWAYS AS (stock <= min_stock) STORED,
+        created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+        updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    # Stands in for MySQL's ON UPDATE CURRENT_TIMESTAMP (incremental backups read updated_at)
+    """
+    CREATE TRIGGER IF NOT EXISTS products_updated_at AFTER UPDATE ON products
+    WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN
+        UPDATE products SET updated_at = datetime('now', 'localtime') WHERE id = NEW.id;
+    END
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products (low_stock, name)",
+    "CREATE INDEX IF NOT EXISTS idx_products_category_name ON products (category, name, id)",
+    """
+    CREATE TABLE IF NOT EXISTS bills (
+        id INTEGER PRIMARY KEY,
+        bill_number VARCHAR(20) UNIQUE NOT NULL,
+        customer_name VARCHAR(100) NOT NULL,
+        customer_phone VARCHAR(20),
+        customer_id INTEGER,
+        total_amount DECIMAL(12, 2) NOT NULL,
+        discount DECIMAL(10, 2) DEFAULT 0,
+        item_count INT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bills_created_at ON bills (created_at)",
+    """
+    CREATE INDEX IF NOT EXISTS idx_bills_customer_history
+    ON bills (customer_id, created_at, id, bill_number, total_amount, item_count)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customers (
+        id INTEGER PRIMARY KEY,
+        phone VARCHAR(20) UNIQUE NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        total_spent DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        visit_count INT NOT NULL DEFAULT 0,
+        last_purchase TIMESTAMP NULL,
+        created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name)",
+    """
+    CREATE TABLE IF NOT EXISTS bill_items (
+        id INTEGER PRIMARY KEY,
+        bill_id INTEGER NOT NULL REFERENCES bills(id),
+        product_id INTEGER NOT NULL REFERENCES products(id),
+        quantity INT NOT NULL,
+        unit_price DECIMAL(10, 2) NOT NULL
+    )
+    """,
+    # MySQL indexes foreign keys implicitly; SQLite needs them spelled out
+    "CREATE INDEX IF NOT EXISTS idx_bill_items_bill ON bill_items (bill_id)",
+    "CREATE INDEX IF NOT EXISTS idx_bill_items_product ON bill_items (product_id)",
+    """
+    CREATE TABLE IF NOT EXISTS sequences (
+        name VARCHAR(50) PRIMARY KEY,
+        value INT NOT NULL DEFAULT 1
+    )
+    """,
+    "INSERT OR IGNORE INTO sequences (name, value) VALUES ('bill_sequence', 1)"
+)
+
 class DBInitializer:
+    @staticmethod
+    def ensure_index(table, index_name, columns):
+        """Create an index unless it already exists (MySQL has no CREATE INDEX IF NOT EXISTS)"""
+        existing = db.execute_query(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, index_name)
+        )
+        if existing == []:
+            db.execute_query(f"CREATE INDEX {index_name} ON {table} {columns}")
+    
+    @staticmethod
+    def ensure_column(table, column, definition):
+        """Add a column to an existing table unless it is already there; True if it was added"""
+        existing = db.execute_query(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1",
+            (table, column)
+        )
+        if existing == []:
+            return db.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}") is True
+        return False
+    
     @staticmethod
     def initialize_database():
-        # Create tables if they don't exist
+        if db.dialect == 'sqlite':
+            for statement in SQLITE_SCHEMA:
+                db.execute_query(statement)
+        else:
+            DBInitializer.create_mysql_tables()
+        
+        # Pre-aggregated sales for reports, backfilled on first run
+        SalesRollups.create_tables()
+        if SalesRollups.is_stale():
+            SalesRollups.rebuild()
+        
+        # Customer totals for bills saved before customers were tracked
+        if Customers.is_stale():
+            Customers.backfill()
+    
+    @staticmethod
+    def create_mysql_tables():
+        """Create tables if they don't exist and bring older MySQL schemas up to date"""
         db.execute_query("""
         CREATE TABLE IF NOT EXISTS products (
             id INT AUTO_INCREMENT PRIMARY KEY,
@@ -20,6 +141,18 @@ class DBInitializer:
         )
         """)
         
+        # Per-product low stock threshold; low_stock is kept in step by MySQL on every write
+        DBInitializer.ensure_column(
+            'products', 'min_stock', f"INT NOT NULL DEFAULT {Config.LOW_STOCK_THRESHOLD} AFTER stock"
+        )
+        DBInitializer.ensure_column(
+            'products', 'low_stock', 'TINYINT(1) AS (stock <= min_stock) STORED AFTER min_stock'
+        )
+        DBInitializer.ensure_index('products', 'idx_products_low_stock', '(low_stock, name)')
+        
+        # Keyset pagination of category menus walks (category, name, id)
+        DBInitializer.ensure_index('products', 'idx_products_category_name', '(category, name, id)')
+        
         db.execute_query("""
         CREATE TABLE IF NOT EXISTS bills (
             id INT AUTO_INCREMENT PRIMARY KEY,
@@ -32,6 +165,25 @@ class DBInitializer:
         )
         """)
         
+        # Bills with a phone number belong to a customer
+        DBInitializer.ensure_column('bills', 'customer_id', 'INT NULL AFTER customer_phone')
+        
+        db.execute_query("""
+        CREATE TABLE IF NOT EXISTS customers (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            phone VARCHAR(20) UNIQUE NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            total_spent DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            visit_count INT NOT NULL DEFAULT 0,
+            last_purchase TIMESTAMP NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_customers_name (name)
+        )
+        """)
+        
+        # Day and date-range reads (invoices, exports) scan bills by created_at
+        DBInitializer.ensure_index('bills', 'idx_bills_created_at', '(created_at)')
+        
         db.execute_query("""
         CREATE TABLE IF NOT EXISTS bill_items (
             id INT AUTO_INCREMENT PRIMARY KEY,
@@ -56,6 +208,21 @@ class DBInitializer:
         db.execute_query("""
         INSERT IGNORE INTO sequences (name, value) VALUES ('bill_sequence', 1)
         """)
+        
+        # Units per bill, stored when the bill is saved so history pages never join bill_items
+        if DBInitializer.ensure_column('bills', 'item_count', 'INT NOT NULL DEFAULT 0 AFTER discount'):
+            db.execute_query("""
+            UPDATE bills b JOIN (
+                SELECT bill_id, SUM(quantity) AS units FROM bill_items GROUP BY bill_id
+            ) bi ON bi.bill_id = b.id
+            SET b.item_count = bi.units
+            """)
+        
+        # Customer history pages are range scans answered from this index alone
+        DBInitializer.ensure_index(
+            'bills', 'idx_bills_customer_history',
+            '(customer_id, created_at, id, bill_number, total_amount, item_count)'
+        )
 
-# Initialize database on import
-DBInitializer.initialize_database()
\ No newline at end of file
+if __name__ == '__main__':
+    DBInitializer.initialize_database()
\ No newline at end of file
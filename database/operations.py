@@ -1,46 +1,502 @@
-from .connection import db
+import asyncio
+import logging
+from datetime import datetime, time, timedelta
+from .connection import db, is_unreachable, Error
+from .cache import catalog_cache
+from .search import product_index
+from .rollups import SalesRollups
+from .customers import Customers
+from .low_stock import low_stock_monitor
 from config.settings import Config
 
+logger = logging.getLogger(__name__)
+
+# Bumped in the same transaction as catalog writes made outside the bot (utils.import_products),
+# so running bots see committed changes with one primary key lookup
+BUMP_CATALOG_VERSION = {
+    'mysql': (
+        "INSERT INTO sequences (name, value) VALUES ('catalog_version', 1) "
+        "ON DUPLICATE KEY UPDATE value = value + 1"
+    ),
+    'sqlite': (
+        "INSERT INTO sequences (name, value) VALUES ('catalog_version', 1) "
+        "ON CONFLICT (name) DO UPDATE SET value = sequences.value + 1"
+    )
+}
+
+# Replays look the bill number up first; SQLite's BEGIN IMMEDIATE already serializes writers
+BILL_BY_NUMBER = {
+    'mysql': "SELECT id FROM bills WHERE bill_number = %s FOR UPDATE",
+    'sqlite': "SELECT id FROM bills WHERE bill_number = %s"
+}
+
+# Stock decrements for a bill's (id, qty) rows; SQLite has UPDATE ... FROM instead of UPDATE ... JOIN
+TAKE_STOCK = {
+    'mysql': (
+        "UPDATE products p JOIN ({deltas}) d ON p.id = d.id "
+        "SET p.stock = p.stock - d.qty WHERE p.stock >= d.qty"
+    ),
+    'sqlite': (
+        "UPDATE products AS p SET stock = p.stock - d.qty FROM ({deltas}) AS d "
+        "WHERE p.id = d.id AND p.stock >= d.qty"
+    )
+}
+# Replayed bills: the goods already left the shop, so stock bottoms out at zero
+FORCE_TAKE_STOCK = {
+    'mysql': (
+        "UPDATE products p JOIN ({deltas}) d ON p.id = d.id "
+        "SET p.stock = GREATEST(p.stock - d.qty, 0)"
+    ),
+    'sqlite': (
+        "UPDATE products AS p SET stock = GREATEST(p.stock - d.qty, 0) FROM ({deltas}) AS d "
+        "WHERE p.id = d.id"
+    )
+}
+
+class InsufficientStockError(Exception):
+    """Raised when a bill asks for more stock than is left"""
+
+class DatabaseUnavailableError(Exception):
+    """Raised when a bill could not be saved because the database is unreachable"""
+
 class DBOperations:
+    # Last catalog_version seen by refresh_catalog
+    _catalog_version = None
+
     @staticmethod
-    def get_categories():
-        return db.execute_query("SELECT DISTINCT category FROM products ORDER BY category")
-    
+    async def get_categories():
+        return await catalog_cache.get_or_load(
+            ('categories',),
+            lambda: db.execute("SELECT DISTINCT category FROM products ORDER BY category")
+        )
+
     @staticmethod
-    def get_products_by_category(category):
-        return db.execute_query(
-            "SELECT id, name FROM products WHERE category = %s ORDER BY name",
-            (category,)
+    async def get_products_by_category(category):
+        return await catalog_cache.get_or_load(
+            ('category', category),
+            lambda: db.execute(
+                "SELECT id, name, price FROM products WHERE category = %s ORDER BY name",
+                (category,)
+            )
         )
-    
+
+    @staticmethod
+    async def get_product_page(category, after=None, limit=Config.PRODUCT_PAGE_SIZE):
+        """
+        One page of a category's products ordered by (name, id)
+
+        `after` is the (name, id) of the last product on the previous page.
+        Returns (rows, has_more).
+        """
+        if after is None:
+            rows = await db.execute(
+                "SELECT id, name, price FROM products WHERE category = %s "
+                "ORDER BY name, id LIMIT %s",
+                (category, limit + 1)
+            )
+        else:
+            name, product_id = after
+            rows = await db.execute(
+                "SELECT id, name, price FROM products WHERE category = %s "
+                "AND (name > %s OR (name = %s AND id > %s)) "
+                "ORDER BY name, id LIMIT %s",
+                (category, name, name, product_id, limit + 1)
+            )
+        if rows is False:
+            return False, False
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    async def get_product_details(product_id):
+        async def load():
+            rows = await db.execute(
+                "SELECT * FROM products WHERE id = %s",
+                (product_id,)
+            )
+            return rows[0] if rows else None
+
+        return await catalog_cache.get_or_load(('product', product_id), load)
+
+    @staticmethod
+    async def load_search_index():
+        """(Re)build the in-memory product search index from the products table"""
+        rows = await db.execute("SELECT id, code, name, category, price, stock FROM products")
+        if rows is not False:
+            product_index.build(rows)
+        return rows is not False
+
+    @staticmethod
+    async def search_products(search_term, limit=20):
+        """Find products by exact code/barcode or ranked name match"""
+        if not product_index.ready and not await DBOperations.load_search_index():
+            return []
+        return product_index.search(search_term, limit)
+
     @staticmethod
-    def get_product_details(product_id):
-        return db.execute_query(
-            "SELECT * FROM products WHERE id = %s",
-            (product_id,)
+    async def update_stock(product_id, quantity):
+        """Take `quantity` out of stock, unless that would make it negative"""
+        return await DBOperations.adjust_stock(product_id, -quantity)
+
+    @staticmethod
+    async def adjust_stock(product_id, delta):
+        """Add `delta` (negative to remove) to a product's stock, never going below zero"""
+        updated = await db.run(DBOperations._adjust_stock, product_id, delta)
+        catalog_cache.invalidate(('product', product_id))
+        if updated:
+            product_index.adjust_stock(product_id, delta)
+            low_stock_monitor.touch((product_id,))
+        return updated
+
+    @staticmethod
+    async def set_min_stock(product_id, min_stock):
+        """
+        Change the stock level at or below which a product counts as low
+
+        Returns False if the product does not exist or the update failed.
+        """
+        updated = await db.run(DBOperations._set_min_stock, product_id, min_stock)
+        catalog_cache.invalidate(('product', product_id))
+        if updated:
+            low_stock_monitor.touch((product_id,))
+        return updated
+
+    @staticmethod
+    async def get_low_stock_products(limit=50):
+        """Products at or below their min_stock, read from the low_stock index"""
+        return await db.execute(
+            "SELECT id, name, stock, min_stock FROM products "
+            "WHERE low_stock = 1 ORDER BY name LIMIT %s",
+            (limit,)
         )
-    
+
+    @staticmethod
+    def _adjust_stock(product_id, delta):
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE products SET stock = stock + %s WHERE id = %s AND stock + %s >= 0",
+                    (delta, product_id, delta)
+                )
+                return cursor.rowcount > 0
+        except Error as e:
+            logger.error("Database error adjusting stock for product %s: %s", product_id, e)
+            return False
+
+    @staticmethod
+    def _set_min_stock(product_id, min_stock):
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE products SET min_stock = %s WHERE id = %s",
+                    (min_stock, product_id)
+                )
+                if cursor.rowcount > 0:
+                    return True
+                # MySQL only counts rows it changed, and the value may already be set
+                cursor.execute("SELECT 1 FROM products WHERE id = %s", (product_id,))
+                return bool(cursor.fetchall())
+        except Error as e:
+            logger.error("Database error: %s", e)
+            return False
+
+    @staticmethod
+    def invalidate_catalog():
+        """Drop all cached catalog data after products are added, edited or removed"""
+        catalog_cache.invalidate()
+        product_index.invalidate()
+
+    @staticmethod
+    def get_cache_stats():
+        return catalog_cache.stats()
+
+    @staticmethod
+    def bump_catalog_version(cursor):
+        """Tell running bots the catalog changed; call inside the transaction that changed it"""
+        cursor.execute(BUMP_CATALOG_VERSION[db.dialect])
+
+    @staticmethod
+    async def refresh_catalog():
+        """
+        Pick up catalog changes made by another process
+
+        The search index is updated in place (new and edited products upserted,
+        deleted ones removed) and only the cache entries of affected products
+        and categories are dropped. The first call only records the current
+        version. Returns True if the catalog changed since the previous call.
+        """
+        rows = await db.execute("SELECT value FROM sequences WHERE name = 'catalog_version'")
+        if rows is False:
+            return False
+        version = rows[0]['value'] if rows else 0
+        changed = DBOperations._catalog_version is not None and version != DBOperations._catalog_version
+        DBOperations._catalog_version = version
+        if not changed:
+            return False
+
+        synced = await db.run(DBOperations._sync_search_index) if product_index.ready else None
+        if synced is None:
+            DBOperations.invalidate_catalog()
+            return True
+
+        # Only the listings and menu pages the changed products appear in
+        changed_rows, removed = synced
+        keys = set()
+        categories = set()
+        for old, new in changed_rows:
+            keys.add(('product', new['id']))
+            categories.add(new['category'])
+            if old is not None:
+                categories.add(old['category'])
+        for old in removed:
+            keys.add(('product', old['id']))
+            categories.add(old['category'])
+        if changed_rows or removed:
+            keys.add(('categories',))
+        keys.update(('category', category) for category in categories)
+        catalog_cache.invalidate(*keys, prefixes=[('product_page', category) for category in categories])
+        return True
+
     @staticmethod
-    def update_stock(product_id, quantity):
-        return db.execute_query(
-            "UPDATE products SET stock = stock - %s WHERE id = %s AND stock >= %s",
-            (quantity, product_id, quantity)
+    def _sync_search_index():
+        """Apply the products table to the search index in place; None if it could not be read"""
+        rows = db.execute_query("SELECT id, code, name, category, price, stock FROM products")
+        if rows is False:
+            return None
+        return product_index.sync(rows)
+
+    @staticmethod
+    async def run_catalog_refresh(interval):
+        """Check for outside catalog changes every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await DBOperations.refresh_catalog()
+            except Exception as e:
+                logger.error("Catalog refresh failed: %s", e)
+
+    @staticmethod
+    async def create_bill(bill_number, customer_name, customer_phone, items, discount=0,
+                          created_at=None, replay=False):
+        """
+        Save a bill, its items and the stock decrements in one transaction
+
+        Raises DatabaseUnavailableError if the database cannot be reached. With
+        `replay` (bills recorded offline) a bill whose number already exists
+        is not saved again, and stock is taken even if that empties it.
+        """
+        try:
+            bill_id, created = await db.run(
+                DBOperations._create_bill,
+                bill_number, customer_name, customer_phone, items, discount, created_at, replay
+            )
+        finally:
+            catalog_cache.invalidate(*{('product', item['product_id']) for item in items})
+
+        # A replayed bill that was already saved has taken its stock before
+        if created:
+            for item in items:
+                product_index.adjust_stock(item['product_id'], -item['quantity'])
+            low_stock_monitor.touch(item['product_id'] for item in items)
+        return bill_id
+
+    @staticmethod
+    async def get_bill(bill_id):
+        """A saved bill with its items (name, quantity, unit_price)"""
+        bills = await db.run(DBOperations._load_bills, "b.id = %s", (bill_id,))
+        return bills[0] if bills else None
+
+    @staticmethod
+    async def get_bills_by_date(day):
+        """Every bill created on `day` (a date), with items, oldest first"""
+        start = datetime.combine(day, time.min)
+        return await db.run(
+            DBOperations._load_bills,
+            "b.created_at >= %s AND b.created_at < %s",
+            (start, start + timedelta(days=1))
         )
-    
+
     @staticmethod
-    def create_bill(customer_name, customer_phone, items):
-        # First create bill record
-        bill_id = db.execute_query(
-            "INSERT INTO bills (customer_name, customer_phone) VALUES (%s, %s)",
-            (customer_name, customer_phone if customer_phone != 'skip' else None)
+    async def get_sales_summary(start, end):
+        """Bills, revenue and discounts for days in [start, end), read from the daily rollup"""
+        rows = await db.execute(
+            "SELECT COALESCE(SUM(bills), 0) AS bills, COALESCE(SUM(revenue), 0) AS revenue, "
+            "COALESCE(SUM(discount), 0) AS discount "
+            "FROM sales_daily WHERE day >= %s AND day < %s",
+            (start, end)
         )
-        
-        # Then add bill items
-        for item in items:
-            db.execute_query(
-                "INSERT INTO bill_items (bill_id, product_id, quantity, unit_price) "
-                "VALUES (%s, %s, %s, %s)",
-                (bill_id, item['product_id'], item['quantity'], item['price'])
+        return rows[0] if rows else None
+
+    @staticmethod
+    async def get_hourly_sales(day):
+        """Per-hour bills and revenue for `day`"""
+        start = datetime.combine(day, time.min)
+        return await db.execute(
+            "SELECT HOUR(hour) AS hour, bills, revenue FROM sales_hourly "
+            "WHERE hour >= %s AND hour < %s ORDER BY hour",
+            (start, start + timedelta(days=1))
+        )
+
+    @staticmethod
+    async def get_top_products(start, end, limit=5):
+        """Best-selling products by revenue for days in [start, end)"""
+        return await db.execute(
+            "SELECT p.name, SUM(s.quantity) AS quantity, SUM(s.revenue) AS revenue "
+            "FROM sales_by_product s JOIN products p ON p.id = s.product_id "
+            "WHERE s.day >= %s AND s.day < %s "
+            "GROUP BY s.product_id, p.name ORDER BY revenue DESC LIMIT %s",
+            (start, end, limit)
+        )
+
+    @staticmethod
+    async def get_category_sales(start, end):
+        """Quantity and revenue per category for days in [start, end)"""
+        return await db.execute(
+            "SELECT category, SUM(quantity) AS quantity, SUM(revenue) AS revenue "
+            "FROM sales_by_category WHERE day >= %s AND day < %s "
+            "GROUP BY category ORDER BY revenue DESC",
+            (start, end)
+        )
+
+    @staticmethod
+    async def get_customer_by_phone(phone):
+        """Customer with this phone number (unique key lookup), or None"""
+        rows = await db.execute(
+            "SELECT id, name, phone, total_spent, visit_count, last_purchase "
+            "FROM customers WHERE phone = %s",
+            (phone,)
+        )
+        return rows[0] if rows else None
+
+    @staticmethod
+    async def search_customer_by_name(name):
+        """Most frequent customer whose name starts with `name` (indexed prefix match), or None"""
+        # '!' escapes the same way on both backends (SQLite has no default LIKE escape)
+        pattern = name.strip().replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+        rows = await db.execute(
+            "SELECT id, name, phone, total_spent, visit_count, last_purchase "
+            "FROM customers WHERE name LIKE %s ESCAPE '!' ORDER BY visit_count DESC, id LIMIT 1",
+            (pattern,)
+        )
+        return rows[0] if rows else None
+
+    @staticmethod
+    async def get_customer_history(customer_id, before=None, limit=Config.HISTORY_PAGE_SIZE):
+        """
+        One page of a customer's bills, newest first, ordered by (created_at, id)
+
+        `before` is the (created_at, id) of the last bill on the previous page.
+        Returns (rows, has_more); rows is False on a database error.
+        """
+        columns = "SELECT id, created_at AS date, bill_number, item_count, total_amount AS amount FROM bills "
+        if before is None:
+            rows = await db.execute(
+                columns + "WHERE customer_id = %s ORDER BY created_at DESC, id DESC LIMIT %s",
+                (customer_id, limit + 1)
+            )
+        else:
+            created_at, bill_id = before
+            rows = await db.execute(
+                columns + "WHERE customer_id = %s "
+                "AND (created_at < %s OR (created_at = %s AND id < %s)) "
+                "ORDER BY created_at DESC, id DESC LIMIT %s",
+                (customer_id, created_at, created_at, bill_id, limit + 1)
             )
-        
-        return bill_id
\ No newline at end of file
+        if rows is False:
+            return False, False
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    def _load_bills(condition, params):
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(
+                    "SELECT b.id, b.bill_number, b.customer_name, b.customer_phone, "
+                    "b.total_amount, b.discount, b.created_at "
+                    f"FROM bills b WHERE {condition} ORDER BY b.id",
+                    params
+                )
+                bills = cursor.fetchall()
+                by_id = {bill['id']: bill for bill in bills}
+                for bill in bills:
+                    bill['items'] = []
+
+                if bills:
+                    cursor.execute(
+                        "SELECT bi.bill_id, p.name, bi.quantity, bi.unit_price "
+                        "FROM bill_items bi "
+                        "JOIN bills b ON b.id = bi.bill_id "
+                        "JOIN products p ON p.id = bi.product_id "
+                        f"WHERE {condition} ORDER BY bi.id",
+                        params
+                    )
+                    for item in cursor.fetchall():
+                        by_id[item.pop('bill_id')]['items'].append(item)
+                return bills
+        except Error as e:
+            logger.error("Database error loading bills: %s", e)
+            return []
+
+    @staticmethod
+    def _create_bill(bill_number, customer_name, customer_phone, items, discount, created_at, replay):
+        """(bill_id, created); created is False when a replay finds the bill already saved"""
+        subtotal = sum(item['price'] * item['quantity'] for item in items)
+
+        # Repeated lines for the same product become a single decrement
+        quantities = {}
+        for item in items:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+        phone = customer_phone if customer_phone and customer_phone != 'skip' else None
+        total = subtotal - discount
+
+        try:
+            with db.transaction() as cursor:
+                if replay:
+                    # Locks the number, so a concurrent replay of the same bill waits here
+                    cursor.execute(BILL_BY_NUMBER[db.dialect], (bill_number,))
+                    existing = cursor.fetchall()
+                    if existing:
+                        return existing[0]['id'], False
+
+                customer_id = (
+                    Customers.record_purchase(cursor, phone, customer_name, total, created_at)
+                    if phone else None
+                )
+                cursor.execute(
+                    "INSERT INTO bills (bill_number, customer_name, customer_phone, customer_id, "
+                    "total_amount, discount, item_count, created_at) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, NOW()))",
+                    (
+                        bill_number, customer_name, phone, customer_id, total, discount,
+                        sum(quantities.values()), created_at
+                    )
+                )
+                bill_id = cursor.lastrowid
+
+                rows = ", ".join(["(%s, %s, %s, %s)"] * len(items))
+                cursor.execute(
+                    f"INSERT INTO bill_items (bill_id, product_id, quantity, unit_price) VALUES {rows}",
+                    [
+                        value
+                        for item in items
+                        for value in (bill_id, item['product_id'], item['quantity'], item['price'])
+                    ]
+                )
+
+                deltas = " UNION ALL ".join(["SELECT %s AS id, %s AS qty"] * len(quantities))
+                params = [value for pair in quantities.items() for value in pair]
+                if replay:
+                    cursor.execute(FORCE_TAKE_STOCK[db.dialect].format(deltas=deltas), params)
+                else:
+                    cursor.execute(TAKE_STOCK[db.dialect].format(deltas=deltas), params)
+                    if cursor.rowcount != len(quantities):
+                        raise InsufficientStockError("Not enough stock for one or more items")
+
+                SalesRollups.apply_bill(cursor, bill_id)
+        except Error as e:
+            if is_unreachable(e):
+                raise DatabaseUnavailableError(str(e)) from e
+            logger.error("Failed to save bill %s: %s", bill_number, e)
+            return None, False
+
+        return bill_id, True
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from config.settings import Config
+
+class StockReservations:
+    """
+    In-memory stock holds for bills that are still being built
+
+    Adding a line to a bill only places a hold here; the products table is
+    updated once, for every line together, when the bill is saved. Holds
+    belong to an owner (the cashier's user id), are refreshed whenever the
+    owner adds more, and are dropped by the reaper once `ttl` seconds pass
+    without activity, so abandoned bills stop blocking stock.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._holds = {}
+        self._expires = {}
+        self._reserved = Counter()
+        self._lock = threading.Lock()
+
+    def available(self, product_id, stock):
+        """Stock left after every open hold on the product"""
+        with self._lock:
+            return stock - self._reserved.get(product_id, 0)
+
+    def reserve(self, owner, product_id, quantity, stock):
+        """Hold `quantity` more of a product for `owner`; returns False if not enough is free"""
+        with self._lock:
+            if self._expires.get(owner, float('inf')) <= time.monotonic():
+                self._release(owner)
+            if stock - self._reserved.get(product_id, 0) < quantity:
+                return False
+
+            holds = self._holds.setdefault(owner, {})
+            holds[product_id] = holds.get(product_id, 0) + quantity
+            self._reserved[product_id] += quantity
+            self._expires[owner] = time.monotonic() + self.ttl
+            return True
+
+    def held(self, owner):
+        """Quantities currently held by `owner`, keyed by product id"""
+        with self._lock:
+            return dict(self._holds.get(owner, {}))
+
+    def release(self, owner):
+        """Drop every hold of `owner` (bill saved or cancelled)"""
+        with self._lock:
+            self._release(owner)
+
+    def reap(self):
+        """Drop expired holds and return how many owners were released"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [owner for owner, deadline in self._expires.items() if deadline <= now]
+            for owner in expired:
+                self._release(owner)
+            return len(expired)
+
+    async def run_reaper(self, interval):
+        """Reap expired holds every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            self.reap()
+
+    def _release(self, owner):
+        for product_id, quantity in self._holds.pop(owner, {}).items():
+            self._reserved[product_id] -= quantity
+            if self._reserved[product_id] <= 0:
+                del self._reserved[product_id]
+        self._expires.pop(owner, None)
+
+# Holds for bills in progress, shared by the billing handlers
+stock_reservations = StockReservations(Config.RESERVATION_TTL)
@@ -0,0 +1,181 @@
+"""
+Pre-aggregated sales tables behind the Reports menu
+
+Usage (rebuild every rollup from bills and bill_items):
+    python -m database.rollups
+
+Each saved bill is folded into the rollups by SalesRollups.apply_bill, inside
+the transaction that saves the bill, so reports never disagree with the bills
+table. A rebuild runs the same aggregations over all bills at once.
+
+Revenue in sales_hourly/sales_daily is what customers paid (after discounts);
+per-product and per-category revenue is quantity x unit price, because a bill
+discount is not attributed to individual lines.
+"""
+import time
+
+from .connection import db
+
+TABLES = {
+    'sales_hourly': """
+        CREATE TABLE IF NOT EXISTS sales_hourly (
+            hour DATETIME PRIMARY KEY,
+            bills INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            discount DECIMAL(14, 2) NOT NULL DEFAULT 0
+        )
+    """,
+    'sales_daily': """
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            day DATE PRIMARY KEY,
+            bills INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            discount DECIMAL(14, 2) NOT NULL DEFAULT 0
+        )
+    """,
+    'sales_by_product': """
+        CREATE TABLE IF NOT EXISTS sales_by_product (
+            day DATE NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id)
+        )
+    """,
+    'sales_by_category': """
+        CREATE TABLE IF NOT EXISTS sales_by_category (
+            day DATE NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            quantity INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category)
+        )
+    """
+}
+
+# Aggregations over the bills matching {condition}; they add onto existing rows
+ROLLUPS = {
+    'mysql': (
+        """
+        INSERT INTO sales_hourly (hour, bills, revenue, discount)
+        SELECT TIMESTAMP(DATE(b.created_at), MAKETIME(HOUR(b.created_at), 0, 0)) AS hour,
+               COUNT(*), SUM(b.total_amount), SUM(b.discount)
+        FROM bills b WHERE {condition}
+        GROUP BY hour
+        ON DUPLICATE KEY UPDATE bills = sales_hourly.bills + VALUES(bills),
+            revenue = sales_hourly.revenue + VALUES(revenue), discount = sales_hourly.discount + VALUES(discount)
+        """,
+        """
+        INSERT INTO sales_daily (day, bills, revenue, discount)
+        SELECT DATE(b.created_at) AS day, COUNT(*), SUM(b.total_amount), SUM(b.discount)
+        FROM bills b WHERE {condition}
+        GROUP BY day
+        ON DUPLICATE KEY UPDATE bills = sales_daily.bills + VALUES(bills),
+            revenue = sales_daily.revenue + VALUES(revenue), discount = sales_daily.discount + VALUES(discount)
+        """,
+        """
+        INSERT INTO sales_by_product (day, product_id, quantity, revenue)
+        SELECT DATE(b.created_at) AS day, bi.product_id,
+               SUM(bi.quantity), SUM(bi.quantity * bi.unit_price)
+        FROM bill_items bi JOIN bills b ON b.id = bi.bill_id WHERE {condition}
+        GROUP BY day, bi.product_id
+        ON DUPLICATE KEY UPDATE quantity = sales_by_product.quantity + VALUES(quantity),
+            revenue = sales_by_product.revenue + VALUES(revenue)
+        """,
+        """
+        INSERT INTO sales_by_category (day, category, quantity, revenue)
+        SELECT DATE(b.created_at) AS day, p.category,
+               SUM(bi.quantity), SUM(bi.quantity * bi.unit_price)
+        FROM bill_items bi
+        JOIN bills b ON b.id = bi.bill_id
+        JOIN products p ON p.id = bi.product_id
+        WHERE {condition}
+        GROUP BY day, p.category
+        ON DUPLICATE KEY UPDATE quantity = sales_by_category.quantity + VALUES(quantity),
+            revenue = sales_by_category.revenue + VALUES(revenue)
+        """
+    ),
+    'sqlite': (
+        """
+        INSERT INTO sales_hourly (hour, bills, revenue, discount)
+        SELECT strftime('%Y-%m-%d %H:00:00', b.created_at) AS hour,
+               COUNT(*), SUM(b.total_amount), SUM(b.discount)
+        FROM bills b WHERE {condition}
+        GROUP BY hour
+        ON CONFLICT (hour) DO UPDATE SET bills = sales_hourly.bills + excluded.bills,
+            revenue = sales_hourly.revenue + excluded.revenue, discount = sales_hourly.discount + excluded.discount
+        """,
+        """
+        INSERT INTO sales_daily (day, bills, revenue, discount)
+        SELECT DATE(b.created_at) AS day, COUNT(*), SUM(b.total_amount), SUM(b.discount)
+        FROM bills b WHERE {condition}
+        GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET bills = sales_daily.bills + excluded.bills,
+            revenue = sales_daily.revenue + excluded.revenue, discount = sales_daily.discount + excluded.discount
+        """,
+        """
+        INSERT INTO sales_by_product (day, product_id, quantity, revenue)
+        SELECT DATE(b.created_at) AS day, bi.product_id,
+               SUM(bi.quantity), SUM(bi.quantity * bi.unit_price)
+        FROM bill_items bi JOIN bills b ON b.id = bi.bill_id WHERE {condition}
+        GROUP BY day, bi.product_id
+        ON CONFLICT (day, product_id) DO UPDATE SET quantity = sales_by_product.quantity + excluded.quantity,
+            revenue = sales_by_product.revenue + excluded.revenue
+        """,
+        """
+        INSERT INTO sales_by_category (day, category, quantity, revenue)
+        SELECT DATE(b.created_at) AS day, p.category,
+               SUM(bi.quantity), SUM(bi.quantity * bi.unit_price)
+        FROM bill_items bi
+        JOIN bills b ON b.id = bi.bill_id
+        JOIN products p ON p.id = bi.product_id
+        WHERE {condition}
+        GROUP BY day, p.category
+        ON CONFLICT (day, category) DO UPDATE SET quantity = sales_by_category.quantity + excluded.quantity,
+            revenue = sales_by_category.revenue + excluded.revenue
+        """
+    )
+}
+
+class SalesRollups:
+    @staticmethod
+    def create_tables():
+        for ddl in TABLES.values():
+            db.execute_query(ddl)
+
+    @staticmethod
+    def apply_bill(cursor, bill_id):
+        """Add one bill to every rollup, using the caller's transaction cursor"""
+        for query in ROLLUPS[db.dialect]:
+            cursor.execute(query.format(condition="b.id = %s"), (bill_id,))
+
+    @staticmethod
+    def rebuild():
+        """
+        Recompute every rollup from scratch in a single transaction
+
+        Rows are deleted rather than truncated so the rebuild stays atomic;
+        bills saved meanwhile wait on the locks and are counted exactly once.
+        """
+        with db.transaction() as cursor:
+            for table in TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+            for query in ROLLUPS[db.dialect]:
+                cursor.execute(query.format(condition="1 = 1"))
+
+    @staticmethod
+    def is_stale():
+        """True when bills exist but the rollups are empty (e.g. right after an upgrade)"""
+        rows = db.execute_query(
+            "SELECT EXISTS(SELECT 1 FROM bills) AS has_bills, "
+            "EXISTS(SELECT 1 FROM sales_daily) AS has_rollups"
+        )
+        return bool(rows) and bool(rows[0]['has_bills']) and not rows[0]['has_rollups']
+
+def main():
+    started = time.monotonic()
+    SalesRollups.rebuild()
+    print(f"Rebuilt sales rollups in {time.monotonic() - started:.2f}s")
+
+if __name__ == '__main__':
+    main()
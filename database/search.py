@@ -0,0 +1,182 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter, defaultdict
+
+_WORD = re.compile(r"\w+")
+
+def _words(text):
+    return _WORD.findall(text.casefold())
+
+def _trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductSearchIndex:
+    """
+    In-memory product lookup for barcodes and name search
+
+    Exact codes resolve through a hash map. Names are indexed twice: a sorted
+    word list answers prefix queries with bisect, and a trigram index ranks
+    fuzzy matches (typos, partial words). The index is built once from the
+    products table and then kept current with upsert/remove/set_stock.
+    """
+
+    MIN_SIMILARITY = 0.3
+    # Columns that change how a product is found or listed; stock alone is patched in place
+    CATALOG_FIELDS = ('code', 'name', 'category', 'price')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._products = {}
+        self._by_code = {}
+        self._words = []
+        self._trigrams = defaultdict(set)
+        self.ready = False
+
+    def build(self, rows):
+        """Replace the index contents with `rows` from the products table"""
+        with self._lock:
+            self._clear()
+            words = []
+            for row in rows:
+                self._add(row, words)
+            words.sort()
+            self._words = words
+            self.ready = True
+
+    def invalidate(self):
+        """Mark the index stale so it is rebuilt before the next search"""
+        with self._lock:
+            self.ready = False
+
+    def upsert(self, row):
+        with self._lock:
+            self._remove(row['id'])
+            new_words = []
+            self._add(row, new_words)
+            for entry in new_words:
+                bisect.insort(self._words, entry)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def set_stock(self, product_id, stock):
+        with self._lock:
+            product = self._products.get(product_id)
+            if product is not None:
+                product['stock'] = stock
+
+    def adjust_stock(self, product_id, delta):
+        with self._lock:
+            product = self._products.get(product_id)
+            if product is not None:
+                product['stock'] += delta
+
+    def sync(self, rows):
+        """
+        Bring the index in line with `rows` (the whole products table) in place
+
+        Searches keep working from the current contents meanwhile. Returns
+        (changed, removed): (old, new) row pairs for products that are new
+        (old is None) or whose catalog fields changed, and the last indexed
+        rows of products that no longer exist.
+        """
+        changed = []
+        seen = set()
+        for row in rows:
+            seen.add(row['id'])
+            with self._lock:
+                current = self._products.get(row['id'])
+                current = dict(current) if current is not None else None
+            if current is None or any(current[field] != row[field] for field in self.CATALOG_FIELDS):
+                self.upsert(row)
+                changed.append((current, row))
+            elif current['stock'] != row['stock']:
+                self.set_stock(row['id'], row['stock'])
+
+        with self._lock:
+            removed = [product for product_id, product in self._products.items() if product_id not in seen]
+        for product in removed:
+            self.remove(product['id'])
+        return changed, removed
+
+    def get_by_code(self, code):
+        with self._lock:
+            product_id = self._by_code.get(code.strip().casefold())
+            return self._products.get(product_id)
+
+    def search(self, term, limit=20):
+        """Return up to `limit` products ranked by how well their name matches `term`"""
+        exact = self.get_by_code(term)
+        if exact is not None:
+            return [exact]
+
+        query_words = _words(term)
+        if not query_words:
+            return []
+
+        with self._lock:
+            scores = Counter()
+            for word in query_words:
+                # Prefix matches count as a full word hit
+                matched = False
+                start = bisect.bisect_left(self._words, (word, -1))
+                for i in range(start, len(self._words)):
+                    token, product_id = self._words[i]
+                    if not token.startswith(word):
+                        break
+                    scores[product_id] += 1.0
+                    matched = True
+                if matched:
+                    continue
+
+                # Fall back to trigram overlap for misspelt or mid-word terms
+                grams = _trigrams(word)
+                shared = Counter()
+                for gram in grams:
+                    shared.update(self._trigrams.get(gram, ()))
+                for product_id, count in shared.items():
+                    similarity = count / len(grams)
+                    if similarity >= self.MIN_SIMILARITY:
+                        scores[product_id] += similarity
+
+            ranked = heapq.nsmallest(
+                limit,
+                scores.items(),
+                key=lambda pair: (-pair[1], self._products[pair[0]]['name'])
+            )
+            return [self._products[product_id] for product_id, _ in ranked]
+
+    def _add(self, row, words):
+        product_id = row['id']
+        self._products[product_id] = dict(row)
+        self._by_code[str(row['code']).strip().casefold()] = product_id
+        for word in set(_words(row['name'])):
+            words.append((word, product_id))
+            for gram in _trigrams(word):
+                self._trigrams[gram].add(product_id)
+
+    def _remove(self, product_id):
+        product = self._products.pop(product_id, None)
+        if product is None:
+            return
+        self._by_code.pop(str(product['code']).strip().casefold(), None)
+        for word in set(_words(product['name'])):
+            i = bisect.bisect_left(self._words, (word, product_id))
+            if i < len(self._words) and self._words[i] == (word, product_id):
+                del self._words[i]
+            for gram in _trigrams(word):
+                ids = self._trigrams.get(gram)
+                if ids is not None:
+                    ids.discard(product_id)
+                    if not ids:
+                        del self._trigrams[gram]
+
+# Shared index used by DBOperations.search_products
+product_index = ProductSearchIndex()
@@ -0,0 +1,59 @@
+import asyncio
+import datetime
+from .connection import db
+from config.settings import Config
+
+# Atomically adds a block to the day's counter and yields the new high value
+RESERVE_BLOCK = {
+    'mysql': (
+        "INSERT INTO sequences (name, value) VALUES (%s, LAST_INSERT_ID(%s)) "
+        "ON DUPLICATE KEY UPDATE value = LAST_INSERT_ID(value + %s)"
+    ),
+    'sqlite': (
+        "INSERT INTO sequences (name, value) VALUES (%s, %s) "
+        "ON CONFLICT (name) DO UPDATE SET value = sequences.value + %s RETURNING value AS high"
+    )
+}
+
+class SequenceAllocator:
+    """
+    Daily sequence numbers handed out from blocks reserved in the `sequences` table
+
+    Each refill reserves `block_size` numbers with a single atomic upsert, so the
+    shared row is touched once per block rather than once per number, and separate
+    bot processes never receive overlapping blocks. Numbers left in a block when the
+    process stops or the day changes are skipped, so sequences can have gaps.
+    """
+
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = asyncio.Lock()
+        self._day = None
+        self._next = 1
+        self._high = 0
+
+    def _reserve_block(self, day):
+        """Reserve the next block for `day` and return its highest number"""
+        with db.cursor() as cursor:
+            cursor.execute(RESERVE_BLOCK[db.dialect], (f"{self.name}_{day}", self.block_size, self.block_size))
+            if not cursor.with_rows:
+                cursor.execute("SELECT LAST_INSERT_ID() AS high")
+            return cursor.fetchall()[0]['high']
+
+    async def next_value(self):
+        """Return (day, number) where day is the YYYYMMDD the number belongs to"""
+        day = datetime.date.today().strftime("%Y%m%d")
+        async with self._lock:
+            if day != self._day or self._next > self._high:
+                high = await db.run(self._reserve_block, day)
+                self._day = day
+                self._next = high - self.block_size + 1
+                self._high = high
+
+            value = self._next
+            self._next += 1
+            return day, value
+
+# Bill number sequence used by utils.helpers.generate_bill_number
+bill_sequence = SequenceAllocator('bill', Config.BILL_SEQUENCE_BLOCK)
@@ -0,0 +1,45 @@
+"""
+Test setup: every test runs against a throwaway SQLite database
+
+The environment is set before any project module is imported, because
+config.settings reads it at import time.
+"""
+import os
+import sys
+import tempfile
+
+_data_dir = tempfile.mkdtemp(prefix='billo-tests-')
+os.environ.update({
+    'DB_BACKEND': 'sqlite',
+    'SQLITE_PATH': os.path.join(_data_dir, 'billo.sqlite3'),
+    'JOURNAL_FILE': os.path.join(_data_dir, 'journal', 'checkouts.jsonl'),
+    'STATE_FILE': os.path.join(_data_dir, 'bot_state.sqlite3'),
+    'DEFAULT_DISCOUNT': '0',
+    'BILL_PREFIX': 'INV'
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from database.cache import catalog_cache
+from database.connection import db
+from database.models import DBInitializer
+
+DBInitializer.initialize_database()
+
+TABLES = (
+    'bill_items', 'bills', 'customers', 'products', 'sequences',
+    'sales_hourly', 'sales_daily', 'sales_by_product', 'sales_by_category'
+)
+
+@pytest.fixture
+def products():
+    """Empty tables plus two products; returns {code: id}"""
+    for table in TABLES:
+        db.execute_query(f"DELETE FROM {table}")
+    catalog_cache.invalidate()
+    db.execute_query(
+        "INSERT INTO products (code, name, category, price, cost, stock, min_stock) VALUES "
+        "('A1', 'Apple', 'Fruit', 10, 6, 5, 1), ('B1', 'Bread', 'Bakery', 25, 15, 2, 1)"
+    )
+    return {row['code']: row['id'] for row in db.execute_query("SELECT id, code FROM products")}
@@ -0,0 +1,48 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import ExtBot
+
+from bot.handlers.billing import BillingHandler
+from bot.outbox import Outbox
+from utils.loadtest import FakeTelegram
+
+CHAT = {'id': 42, 'type': 'private'}
+USER = {'id': 42, 'is_bot': False, 'first_name': "Cashier"}
+
+def callback_query(bot, query_id):
+    message = {'message_id': 7, 'date': 0, 'chat': CHAT, 'text': "Select a category:"}
+    return Update.de_json({
+        'update_id': query_id,
+        'callback_query': {
+            'id': str(query_id), 'from': USER, 'chat_instance': '42', 'message': message, 'data': 'catpage_0'
+        }
+    }, bot).callback_query
+
+def test_page_edits_are_queued_and_collapse(products):
+    transport = FakeTelegram()
+    # One message per second for the chat, so every edit below has to wait for the bucket
+    outbox = Outbox(global_rate=0, chat_rate=1, chat_burst=1, group_per_minute=0)
+
+    async def run():
+        bot = ExtBot("123:TEST", request=transport, get_updates_request=transport, rate_limiter=outbox)
+        await bot.initialize()
+        await bot.send_message(CHAT['id'], "Select a category:")
+        transport.take_replies(CHAT['id'])
+
+        for page in range(3):
+            await asyncio.wait_for(
+                BillingHandler.show_product_page(callback_query(bot, page + 1), 'Fruit', page), 0.5
+            )
+        # The handler returned while the edits were still held back by the chat's bucket
+        unsent = transport.calls['editMessageText']
+
+        await outbox.flush(CHAT['id'])
+        replies = transport.take_replies(CHAT['id'])
+        await bot.shutdown()
+        return unsent, replies
+
+    unsent, replies = asyncio.run(run())
+    assert unsent == 0
+    assert transport.calls['editMessageText'] == 1
+    assert replies == ["Products in Fruit (page 3):"]
@@ -0,0 +1,32 @@
+import asyncio
+
+from bot.main import RetailBot
+from config.settings import Config
+from utils.loadtest import FakeTelegram
+
+def test_background_tasks_have_unwound_before_shutdown(products, monkeypatch):
+    monkeypatch.setattr(Config, 'BOT_TOKEN', "123:TEST")
+    monkeypatch.setattr(Config, 'METRICS_PORT', 0)
+
+    async def run():
+        bot = RetailBot(request=FakeTelegram())
+        application = bot.application
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        started = list(bot._background)
+
+        await application.stop()
+        await application.post_stop(application)
+        # Nothing may still be running once the bot and persistence start closing
+        unwound = all(task.done() for task in started)
+
+        await application.shutdown()
+        await application.post_shutdown(application)
+        left = asyncio.all_tasks() - {asyncio.current_task()}
+        return started, unwound, left
+
+    started, unwound, left = asyncio.run(run())
+    assert len(started) == 4
+    assert unwound
+    assert left == set()
@@ -0,0 +1,98 @@
+import asyncio
+import types
+
+import pytest
+
+from database import cache
+from database.cache import TTLCache
+from utils import metrics
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the cache's monotonic clock; advance it by adding to clock.now"""
+    fake = types.SimpleNamespace(now=1000.0)
+    fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(cache, 'time', fake)
+    return fake
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(maxsize=10, ttl=30)
+    entries.set('a', 1)
+
+    clock.now += 29
+    assert entries.get('a') == 1
+    clock.now += 2
+    assert entries.get('a') is None
+    assert entries.stats()['size'] == 0
+
+def test_ttl_is_not_extended_by_reads(clock):
+    entries = TTLCache(maxsize=10, ttl=30)
+    entries.set('a', 1)
+
+    clock.now += 20
+    entries.get('a')
+    clock.now += 20
+    assert entries.get('a') is None
+
+def test_least_recently_used_is_evicted(clock):
+    entries = TTLCache(maxsize=2, ttl=30)
+    entries.set('a', 1)
+    entries.set('b', 2)
+    entries.get('a')
+    entries.set('c', 3)
+
+    assert entries.get('b') is None
+    assert entries.get('a') == 1
+    assert entries.get('c') == 3
+    assert entries.stats()['evictions'] == 1
+
+def test_stats_count_hits_and_misses(clock):
+    entries = TTLCache(maxsize=2, ttl=30)
+    entries.set('a', 1)
+    entries.get('a')
+    entries.get('b')
+
+    stats = entries.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    assert stats['hit_rate'] == 0.5
+
+def test_failed_loads_are_not_cached(clock):
+    entries = TTLCache(maxsize=2, ttl=30)
+    results = iter([False, 'loaded'])
+
+    async def loader():
+        return next(results)
+
+    async def run():
+        return [await entries.get_or_load('a', loader) for _ in range(3)]
+
+    assert asyncio.run(run()) == [False, 'loaded', 'loaded']
+
+def test_invalidate_drops_keys_and_bumps_generation(clock):
+    entries = TTLCache(maxsize=10, ttl=30)
+    entries.set('a', 1)
+    entries.set('b', 2)
+
+    entries.invalidate('a')
+    assert entries.get('a') is None
+    assert entries.get('b') == 2
+    entries.invalidate()
+    assert entries.get('b') is None
+    assert entries.generation == 2
+
+def test_invalidate_prefix_drops_matching_tuple_keys(clock):
+    entries = TTLCache(maxsize=10, ttl=30)
+    for key in (('product_page', 'Fruit', 0), ('product_page', 'Fruit', 1), ('product_page', 'Bakery', 0), 'a'):
+        entries.set(key, 1)
+
+    entries.invalidate(prefixes=[('product_page', 'Fruit')])
+    assert entries.stats()['size'] == 2
+    assert entries.get(('product_page', 'Bakery', 0)) == 1
+    assert entries.get('a') == 1
+
+def test_cache_totals_are_exposed_as_counters():
+    exposed = metrics.registry.expose()
+
+    for name in ('hits', 'misses', 'evictions'):
+        assert f"# TYPE billo_catalog_cache_{name}_total counter" in exposed
+    assert "# TYPE billo_catalog_cache_entries gauge" in exposed
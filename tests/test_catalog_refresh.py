@@ -0,0 +1,53 @@
+import asyncio
+
+from bot.keyboards import get_product_page_keyboard
+from database.connection import db
+from database.operations import DBOperations
+
+def button_texts(markup):
+    return [button.text for row in markup.inline_keyboard for button in row]
+
+def edit_outside_bot(*statements):
+    """Change the catalog the way utils.import_products does, without touching the bot's caches"""
+    with db.transaction() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+        DBOperations.bump_catalog_version(cursor)
+
+def test_outside_edits_rebuild_product_pages(products):
+    async def run():
+        await DBOperations.load_search_index()
+        DBOperations._catalog_version = None
+        await DBOperations.refresh_catalog()
+        before = button_texts(await get_product_page_keyboard('Fruit', 0))
+
+        edit_outside_bot(
+            "UPDATE products SET name = 'Green Apple' WHERE code = 'A1'",
+            "UPDATE products SET category = 'Fruit' WHERE code = 'B1'",
+            "INSERT INTO products (code, name, category, price, cost, stock) "
+            "VALUES ('M1', 'Mango', 'Fruit', 40, 30, 9)"
+        )
+        changed = await DBOperations.refresh_catalog()
+        after = button_texts(await get_product_page_keyboard('Fruit', 0))
+        bakery = await get_product_page_keyboard('Bakery', 0)
+        return before, changed, after, bakery
+
+    before, changed, after, bakery = asyncio.run(run())
+    assert any(text.startswith('Apple') for text in before)
+    assert changed is True
+    products_listed = [text.split(' (')[0] for text in after if '(' in text]
+    assert sorted(products_listed) == ['Bread', 'Green Apple', 'Mango']
+    assert not any('Bread' in text for text in button_texts(bakery))
+
+def test_unchanged_catalog_keeps_cached_pages(products):
+    async def run():
+        await DBOperations.load_search_index()
+        DBOperations._catalog_version = None
+        await DBOperations.refresh_catalog()
+        first = await get_product_page_keyboard('Fruit', 0)
+        changed = await DBOperations.refresh_catalog()
+        return first, changed, await get_product_page_keyboard('Fruit', 0)
+
+    first, changed, second = asyncio.run(run())
+    assert changed is False
+    assert second is first
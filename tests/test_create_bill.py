@@ -0,0 +1,84 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+from database.connection import db
+from database.operations import DBOperations, InsufficientStockError
+
+def create_bill(bill_number, items, phone='9876543210', name='Asha', discount=0):
+    return asyncio.run(DBOperations.create_bill(bill_number, name, phone, items, discount))
+
+def line(product_id, quantity, price):
+    return {'product_id': product_id, 'quantity': quantity, 'price': Decimal(price)}
+
+def stock(product_id):
+    return db.execute_query("SELECT stock FROM products WHERE id = %s", (product_id,))[0]['stock']
+
+def count(table):
+    return db.execute_query(f"SELECT COUNT(*) AS n FROM {table}")[0]['n']
+
+def test_saves_bill_items_and_takes_stock(products):
+    bill_id = create_bill('INV1', [line(products['A1'], 2, 10), line(products['B1'], 1, 25)], discount=5)
+
+    bill = asyncio.run(DBOperations.get_bill(bill_id))
+    assert bill['bill_number'] == 'INV1'
+    assert Decimal(bill['total_amount']) == Decimal(40)
+    assert sorted(item['quantity'] for item in bill['items']) == [1, 2]
+    assert stock(products['A1']) == 3
+    assert stock(products['B1']) == 1
+
+def test_repeated_lines_take_stock_once_per_unit(products):
+    create_bill('INV1', [line(products['A1'], 2, 10), line(products['A1'], 3, 10)])
+
+    assert stock(products['A1']) == 0
+
+def test_insufficient_stock_saves_nothing(products):
+    with pytest.raises(InsufficientStockError):
+        create_bill('INV1', [line(products['A1'], 2, 10), line(products['B1'], 3, 25)])
+
+    assert stock(products['A1']) == 5
+    assert stock(products['B1']) == 2
+    for table in ('bills', 'bill_items', 'customers', 'sales_daily', 'sales_by_product'):
+        assert count(table) == 0
+
+def test_failed_insert_rolls_back_customer(products):
+    create_bill('INV1', [line(products['A1'], 1, 10)])
+
+    # A duplicate bill number fails after the customer row was already updated
+    assert create_bill('INV1', [line(products['A1'], 1, 10)]) is None
+
+    customer = db.execute_query("SELECT total_spent, visit_count FROM customers")[0]
+    assert customer['visit_count'] == 1
+    assert Decimal(customer['total_spent']) == Decimal(10)
+    assert stock(products['A1']) == 4
+    assert db.execute_query("SELECT bills FROM sales_daily")[0]['bills'] == 1
+
+def test_rollups_and_customer_follow_each_bill(products):
+    first = create_bill('INV1', [line(products['A1'], 2, 10)], discount=2)
+    second = create_bill('INV2', [line(products['A1'], 1, 10), line(products['B1'], 1, 25)])
+
+    daily = db.execute_query("SELECT bills, revenue, discount FROM sales_daily")
+    assert len(daily) == 1
+    assert daily[0]['bills'] == 2
+    assert Decimal(daily[0]['revenue']) == Decimal(53)
+    assert Decimal(daily[0]['discount']) == Decimal(2)
+
+    by_product = {
+        row['product_id']: row['quantity']
+        for row in db.execute_query("SELECT product_id, quantity FROM sales_by_product")
+    }
+    assert by_product == {products['A1']: 3, products['B1']: 1}
+
+    customer = db.execute_query("SELECT id, total_spent, visit_count FROM customers WHERE phone = %s",
+                                ('9876543210',))[0]
+    assert customer['visit_count'] == 2
+    assert Decimal(customer['total_spent']) == Decimal(53)
+    linked = db.execute_query("SELECT id FROM bills WHERE customer_id = %s ORDER BY id", (customer['id'],))
+    assert [row['id'] for row in linked] == [first, second]
+
+def test_bill_without_phone_has_no_customer(products):
+    bill_id = create_bill('INV1', [line(products['A1'], 1, 10)], phone='skip')
+
+    assert count('customers') == 0
+    assert db.execute_query("SELECT customer_id FROM bills WHERE id = %s", (bill_id,))[0]['customer_id'] is None
@@ -0,0 +1,51 @@
+from openpyxl import Workbook
+
+from database.connection import db
+from utils.import_products import COLUMNS, import_products
+
+def workbook(tmp_path, rows):
+    """Write `rows` of (code, category, name, price, stock) under the catalog header"""
+    book = Workbook()
+    sheet = book.active
+    sheet.append(list(COLUMNS))
+    for code, category, name, price, stock in rows:
+        sheet.append([code, category, name, '', 0, price, price, stock])
+    path = tmp_path / 'products.xlsx'
+    book.save(path)
+    return str(path)
+
+def product(code):
+    rows = db.execute_query("SELECT name, price, stock FROM products WHERE code = %s", (code,))
+    return rows[0] if rows else None
+
+def test_reimport_keeps_live_stock(products, tmp_path):
+    path = workbook(tmp_path, [('A1', 'Fruit', 'Red Apple', 12, 40), ('N1', 'Fruit', 'Nectarine', 30, 7)])
+
+    imported, rejects = import_products(path)
+
+    assert (imported, rejects) == (2, [])
+    assert product('A1')['name'] == 'Red Apple'
+    assert float(product('A1')['price']) == 12
+    assert product('A1')['stock'] == 5
+    assert product('N1')['stock'] == 7
+
+def test_set_stock_overwrites_live_stock(products, tmp_path):
+    path = workbook(tmp_path, [('A1', 'Fruit', 'Apple', 10, 40)])
+
+    import_products(path, set_stock=True)
+
+    assert product('A1')['stock'] == 40
+
+def test_repeated_code_in_a_batch_uses_last_row(products, tmp_path, caplog):
+    path = workbook(tmp_path, [
+        ('N1', 'Fruit', 'Nectarine', 30, 7),
+        ('B1', 'Bakery', 'Bread', 25, 2),
+        ('N1', 'Fruit', 'Nectarine (ripe)', 35, 9)
+    ])
+
+    imported, rejects = import_products(path, batch_size=10)
+
+    assert (imported, rejects) == (2, [])
+    assert product('N1')['name'] == 'Nectarine (ripe)'
+    assert product('N1')['stock'] == 9
+    assert "Row 4 repeats code 'N1' from row 2" in caplog.text
@@ -0,0 +1,66 @@
+import asyncio
+from decimal import Decimal
+
+from database.connection import db
+from database.journal import CheckoutJournal
+from database.operations import DBOperations
+from database.search import product_index
+
+def journal_entry(products, bill_number='INV-OFF-1'):
+    items = [{'product_id': products['A1'], 'quantity': 2, 'price': Decimal(10)}]
+    return CheckoutJournal.entry(bill_number, 'Asha', '9876543210', items, Decimal(0))
+
+def bills():
+    return db.execute_query("SELECT bill_number FROM bills ORDER BY id")
+
+def stock(product_id):
+    return db.execute_query("SELECT stock FROM products WHERE id = %s", (product_id,))[0]['stock']
+
+def test_replay_saves_journaled_bills(products, tmp_path):
+    journal = CheckoutJournal(str(tmp_path / 'checkouts.jsonl'))
+
+    async def run():
+        await journal.append(journal_entry(products, 'INV-OFF-1'))
+        await journal.append(journal_entry(products, 'INV-OFF-2'))
+        return await journal.replay()
+
+    assert asyncio.run(run()) == 2
+    assert [row['bill_number'] for row in bills()] == ['INV-OFF-1', 'INV-OFF-2']
+    assert stock(products['A1']) == 1
+    assert (tmp_path / 'checkouts.jsonl').read_text() == ''
+
+def test_duplicate_entries_are_saved_once(products, tmp_path):
+    journal = CheckoutJournal(str(tmp_path / 'checkouts.jsonl'))
+    entry = journal_entry(products)
+
+    async def run():
+        await DBOperations.load_search_index()
+        # The same checkout journaled twice, e.g. retried after a lost confirmation
+        await journal.append(entry)
+        await journal.append(entry)
+        await journal.replay()
+        # Replaying a copy of the journal again, e.g. restored from a backup
+        await journal.append(entry)
+        await journal.replay()
+
+    asyncio.run(run())
+    assert [row['bill_number'] for row in bills()] == ['INV-OFF-1']
+    assert stock(products['A1']) == 3
+    # The search index takes the stock once too, not once per replay
+    assert product_index.get_by_code('A1')['stock'] == 3
+    customer = db.execute_query("SELECT visit_count FROM customers")[0]
+    assert customer['visit_count'] == 1
+
+def test_replay_takes_stock_even_when_short(products, tmp_path):
+    journal = CheckoutJournal(str(tmp_path / 'checkouts.jsonl'))
+    entry = journal_entry(products)
+    entry['items'][0]['quantity'] = 8
+
+    async def run():
+        await journal.append(entry)
+        return await journal.replay()
+
+    # The sale already happened offline, so it is recorded (stock stops at zero) rather than rejected
+    assert asyncio.run(run()) == 1
+    assert stock(products['A1']) == 0
+    assert not (tmp_path / 'checkouts.jsonl.rejected').exists()
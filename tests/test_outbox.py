@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, Forbidden
+
+from bot.outbox import Outbox
+from config.settings import Config
+
+def unlimited_outbox():
+    return Outbox(global_rate=0, chat_rate=0, chat_burst=1, group_per_minute=0, max_retries=0)
+
+async def hang():
+    await asyncio.Event().wait()
+
+async def others():
+    return asyncio.all_tasks() - {asyncio.current_task()}
+
+@pytest.fixture
+def drain_seconds(monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOX_DRAIN_SECONDS', 0.05)
+
+def test_shutdown_after_drain_leaves_no_tasks(drain_seconds):
+    async def run():
+        outbox = unlimited_outbox()
+        await outbox.initialize()
+        sent = []
+
+        async def send():
+            sent.append(True)
+            return 'message'
+
+        assert await outbox.process_request(send, (), {}, 'sendDocument', {'chat_id': 1}, None) == 'message'
+        await outbox.shutdown()
+        return sent, await others()
+
+    sent, left = asyncio.run(run())
+    assert sent == [True]
+    assert left == set()
+
+def test_shutdown_cancels_stuck_sends_on_timeout(drain_seconds):
+    async def run():
+        outbox = unlimited_outbox()
+        await outbox.initialize()
+        dispatcher = outbox._dispatcher
+        caller = asyncio.create_task(
+            outbox.process_request(hang, (), {}, 'sendDocument', {'chat_id': 1}, None)
+        )
+        # A second call waits in the lane behind the stuck one
+        waiting = asyncio.create_task(
+            outbox.process_request(hang, (), {}, 'sendDocument', {'chat_id': 1}, None)
+        )
+        await asyncio.sleep(0.01)
+        in_flight = set(outbox._tasks)
+
+        await outbox.shutdown()
+        await asyncio.gather(caller, waiting, return_exceptions=True)
+        return dispatcher, in_flight, caller, waiting, await others()
+
+    dispatcher, in_flight, caller, waiting, left = asyncio.run(run())
+    assert dispatcher.done()
+    assert in_flight and all(task.done() for task in in_flight)
+    assert waiting.cancelled()
+    assert caller.done()
+    assert left == set()
+
+def test_cancelled_shutdown_still_stops_dispatcher(monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOX_DRAIN_SECONDS', 60)
+
+    async def run():
+        outbox = unlimited_outbox()
+        await outbox.initialize()
+        dispatcher = outbox._dispatcher
+        asyncio.create_task(outbox.process_request(hang, (), {}, 'sendDocument', {'chat_id': 1}, None))
+        await asyncio.sleep(0.01)
+
+        shutdown = asyncio.create_task(outbox.shutdown())
+        await asyncio.sleep(0.01)
+        shutdown.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await shutdown
+        return dispatcher, outbox._dispatcher
+
+    dispatcher, current = asyncio.run(run())
+    assert dispatcher.done()
+    assert current is None
+
+def test_shutdown_is_idempotent(drain_seconds):
+    async def run():
+        outbox = unlimited_outbox()
+        await outbox.initialize()
+        await outbox.initialize()
+        await outbox.shutdown()
+        await outbox.shutdown()
+        return await others()
+
+    assert asyncio.run(run()) == set()
+
+def test_calls_are_awaited_by_default(drain_seconds):
+    async def run():
+        outbox = unlimited_outbox()
+        await outbox.initialize()
+
+        async def send():
+            return 'message'
+
+        async def refuse():
+            raise BadRequest("Chat not found")
+
+        result = await outbox.process_request(send, (), {}, 'sendMessage', {'chat_id': 1}, None)
+        with pytest.raises(BadRequest):
+            await outbox.process_request(refuse, (), {}, 'sendMessage', {'chat_id': 1}, None)
+        await outbox.shutdown()
+        return result
+
+    assert asyncio.run(run()) == 'message'
+
+def test_queued_failures_reach_the_error_handlers(drain_seconds):
+    errors = []
+
+    class Application:
+        async def process_error(self, update, error):
+            errors.append((update, error))
+
+    async def run():
+        outbox = unlimited_outbox()
+        outbox.application = Application()
+        await outbox.initialize()
+
+        async def refuse():
+            raise Forbidden("Bot was blocked by the user")
+
+        result = await outbox.process_request(refuse, (), {}, 'sendMessage', {'chat_id': 1}, {'queue': True})
+        await outbox.drain()
+        await outbox.shutdown()
+        return result
+
+    assert asyncio.run(run()) is True
+    assert len(errors) == 1
+    assert errors[0][0] is None
+    assert isinstance(errors[0][1], Forbidden)
+
+def test_queued_edits_of_a_message_are_coalesced(drain_seconds):
+    async def run():
+        outbox = unlimited_outbox()
+        await outbox.initialize()
+        sent = []
+        release = asyncio.Event()
+
+        async def first():
+            await release.wait()
+            sent.append('first')
+
+        def edit(text):
+            async def send():
+                sent.append(text)
+                return True
+            return send
+
+        queue = {'queue': True}
+        blocker = asyncio.create_task(
+            outbox.process_request(first, (), {}, 'sendMessage', {'chat_id': 1}, None)
+        )
+        await asyncio.sleep(0.01)
+        for text in ('page 1', 'page 2', 'page 3'):
+            await outbox.process_request(
+                edit(text), (), {}, 'editMessageText', {'chat_id': 1, 'message_id': 7}, queue
+            )
+        # Replaces the queued page 3; somebody waits for it, so page 5 cannot replace it in turn
+        waited = asyncio.create_task(outbox.process_request(
+            edit('page 4'), (), {}, 'editMessageText', {'chat_id': 1, 'message_id': 7}, None
+        ))
+        await asyncio.sleep(0.01)
+        await outbox.process_request(
+            edit('page 5'), (), {}, 'editMessageText', {'chat_id': 1, 'message_id': 7}, queue
+        )
+        release.set()
+        await asyncio.gather(blocker, waited)
+        await outbox.drain()
+        await outbox.shutdown()
+        return sent
+
+    assert asyncio.run(run()) == ['first', 'page 4', 'page 5']
@@ -0,0 +1,46 @@
+import asyncio
+import datetime
+
+from database.connection import db
+from database.sequences import SequenceAllocator
+
+def take(allocator, n):
+    async def run():
+        return [(await allocator.next_value())[1] for _ in range(n)]
+    return asyncio.run(run())
+
+def stored(name):
+    day = datetime.date.today().strftime("%Y%m%d")
+    rows = db.execute_query("SELECT value FROM sequences WHERE name = %s", (f"{name}_{day}",))
+    return rows[0]['value'] if rows else None
+
+def test_numbers_continue_across_blocks(products):
+    allocator = SequenceAllocator('test', block_size=3)
+
+    assert take(allocator, 7) == [1, 2, 3, 4, 5, 6, 7]
+    # Three blocks reserved; 8 and 9 are held by this allocator
+    assert stored('test') == 9
+
+def test_block_is_reserved_once(products):
+    allocator = SequenceAllocator('test', block_size=5)
+
+    take(allocator, 1)
+    take(allocator, 4)
+    assert stored('test') == 5
+
+def test_allocators_never_share_numbers(products):
+    first = SequenceAllocator('test', block_size=3)
+    second = SequenceAllocator('test', block_size=3)
+
+    assert take(first, 2) == [1, 2]
+    assert take(second, 4) == [4, 5, 6, 7]
+    assert take(first, 2) == [3, 10]
+
+def test_new_day_starts_at_one(products):
+    allocator = SequenceAllocator('test', block_size=3)
+    take(allocator, 2)
+
+    # Pretend the previous numbers were handed out yesterday
+    allocator._day = '19700101'
+    db.execute_query("DELETE FROM sequences")
+    assert take(allocator, 1) == [1]
@@ -1,7 +1,7 @@
 # Package initialization
 from .helpers import generate_bill_number, format_currency, validate_phone
 from .logger import setup_logging
-from .validators import validate_quantity, validate_price, validate_date
+from .validators import validate_quantity, validate_price, validate_date, validate_stock
 
 __all__ = [
     'generate_bill_number',
@@ -10,5 +10,6 @@ __all__ = [
     'setup_logging',
     'validate_quantity',
     'validate_price',
-    'validate_date'
+    'validate_date',
+    'validate_stock'
 ]
\ No newline at end of file
@@ -0,0 +1,361 @@
+"""
+Benchmarks for DBOperations and BackupManager on a disposable database
+
+Usage:
+    python -m utils.benchmark [--scale 1k|100k|1m] [--keep] [--out data/benchmarks]
+
+A throwaway database (billo_bench_<pid>) is created for the configured
+backend - a schema on the MySQL server, or a temporary file with
+DB_BACKEND=sqlite - seeded with a synthetic catalog and bill history of the
+chosen scale, benchmarked and dropped again (unless --keep). Results are
+written as JSON so runs can be compared; the console gets a short summary.
+
+Scales (bills; products; ~3 items per bill):
+    1k    1,000 bills over 1,000 products
+    100k  100,000 bills over 10,000 products
+    1m    1,000,000 bills over 50,000 products
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from config.settings import Config
+
+SCALES = {
+    '1k': {'products': 1_000, 'bills': 1_000},
+    '100k': {'products': 10_000, 'bills': 100_000},
+    '1m': {'products': 50_000, 'bills': 1_000_000}
+}
+CATEGORIES = 40
+# Rows per seeding INSERT; bill_items batches stay under SQLite's 32766 bound parameters
+SEED_BATCH = 2_000
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'benchmarks')
+
+def summarize(samples, elapsed=None):
+    """Latency percentiles in milliseconds, plus throughput when `elapsed` is given"""
+    ordered = sorted(samples)
+    cuts = statistics.quantiles(ordered, n=100, method='inclusive') if len(ordered) > 1 else ordered * 99
+    result = {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+    if elapsed:
+        result['per_second'] = round(len(ordered) / elapsed, 1)
+    return result
+
+async def _timed(samples, coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    samples.append(time.perf_counter() - started)
+    return result
+
+def _sqlite_path(name):
+    return os.path.join(tempfile.gettempdir(), f"{name}.sqlite3")
+
+def create_schema(name):
+    """
+    Create an empty database `name` for Config.DB_BACKEND and point Config at it
+
+    Must run before the database package is imported, since it connects on
+    import. Returns the server version.
+    """
+    if Config.DB_BACKEND == 'sqlite':
+        Config.SQLITE_PATH = _sqlite_path(name)
+        return f"SQLite {sqlite3.sqlite_version}"
+
+    import mysql.connector
+    conn = mysql.connector.connect(**{**Config.DB_CONFIG, 'database': None})
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE `{name}`")
+        cursor.execute("SELECT VERSION()")
+        version = f"MySQL {cursor.fetchone()[0]}"
+    finally:
+        conn.close()
+    Config.DB_CONFIG['database'] = name
+    return version
+
+def drop_schema(name):
+    if Config.DB_BACKEND == 'sqlite':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(_sqlite_path(name) + suffix):
+                os.remove(_sqlite_path(name) + suffix)
+        return
+
+    import mysql.connector
+    conn = mysql.connector.connect(**{**Config.DB_CONFIG, 'database': None})
+    try:
+        conn.cursor().execute(f"DROP DATABASE IF EXISTS `{name}`")
+    finally:
+        conn.close()
+
+def seed(products, bills, rng):
+    """Insert a synthetic catalog and bill history; returns seeding stats"""
+    from database.connection import db
+
+    started = time.perf_counter()
+    for first in range(0, products, SEED_BATCH):
+        batch = range(first, min(first + SEED_BATCH, products))
+        with db.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO products (code, name, category, price, cost, stock) VALUES "
+                + ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch)),
+                [
+                    value
+                    for n in batch
+                    for value in (
+                        f"P{n:07d}", f"Product {n:07d}", f"Category {n % CATEGORIES:02d}",
+                        Decimal(rng.randint(100, 50_000)) / 100, Decimal(rng.randint(50, 25_000)) / 100,
+                        10_000_000
+                    )
+                ]
+            )
+
+    start_day = datetime.now() - timedelta(days=365)
+    item_rows = 0
+    for first in range(0, bills, SEED_BATCH):
+        batch = range(first, min(first + SEED_BATCH, bills))
+        with db.transaction() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS id FROM bills")
+            base_id = cursor.fetchall()[0]['id']
+            cursor.execute(
+                "INSERT INTO bills (id, bill_number, customer_name, customer_phone, total_amount, "
+                "discount, item_count, created_at) VALUES "
+                + ", ".join(["(%s, %s, %s, %s, %s, 0, %s, %s)"] * len(batch)),
+                [
+                    value
+                    for n in batch
+                    for value in (
+                        base_id + n - first + 1, f"BENCH-{n:09d}", f"Customer {n % 5_000}",
+                        f"9{n % 5_000:09d}" if n % 3 else None, Decimal(rng.randint(100, 500_000)) / 100,
+                        3, start_day + timedelta(seconds=n * 365 * 86_400 // bills)
+                    )
+                ]
+            )
+            items = [
+                (base_id + n - first + 1, rng.randrange(1, products + 1), rng.randint(1, 3),
+                 Decimal(rng.randint(100, 50_000)) / 100)
+                for n in batch
+                for _ in range(3)
+            ]
+            cursor.execute(
+                "INSERT INTO bill_items (bill_id, product_id, quantity, unit_price) VALUES "
+                + ", ".join(["(%s, %s, %s, %s)"] * len(items)),
+                [value for item in items for value in item]
+            )
+            item_rows += len(items)
+
+    seeded = time.perf_counter() - started
+    from database.rollups import SalesRollups
+    from database.customers import Customers
+    started = time.perf_counter()
+    SalesRollups.rebuild()
+    Customers.backfill()
+    return {
+        'products': products,
+        'bills': bills,
+        'bill_items': item_rows,
+        'seed_seconds': round(seeded, 2),
+        'derived_tables_seconds': round(time.perf_counter() - started, 2)
+    }
+
+async def bench_create_bill(products, rng, count=500, concurrency=8):
+    """Sequential latency and concurrent throughput of saving a 3-line bill"""
+    from database.operations import DBOperations
+    from utils.helpers import generate_bill_number
+
+    def items():
+        return [
+            {'product_id': rng.randrange(1, products + 1), 'quantity': rng.randint(1, 3),
+             'price': Decimal('9.99')}
+            for _ in range(3)
+        ]
+
+    async def save(samples):
+        bill_number = await generate_bill_number()
+        await _timed(samples, DBOperations.create_bill(
+            bill_number, "Bench", "9876543210", items(), Decimal('0')
+        ))
+
+    sequential = []
+    for _ in range(count):
+        await save(sequential)
+
+    concurrent = []
+    started = time.perf_counter()
+    for first in range(0, count, concurrency):
+        await asyncio.gather(*(save(concurrent) for _ in range(min(concurrency, count - first))))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'sequential': summarize(sequential, sum(sequential)),
+        f'concurrent_{concurrency}': summarize(concurrent, elapsed)
+    }
+
+async def bench_category_menu(rounds=200):
+    """get_products_by_category with the catalog cache cold (invalidated) and warm"""
+    from database.cache import catalog_cache
+    from database.operations import DBOperations
+
+    categories = [f"Category {n:02d}" for n in range(CATEGORIES)]
+    cold, warm = [], []
+    for n in range(rounds):
+        category = categories[n % CATEGORIES]
+        catalog_cache.invalidate()
+        await _timed(cold, DBOperations.get_products_by_category(category))
+        await _timed(warm, DBOperations.get_products_by_category(category))
+
+    pages = []
+    for n in range(rounds):
+        catalog_cache.invalidate()
+        await _timed(pages, DBOperations.get_product_page(categories[n % CATEGORIES]))
+
+    return {
+        'cold': summarize(cold),
+        'warm': summarize(warm),
+        'first_page_cold': summarize(pages)
+    }
+
+async def bench_stock_contention(products, updates=1_000, concurrency=(1, 4, 16)):
+    """update_stock on one hot product versus spread over the catalog"""
+    from database.operations import DBOperations
+
+    results = {}
+    for workers in concurrency:
+        for label, pick in (('hot_row', lambda n: 1), ('spread', lambda n: n % products + 1)):
+            samples = []
+            started = time.perf_counter()
+            for first in range(0, updates, workers):
+                await asyncio.gather(*(
+                    _timed(samples, DBOperations.update_stock(pick(n), 1))
+                    for n in range(first, min(first + workers, updates))
+                ))
+            results[f"{label}_{workers}"] = summarize(samples, time.perf_counter() - started)
+    return results
+
+def bench_backup():
+    """Full backup throughput, written to a temporary directory"""
+    from database.backup import BackupManager
+
+    results = {}
+    with tempfile.TemporaryDirectory() as backup_dir:
+        BackupManager.BACKUP_DIR = backup_dir
+        BackupManager.MANIFEST = os.path.join(backup_dir, 'manifest.json')
+        for compression in ('gzip', 'none'):
+            # MySQL dumps count rows, SQLite copies count pages
+            copied = {}
+            started = time.perf_counter()
+            path = BackupManager.create_backup(
+                compression=compression,
+                progress=lambda table, count, elapsed, done, unit: done and copied.update(
+                    {unit: copied.get(unit, 0) + count}
+                )
+            )
+            elapsed = time.perf_counter() - started
+            if not path:
+                results[compression] = {'error': "backup failed"}
+                continue
+            size = os.path.getsize(path)
+            results[compression] = {'seconds': round(elapsed, 2)}
+            for unit, count in copied.items():
+                results[compression][unit] = count
+                results[compression][f'{unit}_per_second'] = round(count / elapsed, 1)
+            results[compression].update({
+                'megabytes': round(size / 1_048_576, 2),
+                'megabytes_per_second': round(size / 1_048_576 / elapsed, 2)
+            })
+            os.remove(path)
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(scale, rng):
+    from database.operations import DBOperations
+    from database.connection import db
+
+    sizes = SCALES[scale]
+    results = {'seed': await db.run(seed, sizes['products'], sizes['bills'], rng)}
+    await DBOperations.load_search_index()
+    for name, benchmark in (
+        ('create_bill', bench_create_bill(sizes['products'], rng)),
+        ('get_products_by_category', bench_category_menu()),
+        ('update_stock', bench_stock_contention(sizes['products']))
+    ):
+        print(f"Running {name}...")
+        results[name] = await benchmark
+    print("Running backup...")
+    results['backup'] = await db.run(bench_backup)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database operations on synthetic data")
+    parser.add_argument('--scale', choices=SCALES, default='1k', help="Size of the synthetic dataset")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for the synthetic data")
+    parser.add_argument('--keep', action='store_true', help="Keep the benchmark schema afterwards")
+    parser.add_argument('--out', default=RESULTS_DIR, help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    schema = f"billo_bench_{os.getpid()}"
+    server_version = create_schema(schema)
+    print(f"Benchmarking scale {args.scale} in {Config.DB_BACKEND} database {schema}")
+    try:
+        from database.connection import db
+        from database.models import DBInitializer
+        DBInitializer.initialize_database()
+        try:
+            results = asyncio.run(run(args.scale, random.Random(args.seed)))
+        finally:
+            db.close()
+    finally:
+        if not args.keep:
+            drop_schema(schema)
+
+    report = {
+        'scale': args.scale,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'backend': Config.DB_BACKEND,
+        'server': server_version,
+        'pool_size': Config.DB_POOL_SIZE,
+        'results': results
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"bench_{args.scale}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, values in results.items():
+        if name == 'seed':
+            continue
+        for case, stats in values.items():
+            if 'p50_ms' in stats:
+                rate = f", {stats['per_second']:,.0f}/s" if 'per_second' in stats else ''
+                print(f"  {name:26} {case:18} p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms{rate}")
+            else:
+                print(f"  {name:26} {case:18} {stats}")
+    print(f"Results: {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Streaming sales exports (Excel or CSV)
+
+Usage:
+    python -m utils.exports 2026-07-01 2026-09-30 [--format csv] [--out data/exports]
+
+Line items are read from an unbuffered (server-side streamed) cursor in
+chunks and appended to an openpyxl write-only workbook or a CSV file, so
+memory use stays flat however many rows the range covers. CSV files above
+EXPORT_COMPRESS_BYTES are gzipped; .xlsx files are zip archives already.
+"""
+import argparse
+import asyncio
+import csv
+import functools
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from config.settings import Config
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'exports')
+FORMATS = ('xlsx', 'csv')
+
+HEADER = [
+    'Bill No', 'Date', 'Customer', 'Phone', 'Product Code', 'Product',
+    'Category', 'Quantity', 'Unit Price', 'Line Total'
+]
+QUERY = (
+    "SELECT b.bill_number, b.created_at, b.customer_name, b.customer_phone, "
+    "p.code, p.name, p.category, bi.quantity, bi.unit_price, bi.quantity * bi.unit_price "
+    "FROM bill_items bi "
+    "JOIN bills b ON b.id = bi.bill_id "
+    "JOIN products p ON p.id = bi.product_id "
+    "WHERE b.created_at >= %s AND b.created_at < %s "
+    "ORDER BY b.id, bi.id"
+)
+
+def _stream_rows(start, end, chunk_rows):
+    """Yield chunks of line items for days in [start, end) from an unbuffered cursor"""
+    with db.connection() as conn:
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(QUERY, (
+                datetime.combine(start, dt_time.min),
+                datetime.combine(end, dt_time.min)
+            ))
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            # Drain anything unread so the connection goes back to the pool clean
+            if cursor.with_rows:
+                while cursor.fetchmany(chunk_rows):
+                    pass
+            cursor.close()
+
+def _write_xlsx(path, chunks, title):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    sheet.append(HEADER)
+    rows_written = 0
+    for rows in chunks:
+        for row in rows:
+            sheet.append(row)
+        rows_written += len(rows)
+    workbook.save(path)
+    return rows_written
+
+def _write_csv(path, chunks):
+    rows_written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for rows in chunks:
+            writer.writerows(rows)
+            rows_written += len(rows)
+    return rows_written
+
+def _compress(path):
+    """Gzip `path` in place (streamed) and return the new path"""
+    compressed = f"{path}.gz"
+    with open(path, 'rb') as src, gzip.open(compressed, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(path)
+    return compressed
+
+def export_sales(start, end, fmt='xlsx', out_dir=EXPORT_DIR, chunk_rows=None, unique=False):
+    """
+    Write every line item sold on days in [start, end) to a file in `out_dir`
+
+    The file is named after the period (sales_20260701_20260930.xlsx). With
+    `unique` it gets a random suffix instead, so concurrent exports of the same
+    period never share a file; the period name is still returned for display.
+
+    Returns (path, rows, filename), or None if the export failed. Blocking;
+    use export_sales_async from the bot.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    chunk_rows = chunk_rows or Config.EXPORT_CHUNK_ROWS
+
+    os.makedirs(out_dir, exist_ok=True)
+    last_day = end - timedelta(days=1)
+    name = f"sales_{start:%Y%m%d}" if start == last_day else f"sales_{start:%Y%m%d}_{last_day:%Y%m%d}"
+    if unique:
+        fd, path = tempfile.mkstemp(prefix=f"{name}_", suffix=f".{fmt}", dir=out_dir)
+        os.close(fd)
+    else:
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+    filename = f"{name}.{fmt}"
+
+    started = time.monotonic()
+    chunks = _stream_rows(start, end, chunk_rows)
+    try:
+        if fmt == 'xlsx':
+            rows = _write_xlsx(path, chunks, name)
+        else:
+            rows = _write_csv(path, chunks)
+            if os.path.getsize(path) > Config.EXPORT_COMPRESS_BYTES:
+                path = _compress(path)
+                filename += '.gz'
+    except Exception as e:
+        logger.error("Export failed: %s", e)
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    finally:
+        chunks.close()
+
+    elapsed = time.monotonic() - started
+    logger.info("Exported %d rows in %.1fs (%.0f rows/s) -> %s", rows, elapsed, rows / max(elapsed, 1e-6), path)
+    return path, rows, filename
+
+async def export_sales_async(start, end, fmt='xlsx'):
+    """
+    Run export_sales on a worker thread so the event loop keeps serving updates
+
+    Each call writes its own file; the caller deletes it when done.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(export_sales, start, end, fmt, unique=True)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Export sold line items for a date range")
+    parser.add_argument('start', help="First day (YYYY-MM-DD)")
+    parser.add_argument('end', help="Last day, inclusive (YYYY-MM-DD)")
+    parser.add_argument('--format', choices=FORMATS, default='xlsx', help="Output format")
+    parser.add_argument('--out', default=EXPORT_DIR, help="Output directory")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.end, '%Y-%m-%d').date() + timedelta(days=1)
+    export_sales(start, end, args.format, args.out)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
-import datetime
 from config.settings import Config
 
-def generate_bill_number():
-    """Generate a unique bill number"""
-    today = datetime.datetime.now().strftime("%Y%m%d")
-    sequence = DBOperations.get_next_sequence('bill_sequence')
+async def generate_bill_number():
+    """Generate a unique bill number (marked with L when the database is unreachable)"""
+    from database.connection import Error, is_unreachable
+    from database.journal import checkout_journal
+    from database.sequences import bill_sequence
+    try:
+        today, sequence = await bill_sequence.next_value()
+    except Error as e:
+        if not is_unreachable(e):
+            raise
+        today, sequence = checkout_journal.next_offline_number()
+        return f"{Config.BILL_PREFIX}-{today}-L{sequence:04d}"
     return f"{Config.BILL_PREFIX}-{today}-{sequence:04d}"
 
 def format_currency(amount):
@@ -0,0 +1,211 @@
+"""
+Bulk product import from an Excel catalog
+
+Usage:
+    python -m utils.import_products data/products.xlsx [--batch-size 1000] [--set-stock]
+
+The workbook is streamed row by row (openpyxl read-only mode) and written in
+batched upserts (ON DUPLICATE KEY UPDATE / ON CONFLICT), one transaction per
+batch, so existing products (matched on code) are updated in place. Rejected
+rows are listed in a CSV report next to the workbook. A running bot picks the
+changes up within CATALOG_REFRESH_INTERVAL seconds.
+
+New products start with the sheet's stock, but existing products keep their
+live stock: the sheet may predate sales made since it was exported. Pass
+--set-stock (e.g. after a stocktake) to overwrite it with the sheet's values.
+A code repeated within a batch is written once, from its last row.
+"""
+import argparse
+import csv
+import logging
+import time
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+from database.connection import db
+from database.models import DBInitializer
+from database.operations import DBOperations
+from .validators import validate_price, validate_stock
+
+logger = logging.getLogger(__name__)
+
+# Workbook header -> products column
+COLUMNS = {
+    'Product Code with Pack Size': 'code',
+    'Item Category': 'category',
+    'Item full name': 'name',
+    'Pack size': 'pack_size',
+    'MRP (0 if not available currently)': 'mrp',
+    'sell price': 'price',
+    'cost': 'cost',
+    'available stock': 'stock'
+}
+REQUIRED = ('code', 'category', 'name', 'price', 'stock')
+
+UPSERT = {
+    'mysql': (
+        "INSERT INTO products (code, name, category, description, price, cost, stock) VALUES {rows} "
+        "ON DUPLICATE KEY UPDATE name = VALUES(name), category = VALUES(category), "
+        "description = VALUES(description), price = VALUES(price), cost = VALUES(cost){stock}"
+    ),
+    'sqlite': (
+        "INSERT INTO products (code, name, category, description, price, cost, stock) VALUES {rows} "
+        "ON CONFLICT (code) DO UPDATE SET name = excluded.name, category = excluded.category, "
+        "description = excluded.description, price = excluded.price, cost = excluded.cost{stock}"
+    )
+}
+# Appended to UPSERT with --set-stock, replacing the live stock of existing products
+SET_STOCK = {
+    'mysql': ", stock = VALUES(stock)",
+    'sqlite': ", stock = excluded.stock"
+}
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def parse_row(record):
+    """Turn a workbook record into a products tuple, or raise ValueError with the reason"""
+    values = {key: _text(record.get(key)) for key in COLUMNS.values()}
+
+    missing = [key for key in REQUIRED if not values[key]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if len(values['code']) > 20:
+        raise ValueError("code longer than 20 characters")
+    if len(values['category']) > 50:
+        raise ValueError("category longer than 50 characters")
+    if not validate_price(values['price']):
+        raise ValueError(f"invalid price {values['price']!r}")
+    if values['cost'] and not validate_price(values['cost']):
+        raise ValueError(f"invalid cost {values['cost']!r}")
+    if not validate_stock(values['stock']):
+        raise ValueError(f"invalid stock {values['stock']!r}")
+
+    name = values['name']
+    if values['pack_size']:
+        name = f"{name} ({values['pack_size']})"
+    if len(name) > 100:
+        raise ValueError("name longer than 100 characters")
+
+    mrp = values['mrp']
+    description = f"MRP {mrp}" if mrp and validate_price(mrp) and float(mrp) > 0 else None
+
+    return (
+        values['code'],
+        name,
+        values['category'],
+        description,
+        float(values['price']),
+        float(values['cost'] or 0),
+        int(values['stock'])
+    )
+
+def _write_batch(batch, set_stock):
+    rows = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+    query = UPSERT[db.dialect].format(rows=rows, stock=SET_STOCK[db.dialect] if set_stock else '')
+    with db.transaction() as cursor:
+        cursor.execute(query, [value for row in batch for value in row])
+        # Running bots drop their cached catalog once this batch is committed
+        DBOperations.bump_catalog_version(cursor)
+
+def import_products(path, batch_size=1000, set_stock=False):
+    """
+    Stream products from `path` into the database
+
+    Existing products keep their stock unless `set_stock` is given. Returns
+    (imported, rejects) where rejects is a list of (row_number, reason, raw_values)
+    tuples; imported counts distinct codes per batch.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    sheet = workbook.active
+    rows = sheet.iter_rows(values_only=True)
+
+    header = next(rows, None) or ()
+    fields = [COLUMNS.get(_text(title)) for title in header]
+    missing = [key for key in REQUIRED if key not in fields]
+    if missing:
+        workbook.close()
+        raise ValueError(f"Workbook is missing columns for: {', '.join(missing)}")
+
+    if set_stock:
+        logger.warning("Replacing the stock of existing products with the sheet's values")
+
+    started = time.monotonic()
+    imported = 0
+    rejects = []
+    # code -> (row_number, products tuple); one upsert cannot touch the same code twice
+    batch = {}
+    try:
+        for row_number, raw in enumerate(rows, start=2):
+            if not any(value is not None for value in raw):
+                continue
+            record = {field: value for field, value in zip(fields, raw) if field}
+            try:
+                product = parse_row(record)
+            except ValueError as e:
+                rejects.append((row_number, str(e), raw))
+                continue
+
+            code = product[0]
+            if code in batch:
+                logger.warning("Row %d repeats code %r from row %d; using row %d",
+                               row_number, code, batch[code][0], row_number)
+                del batch[code]
+            batch[code] = (row_number, product)
+
+            if len(batch) >= batch_size:
+                _write_batch([product for _, product in batch.values()], set_stock)
+                imported += len(batch)
+                batch = {}
+                elapsed = time.monotonic() - started
+                print(f"  {imported} rows ({imported / max(elapsed, 1e-6):,.0f} rows/s)", end="\r")
+
+        if batch:
+            _write_batch([product for _, product in batch.values()], set_stock)
+            imported += len(batch)
+    finally:
+        workbook.close()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Imported {imported} products in {elapsed:.2f}s "
+        f"({imported / max(elapsed, 1e-6):,.0f} rows/s), {len(rejects)} rejected"
+    )
+    return imported, rejects
+
+def write_reject_report(path, rejects):
+    """Write rejected rows to a CSV report and return its path"""
+    report = Path(path).with_suffix('.rejects.csv')
+    with open(report, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['row', 'reason', 'values'])
+        for row_number, reason, raw in rejects:
+            writer.writerow([row_number, reason, ' | '.join('' if v is None else str(v) for v in raw)])
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Import products from an Excel workbook")
+    parser.add_argument('workbook', help="Path to the .xlsx catalog")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Rows per upsert statement")
+    parser.add_argument(
+        '--set-stock', action='store_true',
+        help="Overwrite the stock of existing products with the sheet's values (e.g. after a stocktake)"
+    )
+    args = parser.parse_args()
+
+    DBInitializer.initialize_database()
+    imported, rejects = import_products(args.workbook, args.batch_size, args.set_stock)
+    if rejects:
+        for row_number, reason, _ in rejects[:20]:
+            print(f"  row {row_number}: {reason}")
+        if len(rejects) > 20:
+            print(f"  ... and {len(rejects) - 20} more")
+        print(f"Reject report: {write_reject_report(args.workbook, rejects)}")
+
+if __name__ == '__main__':
+    main()
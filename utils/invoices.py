@@ -0,0 +1,182 @@
+"""
+PDF invoices rendered in a process pool
+
+Usage (render every invoice of a day in parallel):
+    python -m utils.invoices 2026-10-18 [--out data/invoices]
+
+Rendering is CPU-bound, so it runs in worker processes instead of the bot's
+event loop. Each worker registers fonts and builds its paragraph/table styles
+once, in the pool initializer, and reuses them for every invoice it renders.
+"""
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from config.settings import Config
+
+INVOICE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'invoices')
+
+# Per-worker layout cache, filled by _init_worker
+_layout = None
+
+def _init_worker():
+    """Register fonts and build styles once per worker process"""
+    global _layout
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    font, bold = 'Helvetica', 'Helvetica-Bold'
+    currency = Config.CURRENCY or ''
+    if Config.INVOICE_FONT and os.path.exists(Config.INVOICE_FONT):
+        pdfmetrics.registerFont(TTFont('InvoiceFont', Config.INVOICE_FONT))
+        font = bold = 'InvoiceFont'
+    else:
+        # The built-in PDF fonts only cover Latin-1 (no ₹ glyph)
+        try:
+            currency.encode('latin-1')
+        except UnicodeEncodeError:
+            currency = ''
+
+    styles = getSampleStyleSheet()
+    _layout = {
+        'currency': currency,
+        'title': ParagraphStyle('InvoiceTitle', parent=styles['Title'], fontName=bold),
+        'text': ParagraphStyle('InvoiceText', parent=styles['Normal'], fontName=font),
+        'table': [
+            ('FONTNAME', (0, 0), (-1, -1), font),
+            ('FONTNAME', (0, 0), (-1, 0), bold),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+            ('LINEABOVE', (0, -3), (-1, -3), 0.5, colors.black),
+            ('FONTNAME', (0, -1), (-1, -1), bold)
+        ]
+    }
+
+def render_invoice(bill):
+    """Render a bill (as returned by DBOperations.get_bill) into PDF bytes"""
+    if _layout is None:
+        _init_worker()
+
+    from xml.sax.saxutils import escape
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    money = f"{_layout['currency']}{{:,.2f}}".format
+    text = _layout['text']
+
+    story = [
+        Paragraph(escape(Config.COMPANY_NAME or ''), _layout['title']),
+        Paragraph(f"Invoice: {escape(bill['bill_number'])}", text),
+        Paragraph(f"Date: {bill['created_at']:%Y-%m-%d %H:%M}", text),
+        Paragraph(f"Customer: {escape(bill['customer_name'])}", text)
+    ]
+    if bill['customer_phone']:
+        story.append(Paragraph(f"Phone: {escape(bill['customer_phone'])}", text))
+    story.append(Spacer(1, 6 * mm))
+
+    subtotal = bill['total_amount'] + bill['discount']
+    rows = [['Item', 'Qty', 'Rate', 'Amount']]
+    rows.extend(
+        [
+            Paragraph(escape(item['name']), text),
+            item['quantity'],
+            money(item['unit_price']),
+            money(item['unit_price'] * item['quantity'])
+        ]
+        for item in bill['items']
+    )
+    rows.append(['Subtotal', '', '', money(subtotal)])
+    rows.append(['Discount', '', '', f"-{money(bill['discount'])}"])
+    rows.append(['Total', '', '', money(bill['total_amount'])])
+
+    table = Table(rows, colWidths=[95 * mm, 20 * mm, 30 * mm, 35 * mm], repeatRows=1)
+    table.setStyle(TableStyle(_layout['table']))
+    story.append(table)
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        title=bill['bill_number'],
+        leftMargin=15 * mm,
+        rightMargin=15 * mm
+    ).build(story)
+    return buffer.getvalue()
+
+_pool = None
+
+def get_pool():
+    """Shared worker pool, started on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=Config.INVOICE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+async def generate_invoice(bill):
+    """Render one bill in the worker pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), render_invoice, bill)
+
+async def export_day(day, out_dir=INVOICE_DIR):
+    """
+    Render every invoice of `day` (a date) into `out_dir`, spread across all workers
+
+    Returns the list of written file paths.
+    """
+    from database.operations import DBOperations
+
+    bills = await DBOperations.get_bills_by_date(day)
+    if not bills:
+        return []
+
+    os.makedirs(out_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    documents = await asyncio.gather(*(
+        loop.run_in_executor(pool, render_invoice, bill) for bill in bills
+    ))
+
+    paths = []
+    for bill, pdf in zip(bills, documents):
+        path = os.path.join(out_dir, f"{bill['bill_number']}.pdf")
+        with open(path, 'wb') as f:
+            f.write(pdf)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a day's invoices as PDF files")
+    parser.add_argument('date', help="Day to export (YYYY-MM-DD)")
+    parser.add_argument('--out', default=INVOICE_DIR, help="Output directory")
+    args = parser.parse_args()
+
+    day = datetime.strptime(args.date, '%Y-%m-%d').date()
+    started = time.monotonic()
+    try:
+        paths = asyncio.run(export_day(day, args.out))
+    finally:
+        shutdown_pool()
+    elapsed = time.monotonic() - started
+    print(f"Rendered {len(paths)} invoices in {elapsed:.1f}s -> {os.path.abspath(args.out)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+Conversation replay load test, without Telegram
+
+Usage:
+    python -m utils.loadtest [--cashiers 20] [--checkouts 10] [--scale 1k]
+                             [--script plan.json] [--api-latency 0.05] [--unthrottled]
+                             [--out results.json]
+
+Builds RetailBot's real Application (ChatOrderedApplication, persistence,
+ConversationHandlers) on top of an in-process Bot API transport and drives
+it with N simulated cashiers. Each cashier runs checkouts step by step:
+
+    /start -> Generate Bill -> name -> phone -> category -> product -> quantity
+    (-> Add Item -> category -> product -> quantity ...) -> Finish Bill -> discount
+
+Every step is one Update put on the application's update queue, so it goes
+through the same concurrency limit and per-chat ordering as production. Its
+latency is the time until the application has finished handling it. The
+report gives p50/p95/p99 per step and completed checkouts per second.
+Replies go through the bot's outbox, so each cashier is held to the per-chat
+send rate (OUTBOX_CHAT_RATE) like a real chat; --unthrottled lifts the limits
+to measure the bot alone.
+
+By default the run seeds a disposable database for DB_BACKEND (see
+utils.benchmark) and drops it afterwards; --use-configured-db runs against
+the configured database instead and leaves real bills behind.
+
+A script (--script) is a JSON list of checkouts, replayed in order by each
+cashier in turn; anything left out is picked at random from the keyboards:
+    [{"customer": "Asha", "phone": "9876543210",
+      "items": [{"category": "Category 01", "product_id": 12, "quantity": 2}]}]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+from config.settings import Config
+from utils.benchmark import SCALES, create_schema, drop_schema, seed, summarize
+
+STEPS = ('start', 'generate_bill', 'name', 'phone', 'category', 'product', 'quantity',
+         'add_item', 'finish', 'confirm')
+# Replies that mean the bill was saved (or journaled while the database is down)
+CHECKOUT_DONE = ("Need a printable copy?", "recorded locally")
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': "Billo", 'username': "billo_loadtest_bot"}
+
+class LoadTestError(Exception):
+    pass
+
+class FakeTelegram(BaseRequest):
+    """
+    Bot API transport that answers in-process
+
+    Sent and edited messages are kept per chat so cashiers can read the
+    replies and inline keyboards of the step they just took. `latency`
+    seconds are slept per call to stand in for the round trip to Telegram.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self._message_ids = itertools.count(1)
+        # chat id -> replies since the cashier last read them
+        self._replies = defaultdict(list)
+        # chat id -> last message carrying an inline keyboard
+        self._inline = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint.startswith('send'):
+            result = self._message(params['chat_id'], next(self._message_ids), params)
+        elif endpoint.startswith('edit') and 'chat_id' in params:
+            result = self._message(params['chat_id'], params['message_id'], params)
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    def _message(self, chat_id, message_id, params):
+        chat_id = int(chat_id)
+        message = {
+            'message_id': int(message_id),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text') or params.get('caption') or ''
+        }
+        markup = params.get('reply_markup')
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        if markup and 'inline_keyboard' in markup:
+            message['reply_markup'] = markup
+            self._inline[chat_id] = message
+        elif self._inline.get(chat_id, {}).get('message_id') == message['message_id']:
+            # Edited without a keyboard: the old buttons are gone
+            del self._inline[chat_id]
+        self._replies[chat_id].append(message['text'])
+        return message
+
+    def take_replies(self, chat_id):
+        replies, self._replies[chat_id] = self._replies[chat_id], []
+        return replies
+
+    def inline_message(self, chat_id):
+        return self._inline.get(chat_id)
+
+class Cashier:
+    """One simulated user sending updates from their own private chat"""
+
+    def __init__(self, harness, user_id, rng):
+        self.harness = harness
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f"Cashier{user_id}"}
+        self.chat = {'id': user_id, 'type': 'private'}
+        self.rng = rng
+
+    async def send_text(self, step, text):
+        message = {
+            'message_id': next(self.harness.update_ids),
+            'date': int(time.time()),
+            'chat': self.chat,
+            'from': self.user,
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return await self.harness.step(step, self.chat['id'], {'message': message})
+
+    async def press(self, step, data):
+        keyboard = self.harness.transport.inline_message(self.chat['id'])
+        if keyboard is None:
+            raise LoadTestError(f"{step}: no inline keyboard to press {data!r} on")
+        return await self.harness.step(step, self.chat['id'], {
+            'callback_query': {
+                'id': str(next(self.harness.update_ids)),
+                'from': self.user,
+                'chat_instance': str(self.chat['id']),
+                'message': keyboard,
+                'data': data
+            }
+        })
+
+    def pick(self, prefix):
+        """callback_data of a random button starting with `prefix` on the current inline keyboard"""
+        keyboard = self.harness.transport.inline_message(self.chat['id'])
+        choices = [
+            button['callback_data']
+            for row in (keyboard or {}).get('reply_markup', {}).get('inline_keyboard', [])
+            for button in row
+            if button.get('callback_data', '').startswith(prefix)
+        ]
+        if not choices:
+            raise LoadTestError(f"No {prefix}* button on the current keyboard")
+        return self.rng.choice(choices)
+
+    async def checkout(self, plan):
+        """Run one bill from /start to the discount; returns True if it was saved"""
+        plan = plan or {}
+        items = plan.get('items') or [{} for _ in range(self.rng.randint(1, 3))]
+        phone = plan.get('phone', f"9{self.rng.randrange(10 ** 9):09d}" if self.rng.random() < 0.7 else None)
+
+        await self.send_text('start', "/start")
+        await self.send_text('generate_bill', "💰 Generate Bill")
+        await self.send_text('name', plan.get('customer', f"Customer {self.rng.randrange(10_000)}"))
+        await self.send_text('phone', phone or "Skip")
+        for index, item in enumerate(items):
+            if index:
+                await self.send_text('add_item', "➕ Add Item")
+            category = item.get('category')
+            await self.press('category', f"category_{category}" if category else self.pick('category_'))
+            product_id = item.get('product_id')
+            await self.press('product', f"product_{product_id}" if product_id else self.pick('product_'))
+            await self.send_text('quantity', str(item.get('quantity', self.rng.randint(1, 3))))
+        await self.send_text('finish', "✅ Finish Bill")
+        replies = await self.send_text('confirm', str(plan.get('discount', 0)))
+        return any(done in reply for reply in replies for done in CHECKOUT_DONE)
+
+class LoadTest:
+    def __init__(self, bot, transport):
+        self.bot = bot
+        self.application = bot.application
+        self.transport = transport
+        self.update_ids = itertools.count(1)
+        self.latencies = defaultdict(list)
+        self._done = {}
+        # Resolve a step's future once the application has handled its update
+        process_update = self.application.process_update
+
+        async def tracked(update):
+            try:
+                await process_update(update)
+            finally:
+                future = self._done.pop(getattr(update, 'update_id', None), None)
+                if future is not None and not future.done():
+                    future.set_result(None)
+
+        self.application.process_update = tracked
+
+    async def step(self, name, chat_id, payload):
+        """Queue one update and wait until it has been handled; returns the bot's replies"""
+        update_id = next(self.update_ids)
+        update = Update.de_json(dict(payload, update_id=update_id), self.application.bot)
+        future = self._done[update_id] = asyncio.get_running_loop().create_future()
+        self.transport.take_replies(chat_id)
+        started = time.perf_counter()
+        await self.application.update_queue.put(update)
+        await future
+        self.latencies[name].append(time.perf_counter() - started)
+        # Replies queued with rate_limit_args={'queue': True} may still be in the outbox
+        await self.bot.outbox.flush(chat_id)
+        return self.transport.take_replies(chat_id)
+
+    async def run(self, cashiers, checkouts, plans, rng):
+        completed = failed = 0
+        plan_iter = itertools.cycle(plans) if plans else itertools.repeat(None)
+
+        async def work(cashier):
+            nonlocal completed, failed
+            for _ in range(checkouts):
+                try:
+                    saved = await cashier.checkout(next(plan_iter))
+                except LoadTestError as e:
+                    print(f"Cashier {cashier.user['id']}: {e}")
+                    saved = False
+                    await cashier.send_text('cancel', "/cancel")
+                if saved:
+                    completed += 1
+                else:
+                    failed += 1
+
+        users = [Cashier(self, 100_000 + n, random.Random(rng.random())) for n in range(cashiers)]
+        started = time.perf_counter()
+        await asyncio.gather(*(work(cashier) for cashier in users))
+        elapsed = time.perf_counter() - started
+        return {
+            'cashiers': cashiers,
+            'seconds': round(elapsed, 2),
+            'checkouts': completed,
+            'failed_checkouts': failed,
+            'checkouts_per_second': round(completed / elapsed, 2),
+            'api_calls': dict(self.transport.calls),
+            'steps': {
+                name: summarize(self.latencies[name], elapsed)
+                for name in STEPS + ('cancel',)
+                if self.latencies[name]
+            }
+        }
+
+async def run(args, rng):
+    from bot.main import RetailBot
+
+    transport = FakeTelegram(args.api_latency)
+    bot = RetailBot(request=transport)
+    application = bot.application
+    plans = None
+    if args.script:
+        with open(args.script) as f:
+            plans = json.load(f)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        return await LoadTest(bot, transport).run(args.cashiers, args.checkouts, plans, rng)
+    finally:
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay billing conversations against the bot without Telegram")
+    parser.add_argument('--cashiers', type=int, default=20, help="Simulated users checking out concurrently")
+    parser.add_argument('--checkouts', type=int, default=10, help="Checkouts per cashier")
+    parser.add_argument('--script', help="JSON list of checkouts to replay instead of random ones")
+    parser.add_argument('--api-latency', type=float, default=0, help="Seconds per simulated Bot API call")
+    parser.add_argument('--unthrottled', action='store_true', help="Send replies without the outbox rate limits")
+    parser.add_argument('--scale', choices=SCALES, default='1k', help="Size of the disposable dataset")
+    parser.add_argument('--use-configured-db', action='store_true',
+                        help="Run against the configured database instead of a disposable one (writes real bills)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for data and cashiers")
+    parser.add_argument('--out', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    schema = None
+    if not args.use_configured_db:
+        schema = f"billo_load_{os.getpid()}"
+        create_schema(schema)
+
+    state_dir = tempfile.TemporaryDirectory()
+    Config.BOT_TOKEN = Config.BOT_TOKEN or "123456:LOADTEST"
+    Config.STATE_FILE = os.path.join(state_dir.name, 'state.db')
+    Config.JOURNAL_FILE = os.path.join(state_dir.name, 'journal.jsonl')
+    Config.METRICS_PORT = None
+    if args.unthrottled:
+        Config.OUTBOX_GLOBAL_RATE = Config.OUTBOX_CHAT_RATE = Config.OUTBOX_GROUP_PER_MINUTE = 0
+    try:
+        from database.connection import db
+        from database.models import DBInitializer
+        DBInitializer.initialize_database()
+        try:
+            if schema:
+                sizes = SCALES[args.scale]
+                print(f"Seeding {args.scale} in {Config.DB_BACKEND} database {schema}...")
+                seed(sizes['products'], sizes['bills'], rng)
+            print(f"Running {args.cashiers} cashiers x {args.checkouts} checkouts...")
+            results = asyncio.run(run(args, rng))
+        finally:
+            db.close()
+    finally:
+        state_dir.cleanup()
+        if schema:
+            drop_schema(schema)
+
+    results.update(
+        started_at=datetime.now().isoformat(timespec='seconds'),
+        concurrent_updates=Config.CONCURRENT_UPDATES,
+        pool_size=Config.DB_POOL_SIZE,
+        api_latency=args.api_latency,
+        unthrottled=args.unthrottled
+    )
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print(f"{'step':14} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in results['steps'].items():
+        print(f"{name:14} {stats['count']:7} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+    print(
+        f"{results['checkouts']} checkouts ({results['failed_checkouts']} failed) in "
+        f"{results['seconds']:.1f}s ({results['checkouts_per_second']:,.1f} checkouts/s)"
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+In-process metrics with a Prometheus text endpoint
+
+Counters, gauges and histograms are kept in plain dicts keyed by label
+values, so recording one costs a lock and a few additions. The endpoint
+renders them in the Prometheus text format on METRICS_HOST:METRICS_PORT:
+    curl http://127.0.0.1:9108/metrics
+"""
+import bisect
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config.settings import Config
+
+# Statements slower than Config.SLOW_QUERY_SECONDS are logged here
+slow_query_log = logging.getLogger('billo.slow_queries')
+
+# Seconds; covers cached lookups up to stalled transactions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+class Gauge(_Metric):
+    """Gauge whose value is read from `function` at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def expose(self):
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {value}"
+        ]
+
+class CounterFunction(Gauge):
+    """Counter whose running total is read from `function` at scrape time"""
+    kind = 'counter'
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(counts), total)) for labels, (counts, total) in self._values.items()]
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    def counter_function(self, name, documentation, function):
+        return self.register(CounterFunction(name, documentation, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def expose(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+db_query_seconds = registry.histogram(
+    'billo_db_query_seconds', "Time spent executing a statement", ('statement',)
+)
+db_query_rows = registry.counter(
+    'billo_db_query_rows_total', "Rows returned or affected by a statement", ('statement',)
+)
+db_query_errors = registry.counter(
+    'billo_db_query_errors_total', "Statements that raised a database error", ('statement',)
+)
+db_call_seconds = registry.histogram(
+    'billo_db_call_seconds', "Time a database function spent on a worker thread", ('function',)
+)
+db_call_queue_seconds = registry.histogram(
+    'billo_db_call_queue_seconds', "Time a database function waited for a worker thread", ('function',)
+)
+handler_seconds = registry.histogram(
+    'billo_handler_seconds', "Time spent in a Telegram handler callback",
+    ('conversation', 'state', 'handler')
+)
+handler_errors = registry.counter(
+    'billo_handler_errors_total', "Handler callbacks that raised", ('conversation', 'state', 'handler')
+)
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(query):
+    """
+    Short, low-cardinality label for a SQL statement
+
+    Whitespace is collapsed and repeated placeholder groups (multi-row VALUES,
+    IN lists, UNION ALL deltas) are folded so batch size does not create new series.
+    """
+    text = re.sub(r'\s+', ' ', query).strip()
+    text = re.sub(r'%s(?:\s*,\s*%s)+', '%s,...', text)
+    text = re.sub(r'(\([^()]*\))(?:\s*,\s*\1)+', r'\1,...', text)
+    text = re.sub(r'(SELECT %s AS id, %s AS qty)(?: UNION ALL \1)+', r'\1 UNION ALL ...', text)
+    return text[:120]
+
+def record_query(query, elapsed, rows):
+    label = statement_label(query)
+    db_query_seconds.observe(elapsed, label)
+    if rows:
+        db_query_rows.inc(rows, label)
+    if elapsed >= Config.SLOW_QUERY_SECONDS:
+        # Parameters carry customer names and phone numbers, so only the statement is logged
+        slow_query_log.warning("Slow query (%.3fs, %d rows): %s", elapsed, rows, label)
+
+def record_call(function, waited, elapsed):
+    db_call_queue_seconds.observe(waited, function)
+    db_call_seconds.observe(elapsed, function)
+    if elapsed >= Config.SLOW_QUERY_SECONDS:
+        slow_query_log.warning("Slow database call (%.3fs): %s", elapsed, function)
+
+def instrument_handlers(application):
+    """Wrap every registered handler callback with a timer, labelled by conversation and state"""
+    from telegram.ext import ConversationHandler
+
+    def wrap(handler, conversation, state):
+        callback = handler.callback
+        labels = (conversation, state, getattr(callback, '__qualname__', repr(callback)))
+
+        @functools.wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                handler_errors.inc(1, *labels)
+                raise
+            finally:
+                handler_seconds.observe(time.perf_counter() - started, *labels)
+
+        handler.callback = timed
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                name = handler.name or ''
+                for entry in handler.entry_points:
+                    wrap(entry, name, 'entry')
+                for state, state_handlers in handler.states.items():
+                    for state_handler in state_handlers:
+                        wrap(state_handler, name, str(state))
+                for fallback in handler.fallbacks:
+                    wrap(fallback, name, 'fallback')
+            else:
+                wrap(handler, '', '')
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(host, port):
+    """Serve /metrics from a daemon thread; returns the server (call shutdown() to stop)"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='billo-metrics', daemon=True).start()
+    return server
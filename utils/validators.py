@@ -21,4 +21,12 @@ def validate_date(date_str):
         datetime.strptime(date_str, '%Y-%m-%d')
         return True
     except ValueError:
-        return False
\ No newline at end of file
+        return False
+
+def validate_stock(input_str):
+    """Validate stock level input (zero allowed)"""
+    try:
+        stock = int(input_str)
+        return stock >= 0
+    except ValueError:
+        return False